@@ -1,19 +1,34 @@
 import os
+import sys
+import json
+import time
+import pickle
+import argparse
 import cv2
 import numpy as np
+from pathlib import Path
 from tqdm import tqdm
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, confusion_matrix
+from sklearn.decomposition import IncrementalPCA
+from sklearn.metrics import classification_report, confusion_matrix, accuracy_score, recall_score
 from xgboost import XGBClassifier
 from tensorflow.keras.applications.vgg16 import VGG16, preprocess_input
 
+# Shared feature cache from ml_model/src
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'ml_model' / 'src'))
+from feature_store import FeatureStore
+
 # Paths
 base_dir = "C:/Users/DELL/Kidney/Dataset"
 IMG_SIZE = 224
+FEATURE_CACHE_DIR = Path(__file__).parent / "feature_cache"
+MAP_SHAPE = (7, 7, 512)  # VGG16 block5_pool output at 224x224
 
 # Labels
 categories = ["normal", "stone"]
 
+REDUCTIONS = ["flatten", "gap", "gmp", "spp", "ipca"]
+
 # Load and preprocess images
 def load_images():
     X, y = [], []
@@ -31,29 +46,167 @@ def load_images():
                 pass  # skip unreadable files
     return np.array(X), np.array(y)
 
-print("📦 Loading and preprocessing images...")
-X, y = load_images()
+# =============================================================================
+# FEATURE REDUCTION
+# =============================================================================
+
+def spatial_pyramid_pool(maps, levels=(1, 2)):
+    """Max-pool each map over a 1x1, 2x2, ... grid and concatenate the bins."""
+    pooled = []
+    h, w = maps.shape[1:3]
+    for level in levels:
+        rows = np.array_split(np.arange(h), level)
+        cols = np.array_split(np.arange(w), level)
+        for r in rows:
+            for c in cols:
+                pooled.append(maps[:, r[0]:r[-1] + 1, c[0]:c[-1] + 1, :].max(axis=(1, 2)))
+    return np.concatenate(pooled, axis=1)
+
+def reduce_chunk(flat, method, spp_levels=(1, 2)):
+    """Reduce a chunk of flattened 7x7x512 maps with a fixed (non-learned) method."""
+    flat = np.asarray(flat, dtype=np.float32)
+    if method == "flatten":
+        return flat
+    maps = flat.reshape(len(flat), *MAP_SHAPE)
+    if method == "gap":
+        return maps.mean(axis=(1, 2))
+    if method == "gmp":
+        return maps.max(axis=(1, 2))
+    if method == "spp":
+        return spatial_pyramid_pool(maps, spp_levels)
+    raise ValueError(f"Unknown reduction: {method}")
+
+def fit_incremental_pca(flat, indices, n_components, chunk_size):
+    """Fit IncrementalPCA in streaming mode, one chunk of cached features at a time."""
+    # PCA can't have more components than samples or features
+    max_components = min(len(indices), flat.shape[1])
+    if n_components > max_components:
+        print(f"⚠️  Reducing PCA components from {n_components} to {max_components}")
+        n_components = max_components
+    ipca = IncrementalPCA(n_components=n_components)
+
+    # Every partial_fit chunk needs at least n_components rows, so a short
+    # tail is folded into the previous chunk instead of being dropped
+    chunk_size = max(chunk_size, n_components)
+    starts = list(range(0, len(indices), chunk_size))
+    if len(starts) > 1 and len(indices) - starts[-1] < n_components:
+        starts.pop()
+    stops = starts[1:] + [len(indices)]
+    for start, stop in tqdm(zip(starts, stops), total=len(starts), desc="Fitting IncrementalPCA"):
+        chunk = indices[start:stop]
+        ipca.partial_fit(np.asarray(flat[np.sort(chunk)], dtype=np.float32))
+    return ipca
+
+def reduce_features(flat, indices, method, ipca=None, chunk_size=512, spp_levels=(1, 2)):
+    """Apply a reduction to the rows `indices` of the cached feature matrix, chunk by chunk."""
+    out = []
+    for start in range(0, len(indices), chunk_size):
+        chunk = np.asarray(flat[indices[start:start + chunk_size]], dtype=np.float32)
+        if method == "ipca":
+            out.append(ipca.transform(chunk))
+        else:
+            out.append(reduce_chunk(chunk, method, spp_levels))
+    return np.concatenate(out).astype(np.float32)
+
+# =============================================================================
+# TRAIN / REPORT
+# =============================================================================
+
+def run_reduction(flat, y, train_idx, test_idx, method, args):
+    """Reduce features, fit a hist XGBoost and measure cost and accuracy."""
+    print(f"\n🔧 Reduction: {method}")
+
+    ipca = None
+    start = time.perf_counter()
+    if method == "ipca":
+        ipca = fit_incremental_pca(flat, train_idx, args.pca_components, args.chunk_size)
+    X_train = reduce_features(flat, train_idx, method, ipca, args.chunk_size, args.spp_levels)
+    reduce_time = time.perf_counter() - start
+
+    clf = XGBClassifier(tree_method='hist', eval_metric='logloss', n_jobs=-1, random_state=42)
+    start = time.perf_counter()
+    clf.fit(X_train, y[train_idx])
+    fit_time = time.perf_counter() - start
+
+    # Inference latency includes the reduction of the raw VGG16 maps
+    start = time.perf_counter()
+    X_test = reduce_features(flat, test_idx, method, ipca, args.chunk_size, args.spp_levels)
+    y_pred = clf.predict(X_test)
+    predict_ms = (time.perf_counter() - start) * 1000 / len(test_idx)
+
+    model_bytes = len(clf.get_booster().save_raw())
+    if ipca is not None:
+        model_bytes += len(pickle.dumps(ipca))
+
+    y_test = y[test_idx]
+    result = {
+        'reduction': method,
+        'feature_dim': int(X_train.shape[1]),
+        'reduce_time_s': reduce_time,
+        'fit_time_s': fit_time,
+        'predict_ms_per_image': predict_ms,
+        'model_size_mb': model_bytes / (1024 * 1024),
+        'accuracy': float(accuracy_score(y_test, y_pred)),
+        'recall': float(recall_score(y_test, y_pred)),
+    }
+
+    print("📊 Classification Report:")
+    print(classification_report(y_test, y_pred, target_names=categories))
+    print("📉 Confusion Matrix:")
+    print(confusion_matrix(y_test, y_pred))
+
+    return result
+
+def print_report(results):
+    print("\n" + "=" * 92)
+    print(f"{'Reduction':<10}{'Dim':>8}{'Reduce (s)':>12}{'Fit (s)':>10}"
+          f"{'Predict (ms/img)':>18}{'Size (MB)':>11}{'Accuracy':>10}{'Recall':>9}")
+    print("-" * 92)
+    for r in results:
+        print(f"{r['reduction']:<10}{r['feature_dim']:>8}{r['reduce_time_s']:>12.2f}{r['fit_time_s']:>10.2f}"
+              f"{r['predict_ms_per_image']:>18.3f}{r['model_size_mb']:>11.2f}{r['accuracy']:>10.4f}{r['recall']:>9.4f}")
+    print("=" * 92)
+
+def main(args):
+    print("📦 Loading and preprocessing images...")
+    X, y = load_images()
 
-# Load VGG16 without top layers
-print("🧠 Extracting features using VGG16...")
-vgg = VGG16(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
-features = vgg.predict(X, verbose=1)
-features = features.reshape(features.shape[0], -1)  # Flatten
+    # Load VGG16 without top layers; raw 7x7x512 maps are cached once
+    # and every reduction is computed from the cache
+    print("🧠 Extracting features using VGG16...")
+    vgg = VGG16(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
+    store = FeatureStore(FEATURE_CACHE_DIR, dtype='float16')
+    features = store.get_or_extract(
+        vgg, X,
+        lambda batch: vgg.predict(batch, verbose=1).reshape(len(batch), -1),  # Flatten
+        preprocessing_fingerprint=f"cv2-bgr|size={IMG_SIZE}|vgg16.preprocess_input",
+        as_float32=False  # stream float16 rows from disk
+    )
+    del X
 
-# Train/Test Split
-X_train, X_test, y_train, y_test = train_test_split(features, y, test_size=0.2, random_state=42, stratify=y)
+    # Train/Test Split (on indices, so the cached matrix is never copied whole)
+    train_idx, test_idx = train_test_split(
+        np.arange(len(y)), test_size=0.2, random_state=42, stratify=y
+    )
 
-# Train XGBoost
-print("🚀 Training XGBoost...")
-clf = XGBClassifier(use_label_encoder=False, eval_metric='logloss')
-clf.fit(X_train, y_train)
+    methods = REDUCTIONS if args.reduction == "all" else [args.reduction]
+    results = [run_reduction(features, y, train_idx, test_idx, m, args) for m in methods]
 
-# Predict
-y_pred = clf.predict(X_test)
+    print_report(results)
 
-# Evaluation
-print("\n📊 Classification Report:")
-print(classification_report(y_test, y_pred, target_names=categories))
+    report_path = Path(__file__).parent / "reduction_report.json"
+    with open(report_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Report saved to: {report_path}")
 
-print("📉 Confusion Matrix:")
-print(confusion_matrix(y_test, y_pred))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VGG16 features + XGBoost with configurable feature reduction")
+    parser.add_argument("--reduction", default="gap", choices=REDUCTIONS + ["all"],
+                        help="Feature reduction ('all' compares every method)")
+    parser.add_argument("--pca_components", type=int, default=256,
+                        help="Components for incremental PCA")
+    parser.add_argument("--spp_levels", type=int, nargs="+", default=[1, 2],
+                        help="Pyramid levels for spatial pyramid pooling")
+    parser.add_argument("--chunk_size", type=int, default=512,
+                        help="Rows processed per chunk when streaming cached features")
+    main(parser.parse_args())
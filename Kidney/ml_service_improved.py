@@ -10,6 +10,12 @@ import cv2
 import tensorflow as tf
 from tensorflow.keras.models import load_model
 import os
+import sys
+import time
+import uuid
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from werkzeug.utils import secure_filename
 import logging
 from pathlib import Path
@@ -31,6 +37,14 @@ UPLOAD_FOLDER = 'uploads/ml_temp'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 IMG_SIZE = 224
 
+# Explanations (heatmaps) run on their own worker so /predict is never queued behind them
+EXPLAIN_WORKERS = int(os.environ.get('ML_EXPLAIN_WORKERS', 1))
+EXPLAIN_JOB_TTL = 600  # seconds a finished async explanation is kept for polling
+EXPLAIN_JOB_DEADLINE = 1800  # seconds before a still-pending job is given up on
+EXPLAIN_MAX_PENDING = int(os.environ.get('ML_EXPLAIN_MAX_PENDING', 16))  # async jobs queued at once
+EXPLAIN_SYNC_TIMEOUT = 60  # seconds a synchronous /explain waits for the worker
+PNG_COMPRESSION = 9
+
 # Create upload folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
@@ -136,6 +150,7 @@ logger.info("=" * 60)
 # Try loading hybrid model first
 model = None
 model_type = None
+model_version = None
 use_enhanced_preprocessing = False
 
 logger.info(f"Attempting to load hybrid model from: {MODEL_PATH}")
@@ -143,6 +158,7 @@ if MODEL_PATH.exists():
     try:
         model = load_model(str(MODEL_PATH), compile=False)
         model_type = "Hybrid VGG16+XGBoost"
+        model_version = f"{MODEL_PATH.name}:{MODEL_PATH.stat().st_mtime_ns}"
         use_enhanced_preprocessing = True
         logger.info("✅ Hybrid model loaded successfully!")
         logger.info(f"   Model input shape: {model.input_shape}")
@@ -159,6 +175,7 @@ if model is None:
         try:
             model = load_model(str(FALLBACK_MODEL_PATH), compile=False)
             model_type = "CNN (Original)"
+            model_version = f"{FALLBACK_MODEL_PATH.name}:{FALLBACK_MODEL_PATH.stat().st_mtime_ns}"
             use_enhanced_preprocessing = False
             logger.info("✅ Fallback model loaded successfully!")
             logger.info(f"   Model input shape: {model.input_shape}")
@@ -178,6 +195,47 @@ else:
 
 logger.info("=" * 60)
 
+# ============================================================================
+# EXPLAINABILITY (Grad-CAM / CAM)
+# ============================================================================
+
+# Reuse the training package's explainers
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'ml_model' / 'src'))
+try:
+    from gradcam import create_explainer
+    explain_available = True
+except ImportError as e:
+    logger.warning(f"Explanations disabled: {e}")
+    explain_available = False
+
+# One explainer per loaded model version (building its gradient model is expensive)
+_explainers = {}
+_explainer_lock = threading.Lock()
+
+# Async explanation jobs: job_id -> {'status', 'created', 'finished', 'result' | 'error'}
+_explain_executor = ThreadPoolExecutor(max_workers=EXPLAIN_WORKERS, thread_name_prefix='explain')
+_explain_jobs = {}
+_jobs_lock = threading.Lock()
+
+def get_explainer():
+    """Return the cached explainer for the loaded model, building it on first use"""
+    with _explainer_lock:
+        if model_version not in _explainers:
+            explainer = create_explainer(model)
+            logger.info(f"🔥 Built {type(explainer).__name__} explainer for {model_version}")
+            _explainers.clear()
+            _explainers[model_version] = explainer
+        return _explainers[model_version]
+
+def prune_explain_jobs():
+    """Drop jobs finished more than EXPLAIN_JOB_TTL ago and jobs pending past EXPLAIN_JOB_DEADLINE"""
+    now = time.time()
+    with _jobs_lock:
+        for job_id in [j for j, job in _explain_jobs.items()
+                       if (job['status'] == 'pending' and now - job['created'] > EXPLAIN_JOB_DEADLINE)
+                       or (job['status'] != 'pending' and now - job['finished'] > EXPLAIN_JOB_TTL)]:
+            del _explain_jobs[job_id]
+
 # ============================================================================
 # UTILITY FUNCTIONS
 # ============================================================================
@@ -204,19 +262,7 @@ def predict_kidney_stone(image_path):
         # Make prediction
         prediction = model.predict(processed_img, verbose=0)[0][0]
 
-        # Determine result
-        has_stone = prediction > 0.5
-        confidence = float(prediction if has_stone else 1 - prediction)
-
-        result = {
-            'prediction': 'Stone Detected' if has_stone else 'Normal Kidney',
-            'confidence': round(confidence * 100, 2),
-            'confidence_score': round(confidence, 4),
-            'raw_score': float(prediction),
-            'has_kidney_stone': bool(has_stone),
-            'model_type': model_type,
-            'preprocessing': 'enhanced' if use_enhanced_preprocessing else 'basic'
-        }
+        result = build_prediction_result(prediction)
 
         logger.info(f"✅ Prediction: {result['prediction']} (Confidence: {result['confidence']}%)")
 
@@ -226,6 +272,84 @@ def predict_kidney_stone(image_path):
         logger.error(f"Error during prediction: {e}")
         raise
 
+def build_prediction_result(prediction):
+    """Turn the model's stone probability into the API result"""
+    has_stone = prediction > 0.5
+    confidence = float(prediction if has_stone else 1 - prediction)
+
+    return {
+        'prediction': 'Stone Detected' if has_stone else 'Normal Kidney',
+        'confidence': round(confidence * 100, 2),
+        'confidence_score': round(confidence, 4),
+        'raw_score': float(prediction),
+        'has_kidney_stone': bool(has_stone),
+        'model_type': model_type,
+        'preprocessing': 'enhanced' if use_enhanced_preprocessing else 'basic'
+    }
+
+def explain_kidney_stone(image_path):
+    """
+    Predict and explain in one pass: the explainer returns the heatmap
+    together with the model output, and the overlay is encoded as PNG
+    """
+    if model is None:
+        raise Exception("Model not loaded")
+    if not explain_available:
+        raise Exception("Explanations not available")
+
+    try:
+        if use_enhanced_preprocessing:
+            processed_img = preprocess_image_enhanced(image_path)
+        else:
+            processed_img = preprocess_image_basic(image_path)
+
+        explainer = get_explainer()
+        heatmaps, predictions = explainer.compute_heatmaps(processed_img)
+
+        result = build_prediction_result(predictions[0][-1])
+
+        # Overlay on the model-sized input image (BGR, uint8)
+        display_img = np.uint8(np.clip(processed_img[0] * 255, 0, 255))
+        overlay = explainer.overlay_heatmap(heatmaps[0], display_img)
+
+        ok, png = cv2.imencode('.png', overlay, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION])
+        if not ok:
+            raise ValueError("Could not encode heatmap overlay")
+
+        result['explanation'] = {
+            'method': type(explainer).__name__,
+            'overlay_png': base64.b64encode(png.tobytes()).decode('ascii'),
+            'heatmap_shape': list(heatmaps[0].shape)
+        }
+
+        logger.info(f"🔥 Explanation: {result['prediction']} ({result['explanation']['method']})")
+
+        return result
+
+    except Exception as e:
+        logger.error(f"Error during explanation: {e}")
+        raise
+
+def finish_explain_job(job_id, **fields):
+    """Record a job's outcome; the TTL runs from now. Jobs pruned past their deadline stay gone"""
+    with _jobs_lock:
+        job = _explain_jobs.get(job_id)
+        if job is not None:
+            job.update(finished=time.time(), **fields)
+
+def run_explain_job(job_id, filepath):
+    """Background explanation; removes the upload when done"""
+    try:
+        result = explain_kidney_stone(filepath)
+        finish_explain_job(job_id, status='done', result=result)
+    except Exception as e:
+        finish_explain_job(job_id, status='error', error=str(e))
+    finally:
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
 # ============================================================================
 # API ENDPOINTS
 # ============================================================================
@@ -238,6 +362,7 @@ def health_check():
         'model_loaded': model is not None,
         'model_type': model_type,
         'enhanced_preprocessing': use_enhanced_preprocessing,
+        'explanations': explain_available,
         'service': 'RayScan Kidney Stone Detection - Enhanced'
     }), 200
 
@@ -289,6 +414,111 @@ def predict():
             'error': str(e)
         }), 500
 
+@app.route('/explain', methods=['POST'])
+def explain():
+    """
+    Endpoint to predict and explain (heatmap overlay) an uploaded image
+    Expected: multipart/form-data with 'image' file; 'async=true' (form or
+              query) queues the job and returns a poll URL
+    Returns: JSON with prediction results and base64 PNG overlay
+    """
+    try:
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image file provided'}), 400
+
+        file = request.files['image']
+
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+
+        if not allowed_file(file.filename):
+            return jsonify({'error': 'Invalid file type. Only PNG, JPG, JPEG allowed'}), 400
+
+        if not explain_available:
+            return jsonify({'success': False, 'error': 'Explanations not available'}), 503
+
+        # Unique name: async jobs outlive the request
+        job_id = uuid.uuid4().hex
+        filename = secure_filename(file.filename)
+        filepath = os.path.join(UPLOAD_FOLDER, f"{job_id}_{filename}")
+        file.save(filepath)
+
+        logger.info(f"🔥 Explaining image: {filename}")
+
+        run_async = (request.form.get('async') or request.args.get('async', '')).lower() in ('1', 'true', 'yes')
+        if run_async:
+            prune_explain_jobs()
+            with _jobs_lock:
+                pending = sum(job['status'] == 'pending' for job in _explain_jobs.values())
+                if pending < EXPLAIN_MAX_PENDING:
+                    _explain_jobs[job_id] = {'status': 'pending', 'created': time.time()}
+            if pending >= EXPLAIN_MAX_PENDING:
+                os.remove(filepath)
+                logger.warning(f"⚠️ Explain queue full ({pending} pending), rejecting job")
+                return jsonify({
+                    'success': False,
+                    'error': 'Too many pending explanations, retry later'
+                }), 429, {'Retry-After': '30'}
+            _explain_executor.submit(run_explain_job, job_id, filepath)
+
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'pending',
+                'poll_url': f'/explain/{job_id}'
+            }), 202
+
+        # Synchronous: still runs on the explain worker, not a request thread,
+        # but the request gives up rather than waiting behind the whole queue
+        future = _explain_executor.submit(explain_kidney_stone, filepath)
+        try:
+            result = future.result(timeout=EXPLAIN_SYNC_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()  # drop it if it has not started yet
+            logger.warning(f"⚠️ Explanation timed out after {EXPLAIN_SYNC_TIMEOUT}s")
+            return jsonify({
+                'success': False,
+                'error': 'Explanation service busy, retry later or use async=true'
+            }), 503
+        finally:
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+
+        return jsonify({
+            'success': True,
+            'data': result
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Explanation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/explain/<job_id>', methods=['GET'])
+def explain_status(job_id):
+    """Poll an asynchronous explanation job"""
+    with _jobs_lock:
+        job = dict(_explain_jobs.get(job_id, {}))
+
+    if not job:
+        return jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+
+    if job['status'] == 'pending':
+        return jsonify({'success': True, 'job_id': job_id, 'status': 'pending'}), 202
+    if job['status'] == 'error':
+        return jsonify({'success': False, 'job_id': job_id, 'status': 'error', 'error': job['error']}), 500
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'done',
+        'data': job['result']
+    }), 200
+
 @app.route('/', methods=['GET'])
 def index():
     """Root endpoint"""
@@ -300,7 +530,9 @@ def index():
         'model': 'kidney_stone_hybrid.h5' if use_enhanced_preprocessing else 'kidney_stone_cnn.h5',
         'endpoints': {
             '/health': 'GET - Health check',
-            '/predict': 'POST - Predict kidney stone from ultrasound image'
+            '/predict': 'POST - Predict kidney stone from ultrasound image',
+            '/explain': 'POST - Prediction with heatmap overlay (async=true to poll)',
+            '/explain/<job_id>': 'GET - Poll an asynchronous explanation'
         }
     }), 200
 
@@ -5,6 +5,7 @@ Based on research papers with improved preprocessing
 """
 
 import os
+import sys
 import numpy as np
 import cv2
 import tensorflow as tf
@@ -19,6 +20,10 @@ import pickle
 from pathlib import Path
 import matplotlib.pyplot as plt
 
+# Shared feature cache from ml_model/src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'ml_model' / 'src'))
+from feature_store import FeatureStore
+
 print("=" * 70)
 print("  ENHANCED KIDNEY STONE DETECTION MODEL TRAINING")
 print("  Hybrid: VGG16 Feature Extraction + XGBoost Classification")
@@ -40,6 +45,7 @@ MODEL_DIR.mkdir(exist_ok=True)
 VGG_FEATURES_MODEL_PATH = MODEL_DIR / 'vgg16_feature_extractor.h5'
 XGBOOST_MODEL_PATH = MODEL_DIR / 'xgboost_classifier.pkl'
 HYBRID_MODEL_PATH = MODEL_DIR / 'kidney_stone_hybrid.h5'
+FEATURE_CACHE_DIR = MODEL_DIR / 'feature_cache'
 
 IMG_SIZE = (224, 224)
 BATCH_SIZE = 32
@@ -199,16 +205,30 @@ vgg_feature_extractor = Sequential([
 
 vgg_feature_extractor.compile(optimizer='adam', loss='binary_crossentropy')
 
+# Extracted features are cached on disk, so re-running the XGBoost stage
+# with different parameters skips the VGG16 forward passes
+feature_store = FeatureStore(FEATURE_CACHE_DIR)
+preprocessing_fingerprint = f"bilateral-9-75-75|clahe-lab-3.0-8x8|size={IMG_SIZE}"
+
+def extract_vgg_features(images):
+    return vgg_feature_extractor.predict(images, batch_size=BATCH_SIZE, verbose=1)
+
 print("🔍 Extracting features from training data...")
-train_features = vgg_feature_extractor.predict(X_train, batch_size=BATCH_SIZE, verbose=1)
+train_features = feature_store.get_or_extract(
+    vgg_feature_extractor, X_train, extract_vgg_features, preprocessing_fingerprint
+)
 print(f"   Train features shape: {train_features.shape}")
 
 print("🔍 Extracting features from validation data...")
-val_features = vgg_feature_extractor.predict(X_val, batch_size=BATCH_SIZE, verbose=1)
+val_features = feature_store.get_or_extract(
+    vgg_feature_extractor, X_val, extract_vgg_features, preprocessing_fingerprint
+)
 print(f"   Validation features shape: {val_features.shape}")
 
 print("🔍 Extracting features from test data...")
-test_features = vgg_feature_extractor.predict(X_test, batch_size=BATCH_SIZE, verbose=1)
+test_features = feature_store.get_or_extract(
+    vgg_feature_extractor, X_test, extract_vgg_features, preprocessing_fingerprint
+)
 print(f"   Test features shape: {test_features.shape}")
 print()
 
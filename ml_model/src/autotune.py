@@ -0,0 +1,407 @@
+"""
+RayScan ML Model - Training Throughput Autotuner
+Measures training images/sec across TensorFlow thread pools, batch
+sizes, bfloat16 mixed precision and oneDNN, and picks the fastest
+stable configuration before a training run
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import subprocess
+import numpy as np
+from pathlib import Path
+
+
+def cpu_supports_bf16():
+    """Whether the CPU has native bfloat16 support (AVX512-BF16 or AMX)."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def build_trial_model(spec):
+    """
+    Build and compile the model described by a spec (random weights).
+
+    Throughput depends on the architecture and which layers train, not
+    on the weight values, so no pretrained weights are loaded.
+
+    Args:
+        spec: {'model': 'end_to_end' or a keras.applications backbone name
+               (e.g. 'VGG16', 'EfficientNetB0'), 'input_shape': [H, W, C],
+               'trainable_layers': trailing backbone layers left trainable
+               (None = all, 0 = frozen backbone)}
+
+    Returns:
+        Compiled Keras model
+    """
+    from tensorflow import keras
+    from tensorflow.keras import layers, Model
+
+    input_shape = tuple(spec['input_shape'])
+
+    if spec['model'] == 'end_to_end':
+        from models import EndToEndCNN
+        return EndToEndCNN(input_shape=input_shape).model
+
+    base_model = getattr(keras.applications, spec['model'])(
+        include_top=False, weights=None, input_shape=input_shape
+    )
+    trainable_layers = spec.get('trainable_layers')
+    if trainable_layers is not None:
+        for layer in base_model.layers[:len(base_model.layers) - trainable_layers]:
+            layer.trainable = False
+
+    x = layers.GlobalAveragePooling2D()(base_model.output)
+    x = layers.Dense(256, activation='relu')(x)
+    output = layers.Dense(1, activation='sigmoid', dtype='float32')(x)
+
+    model = Model(inputs=base_model.input, outputs=output)
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=1e-4), loss='binary_crossentropy')
+
+    return model
+
+
+def _run_trial(spec, config, steps, warmup):
+    """
+    Time training steps for one configuration (in a fresh process).
+
+    Thread pools can only be configured before TensorFlow starts, and
+    oneDNN only before it is imported, so each trial is its own process.
+    """
+    os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if config['onednn'] else '0'
+    import tensorflow as tf
+    from tensorflow import keras
+
+    tf.config.threading.set_intra_op_parallelism_threads(config['intra_op_threads'])
+    tf.config.threading.set_inter_op_parallelism_threads(config['inter_op_threads'])
+    if config['precision'] == 'mixed_bfloat16':
+        keras.mixed_precision.set_global_policy('mixed_bfloat16')
+
+    model = build_trial_model(spec)
+
+    rng = np.random.default_rng(0)
+    batch_size = config['batch_size']
+    x = rng.random((batch_size, *spec['input_shape']), dtype=np.float32)
+    y = rng.integers(0, 2, batch_size).astype(np.float32)
+
+    # First steps trace the graph and warm up the allocators
+    for _ in range(warmup):
+        model.train_on_batch(x, y)
+
+    step_times, losses = [], []
+    for _ in range(steps):
+        start = time.perf_counter()
+        loss = model.train_on_batch(x, y)
+        step_times.append(time.perf_counter() - start)
+        losses.append(float(np.ravel(loss)[0]))
+
+    step_times = np.array(step_times)
+    return {
+        'images_per_sec': float(batch_size / np.median(step_times)),
+        'step_ms_p50': float(np.median(step_times) * 1000),
+        'step_time_cv': float(step_times.std() / step_times.mean()),
+        'finite_loss': bool(np.all(np.isfinite(losses))),
+    }
+
+
+def run_trial(spec, config, steps=10, warmup=3, timeout=600):
+    """
+    Measure one configuration in a fresh Python process.
+
+    Args:
+        spec: Model spec (see build_trial_model)
+        config: {'intra_op_threads', 'inter_op_threads', 'batch_size',
+                 'precision', 'onednn'}
+        steps: Timed training steps
+        warmup: Untimed warm-up steps
+        timeout: Seconds before the trial is abandoned
+
+    Returns:
+        Trial result (with 'error' if it failed)
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_path = os.path.join(tmp_dir, 'result.json')
+        job = {'spec': spec, 'config': config, 'steps': steps, 'warmup': warmup}
+
+        env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL='2')
+        try:
+            process = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), '--trial', json.dumps(job), result_path],
+                env=env, capture_output=True, text=True, timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            return {'error': f'timed out after {timeout}s'}
+
+        if process.returncode != 0 or not os.path.exists(result_path):
+            lines = (process.stderr or '').strip().splitlines()
+            return {'error': lines[-1] if lines else f'exited with code {process.returncode}'}
+
+        with open(result_path) as f:
+            return json.load(f)
+
+
+def _thread_candidates(cpus):
+    """(intra, inter) thread pool sizes to try; (0, 0) is TensorFlow's default."""
+    candidates = [(0, 0), (cpus, 1), (cpus, 2), (max(1, cpus // 2), 2)]
+    return list(dict.fromkeys(candidates))
+
+
+def is_stable(result, max_cv=0.5):
+    """A trial is stable if it finished, the loss stayed finite and step times were steady."""
+    return 'error' not in result and result['finite_loss'] and result['step_time_cv'] <= max_cv
+
+
+def autotune(spec, batch_size=32, batch_sizes=None, steps=10, warmup=3, max_cv=0.5,
+             min_gain=0.05, include_bf16=None, include_onednn=True):
+    """
+    Find the fastest stable CPU training configuration.
+
+    Coordinate search (one dimension at a time, keeping the best so far):
+    thread pools at the given batch size, then batch sizes (only if
+    requested), then bfloat16 mixed precision (if the CPU supports it)
+    and oneDNN off. A candidate replaces the current best only if it is
+    more than min_gain faster, both in its first trial and on average over
+    a repeat trial of both, so run-to-run noise in the short trials
+    doesn't move the config off TensorFlow's defaults.
+
+    Args:
+        spec: Model spec (see build_trial_model)
+        batch_size: Training batch size (kept unless batch_sizes is given)
+        batch_sizes: Other batch sizes the tuner may switch to (default:
+                     none). The batch size is an optimization
+                     hyperparameter, so only list sizes acceptable for the run
+        steps: Timed training steps per trial
+        warmup: Warm-up steps per trial
+        max_cv: Maximum step-time coefficient of variation for a stable trial
+        min_gain: Minimum relative throughput gain to move off the current best
+        include_bf16: Try mixed_bfloat16 (default: if the CPU supports it)
+        include_onednn: Also try with oneDNN disabled
+
+    Returns:
+        Dictionary with the chosen config, its throughput, the baseline
+        (TensorFlow defaults) throughput, the speedup and all trials
+    """
+    cpus = os.cpu_count() or 1
+    batch_sizes = batch_sizes or []
+    if include_bf16 is None:
+        include_bf16 = cpu_supports_bf16()
+
+    print(f"\n{'='*60}")
+    print(f"Autotuning training throughput: {spec['model']} ({cpus} CPUs)")
+    print(f"{'='*60}")
+
+    start = time.perf_counter()
+    trials = []
+
+    def measure(config):
+        result = run_trial(spec, config, steps=steps, warmup=warmup)
+        trials.append({'config': dict(config), **result})
+        if 'error' in result:
+            print(f"  {_describe(config)}: failed ({result['error']})")
+        else:
+            flag = '' if is_stable(result, max_cv) else '  (unstable)'
+            print(f"  {_describe(config)}: {result['images_per_sec']:.1f} img/s{flag}")
+        return result
+
+    def best_of(configs):
+        results = [(config, measure(config)) for config in configs]
+        stable = [(c, r) for c, r in results if is_stable(r, max_cv)]
+        return max(stable, key=lambda cr: cr[1]['images_per_sec']) if stable else (None, None)
+
+    def improve(best, best_result, configs):
+        # Switch only for a clear win (or if there is no stable best yet)
+        candidate, result = best_of(configs)
+        if candidate is None:
+            return best, best_result
+        if best is None:
+            return candidate, result
+        if result['images_per_sec'] <= best_result['images_per_sec'] * (1 + min_gain):
+            return best, best_result
+
+        # Confirm with a second trial of both; the mean gain must still clear min_gain
+        print(f"  Confirming {_describe(candidate)}...")
+        best_again, candidate_again = measure(best), measure(candidate)
+        if not (is_stable(best_again, max_cv) and is_stable(candidate_again, max_cv)):
+            return best, best_result
+        best_ips = (best_result['images_per_sec'] + best_again['images_per_sec']) / 2
+        candidate_ips = (result['images_per_sec'] + candidate_again['images_per_sec']) / 2
+        if candidate_ips > best_ips * (1 + min_gain):
+            return candidate, dict(result, images_per_sec=candidate_ips)
+        return best, dict(best_result, images_per_sec=best_ips)
+
+    default = {'intra_op_threads': 0, 'inter_op_threads': 0, 'batch_size': batch_size,
+               'precision': 'float32', 'onednn': True}
+
+    # 1. Thread pools, starting from the TensorFlow default
+    baseline = measure(default)
+    best, best_result = (default, baseline) if is_stable(baseline, max_cv) else (None, None)
+    best, best_result = improve(best, best_result,
+                                [dict(default, intra_op_threads=intra, inter_op_threads=inter)
+                                 for intra, inter in _thread_candidates(cpus)[1:]])
+    if best is None:
+        print("No stable configuration found, keeping TensorFlow defaults")
+        return {'config': default, 'images_per_sec': None, 'baseline_images_per_sec': None,
+                'speedup': None, 'trials': trials, 'seconds': time.perf_counter() - start}
+
+    # 2. Batch sizes (only those explicitly allowed)
+    best, best_result = improve(best, best_result,
+                                [dict(best, batch_size=b) for b in batch_sizes if b != best['batch_size']])
+
+    # 3. Numerics / kernels
+    variants = []
+    if include_bf16:
+        variants.append(dict(best, precision='mixed_bfloat16'))
+    if include_onednn:
+        variants.append(dict(best, onednn=False))
+    best, best_result = improve(best, best_result, variants)
+
+    # Baseline: mean over every run of the defaults (repeats included)
+    default_runs = [t['images_per_sec'] for t in trials if t['config'] == default and 'error' not in t]
+    baseline_ips = float(np.mean(default_runs)) if default_runs else None
+    speedup = best_result['images_per_sec'] / baseline_ips if baseline_ips else None
+    seconds = time.perf_counter() - start
+
+    print(f"\nBest: {_describe(best)}: {best_result['images_per_sec']:.1f} img/s"
+          + (f" ({speedup:.2f}x TensorFlow defaults)" if speedup else ''))
+    print(f"Autotune took {seconds:.0f}s ({len(trials)} trials)")
+
+    return {
+        'config': best,
+        'images_per_sec': best_result['images_per_sec'],
+        'baseline_images_per_sec': baseline_ips,
+        'speedup': speedup,
+        'trials': trials,
+        'seconds': seconds,
+    }
+
+
+def autotune_once(spec, state_path=None, resume=False, **kwargs):
+    """
+    Autotune once per training run.
+
+    The result is saved to state_path, next to the run's training state
+    checkpoint. A resumed run reuses it instead of tuning again, so it
+    restarts quickly and trains with the same settings as before.
+
+    Args:
+        spec: Model spec (see build_trial_model)
+        state_path: JSON file for this run's result (None: don't keep it)
+        resume: Reuse the saved result if it was tuned for the same spec
+        **kwargs: autotune() options
+
+    Returns:
+        autotune() result
+    """
+    if state_path is not None:
+        state_path = Path(state_path)
+        if resume and state_path.exists():
+            with open(state_path) as f:
+                saved = json.load(f)
+            if saved.get('spec') == spec:
+                print(f"Reusing autotuned config from {state_path}: {_describe(saved['result']['config'])}")
+                return saved['result']
+            print(f"Autotune state at {state_path} is for another model, tuning again")
+
+    result = autotune(spec, **kwargs)
+
+    if state_path is not None:
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(state_path, 'w') as f:
+            json.dump({'spec': spec, 'result': result}, f, indent=2)
+
+    return result
+
+
+def _describe(config):
+    threads = 'default threads' if config['intra_op_threads'] == 0 else \
+        f"intra={config['intra_op_threads']} inter={config['inter_op_threads']}"
+    return (f"{threads}, batch {config['batch_size']}, {config['precision']}"
+            f"{'' if config['onednn'] else ', oneDNN off'}")
+
+
+def apply_config(config):
+    """
+    Apply an autotuned configuration to this process.
+
+    Must run before TensorFlow executes anything and before the model is
+    built (thread pools and the dtype policy are fixed after that). The
+    batch size is returned for the caller to use. oneDNN is chosen when
+    TensorFlow starts, so a config with oneDNN off only prints the
+    environment variable to set for the next run.
+
+    Args:
+        config: autotune()['config']
+
+    Returns:
+        Batch size
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(config['intra_op_threads'])
+        tf.config.threading.set_inter_op_parallelism_threads(config['inter_op_threads'])
+    except RuntimeError:
+        print("⚠️  TensorFlow already started; thread pool settings not applied")
+
+    if config['precision'] == 'mixed_bfloat16':
+        keras.mixed_precision.set_global_policy('mixed_bfloat16')
+
+    if not config['onednn'] and os.environ.get('TF_ENABLE_ONEDNN_OPTS') != '0':
+        print("⚠️  oneDNN off was fastest: export TF_ENABLE_ONEDNN_OPTS=0 before the next run")
+
+    return config['batch_size']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Autotune CPU training throughput')
+    parser.add_argument('--trial', nargs=2, metavar=('JOB', 'RESULT_PATH'),
+                       help=argparse.SUPPRESS)
+    parser.add_argument('--model', type=str, default='end_to_end',
+                       help="'end_to_end' or a keras.applications backbone (e.g. VGG16, EfficientNetB0)")
+    parser.add_argument('--input_size', type=int, default=224,
+                       help='Input height/width')
+    parser.add_argument('--channels', type=int, default=None,
+                       help='Input channels (default: 1 for end_to_end, 3 for backbones)')
+    parser.add_argument('--trainable_layers', type=int, default=None,
+                       help='Trailing backbone layers left trainable (default: all)')
+    parser.add_argument('--batch_size', type=int, default=32,
+                       help='Training batch size')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=None,
+                       help='Other batch sizes the tuner may switch to (default: keep --batch_size)')
+    parser.add_argument('--min_gain', type=float, default=0.05,
+                       help='Minimum relative speedup to move off the current best')
+    parser.add_argument('--steps', type=int, default=10,
+                       help='Timed training steps per trial')
+    parser.add_argument('--output', type=str, default=None,
+                       help='Write the result to this JSON file')
+
+    args = parser.parse_args()
+
+    if args.trial:
+        job_json, result_path = args.trial
+        job = json.loads(job_json)
+        with open(result_path, 'w') as f:
+            json.dump(_run_trial(job['spec'], job['config'], job['steps'], job['warmup']), f)
+    else:
+        channels = args.channels or (1 if args.model == 'end_to_end' else 3)
+        tuning = autotune(
+            {'model': args.model, 'input_shape': [args.input_size, args.input_size, channels],
+             'trainable_layers': args.trainable_layers},
+            batch_size=args.batch_size,
+            batch_sizes=args.batch_sizes,
+            steps=args.steps,
+            min_gain=args.min_gain
+        )
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(tuning, f, indent=2)
+            print(f"\nAutotune result saved to: {args.output}")
@@ -0,0 +1,243 @@
+"""
+RayScan ML Model - Backbone Sweep
+Latency/accuracy sweep over truncated VGG16 backbones and input resolutions
+"""
+
+import time
+import json
+import argparse
+import numpy as np
+import cv2
+from pathlib import Path
+from tensorflow import keras
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, recall_score, roc_auc_score
+
+from preprocessing import UltrasoundPreprocessor
+from models import HybridClassifier
+from feature_store import FeatureStore
+
+
+VGG_BLOCKS = ('block3_pool', 'block4_pool', 'block5_pool')
+RESOLUTIONS = (224, 160, 128, 96)
+
+
+def resize_images(images, size):
+    """
+    Resize a batch of images to size x size.
+
+    Args:
+        images: Images (N, H, W, C)
+        size: Target side length
+
+    Returns:
+        Resized images (N, size, size, C)
+    """
+    if images.shape[1:3] == (size, size):
+        return images
+
+    resized = np.empty((len(images), size, size, images.shape[-1]), dtype=images.dtype)
+    for i, img in enumerate(images):
+        resized[i] = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA).reshape(size, size, -1)
+    return resized
+
+
+def _count_macs(model):
+    """Multiply-accumulates of Conv2D and Dense layers for one image."""
+    macs = 0
+    for layer in model.layers:
+        if hasattr(layer, 'layers'):
+            macs += _count_macs(layer)
+        elif isinstance(layer, keras.layers.Conv2D):
+            _, h, w, c_out = layer.output_shape
+            kh, kw = layer.kernel_size
+            macs += h * w * c_out * kh * kw * layer.input_shape[-1]
+        elif isinstance(layer, keras.layers.Dense):
+            macs += layer.input_shape[-1] * layer.units
+    return macs
+
+
+def count_gflops(model):
+    """
+    Estimate GFLOPs of one forward pass (Conv2D and Dense layers only).
+
+    Args:
+        model: Keras model (nested models are traversed)
+
+    Returns:
+        GFLOPs for one image
+    """
+    return 2 * _count_macs(model) / 1e9
+
+
+def measure_latency(model, input_shape, runs=30, warmup=5):
+    """
+    Measure single-image CPU latency of a Keras model.
+
+    Args:
+        model: Keras model
+        input_shape: Input shape without batch dimension
+        runs: Timed runs
+        warmup: Untimed warm-up runs
+
+    Returns:
+        Median latency in milliseconds
+    """
+    x = np.random.rand(1, *input_shape).astype(np.float32)
+
+    for _ in range(warmup):
+        model(x, training=False)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model(x, training=False)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings))
+
+
+def pareto_front(rows):
+    """Mark rows not dominated on (lower latency, higher accuracy)."""
+    for row in rows:
+        row['pareto'] = not any(
+            other['latency_ms'] <= row['latency_ms'] and other['accuracy'] >= row['accuracy']
+            and (other['latency_ms'] < row['latency_ms'] or other['accuracy'] > row['accuracy'])
+            for other in rows
+        )
+    return rows
+
+
+def sweep_backbones(X_train, y_train, X_val, y_val, blocks=VGG_BLOCKS, resolutions=RESOLUTIONS,
+                    classifier='xgboost', feature_store=None, preprocessing_fingerprint='',
+                    recall_floor=0.95):
+    """
+    Train the hybrid classifier on every (VGG16 block, resolution) pair.
+
+    Args:
+        X_train, y_train: Training data (3-channel, full resolution)
+        X_val, y_val: Validation data
+        blocks: VGG16 layers to cut the backbone at
+        resolutions: Input side lengths to try
+        classifier: 'xgboost' or 'random_forest'
+        feature_store: Optional FeatureStore, so repeated sweeps reuse features
+        preprocessing_fingerprint: Preprocessing identifier for the feature store
+        recall_floor: Minimum validation recall for the recommended backbone
+
+    Returns:
+        List of result rows and the recommended row (or None)
+    """
+    rows = []
+
+    for size in resolutions:
+        X_train_r = resize_images(X_train, size)
+        X_val_r = resize_images(X_val, size)
+
+        for block in blocks:
+            print(f"\n{'='*60}")
+            print(f"Backbone: VGG16 @ {block}, {size}x{size}")
+            print(f"{'='*60}")
+
+            model = HybridClassifier(
+                feature_extractor='vgg16',
+                classifier=classifier,
+                feature_store=feature_store,
+                preprocessing_fingerprint=f"{preprocessing_fingerprint}|resize={size}",
+                extractor_kwargs={'input_shape': (size, size, 3), 'cut_layer': block}
+            )
+            model.train(X_train_r, y_train)
+
+            val_pred, val_proba = model.predict_with_proba(X_val_r)
+            extractor = model.feature_extractor.model
+
+            rows.append({
+                'block': block,
+                'resolution': size,
+                'gflops': count_gflops(extractor),
+                'latency_ms': measure_latency(extractor, (size, size, 3)),
+                'accuracy': float(accuracy_score(y_val, val_pred)),
+                'recall': float(recall_score(y_val, val_pred)),
+                'auc': float(roc_auc_score(y_val, val_proba[:, 1])),
+            })
+
+    pareto_front(rows)
+
+    eligible = [r for r in rows if r['recall'] >= recall_floor]
+    recommended = min(eligible, key=lambda r: r['latency_ms']) if eligible else None
+
+    print_pareto_table(rows, recommended, recall_floor)
+
+    return rows, recommended
+
+
+def print_pareto_table(rows, recommended=None, recall_floor=0.95):
+    """Print the sweep results sorted by latency."""
+    print("\n📊 Backbone Latency vs Accuracy (CPU):")
+    print(f"   {'Block':<13}{'Res':>5}{'GFLOPs':>9}{'Latency (ms)':>14}{'Accuracy':>10}{'Recall':>9}{'AUC':>8}  Pareto")
+    for r in sorted(rows, key=lambda r: r['latency_ms']):
+        print(f"   {r['block']:<13}{r['resolution']:>5}{r['gflops']:>9.2f}{r['latency_ms']:>14.2f}"
+              f"{r['accuracy']:>10.4f}{r['recall']:>9.4f}{r['auc']:>8.4f}  {'*' if r['pareto'] else ''}")
+
+    if recommended is not None:
+        print(f"\n🏆 Cheapest backbone with recall >= {recall_floor:.2f}: "
+              f"{recommended['block']} @ {recommended['resolution']}x{recommended['resolution']} "
+              f"({recommended['latency_ms']:.2f} ms)")
+    else:
+        print(f"\n⚠️  No backbone reached recall >= {recall_floor:.2f}")
+
+
+def main(args):
+    """Run the sweep on the processed dataset."""
+    from train import load_dataset
+
+    preprocessor = UltrasoundPreprocessor(target_size=(224, 224))
+    X, y = load_dataset(args.data_dir, preprocessor, for_vgg=True)
+
+    # Same split as train.py
+    X_train, X_temp, y_train, y_temp = train_test_split(
+        X, y, test_size=0.3, stratify=y, random_state=42
+    )
+    X_val, _, y_val, _ = train_test_split(
+        X_temp, y_temp, test_size=0.5, stratify=y_temp, random_state=42
+    )
+
+    feature_store = FeatureStore(args.feature_cache, dtype='float16')
+
+    rows, recommended = sweep_backbones(
+        X_train, y_train, X_val, y_val,
+        blocks=args.blocks,
+        resolutions=args.resolutions,
+        classifier=args.classifier,
+        feature_store=feature_store,
+        preprocessing_fingerprint=preprocessor.fingerprint(for_vgg=True),
+        recall_floor=args.recall_floor
+    )
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump({'results': rows, 'recommended': recommended, 'recall_floor': args.recall_floor}, f, indent=2)
+
+    print(f"\nSweep results saved to: {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Latency/accuracy sweep over truncated VGG16 backbones')
+    parser.add_argument('--data_dir', type=str, default='../data/processed',
+                       help='Path to processed dataset')
+    parser.add_argument('--blocks', type=str, nargs='+', default=list(VGG_BLOCKS),
+                       help='VGG16 layers to cut the backbone at')
+    parser.add_argument('--resolutions', type=int, nargs='+', default=list(RESOLUTIONS),
+                       help='Input resolutions to try')
+    parser.add_argument('--classifier', type=str, default='xgboost',
+                       choices=['xgboost', 'random_forest'],
+                       help='Classifier trained on the extracted features')
+    parser.add_argument('--recall_floor', type=float, default=0.95,
+                       help='Minimum validation recall for the recommendation')
+    parser.add_argument('--feature_cache', type=str, default='../models/feature_cache',
+                       help='Directory for cached extracted features')
+    parser.add_argument('--output', type=str, default='../models/backbone_sweep.json',
+                       help='Where to write the sweep results')
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,365 @@
+"""
+RayScan ML Model - CPU Benchmark
+Cold-load time, warm latency percentiles, batch throughput and peak memory
+of exported TFLite variants and the source Keras model
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import queue as queue_module
+import multiprocessing as mp
+import numpy as np
+from pathlib import Path
+
+
+def _rss_mb():
+    """Current resident set size in MB (None if it cannot be read)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB (None if unavailable)."""
+    # VmHWM is reset on exec; ru_maxrss is not, so in a spawned child it
+    # would report the parent's peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def _benchmark_worker(model_path, images_path, runs, batch_size, num_threads, queue):
+    """Benchmark one model in a fresh process and put the result on the queue."""
+    try:
+        import tensorflow as tf
+
+        images = np.load(images_path)
+        baseline_rss = _rss_mb()
+        is_tflite = str(model_path).endswith('.tflite')
+
+        # Cold load: read the file and prepare for inference
+        start = time.perf_counter()
+        if is_tflite:
+            interpreter = tf.lite.Interpreter(model_path=str(model_path), num_threads=num_threads)
+            interpreter.allocate_tensors()
+            input_details = interpreter.get_input_details()[0]
+            output_details = interpreter.get_output_details()[0]
+
+            def prepare(x):
+                if input_details['dtype'] in (np.uint8, np.int8):
+                    scale, zero = input_details['quantization']
+                    info = np.iinfo(input_details['dtype'])
+                    x = np.clip(np.round(x / scale + zero), info.min, info.max)
+                return x.astype(input_details['dtype'])
+
+            def infer_one(x):
+                interpreter.set_tensor(input_details['index'], prepare(x))
+                interpreter.invoke()
+                return interpreter.get_tensor(output_details['index'])
+        else:
+            if num_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+            model = tf.keras.models.load_model(str(model_path))
+
+            def infer_one(x):
+                return model(x, training=False)
+
+        load_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        infer_one(images[:1].astype(np.float32))
+        first_inference_ms = (time.perf_counter() - start) * 1000
+
+        # Warm single-image latency
+        timings = []
+        for i in range(runs):
+            x = images[i % len(images)][np.newaxis].astype(np.float32)
+            start = time.perf_counter()
+            infer_one(x)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        # Batch throughput over all images (outputs reused for accuracy)
+        start = time.perf_counter()
+        if is_tflite:
+            from export import run_tflite_inference
+            outputs = run_tflite_inference(model_path, images, num_threads, batch_size)
+        else:
+            outputs = model.predict(images, batch_size=batch_size, verbose=0)
+        throughput = len(images) / (time.perf_counter() - start)
+
+        peak_rss = _peak_rss_mb()
+        queue.put({
+            'size_mb': os.path.getsize(model_path) / (1024 * 1024),
+            'load_ms': load_ms,
+            'first_inference_ms': first_inference_ms,
+            'p50_ms': float(np.percentile(timings, 50)),
+            'p99_ms': float(np.percentile(timings, 99)),
+            'throughput_ips': throughput,
+            'batch_size': batch_size,
+            'peak_rss_mb': peak_rss,
+            'rss_delta_mb': (peak_rss - baseline_rss) if peak_rss is not None and baseline_rss is not None else None,
+            'outputs': np.asarray(outputs, dtype=np.float32).reshape(len(images), -1)[:, -1].tolist(),
+        })
+    except Exception as e:
+        queue.put({'error': f'{type(e).__name__}: {e}'})
+
+
+def benchmark_model(model_path, images, runs=100, batch_size=32, num_threads=None, timeout=900):
+    """
+    Benchmark a .tflite or Keras model in a separate process.
+
+    A fresh process per model makes the cold-load time and peak RSS
+    independent of models benchmarked before it.
+
+    Args:
+        model_path: Path to .tflite or .keras file
+        images: Test images
+        runs: Warm single-image invocations for the latency percentiles
+        batch_size: Batch size for the throughput measurement
+        num_threads: CPU threads (None = runtime default)
+        timeout: Seconds before the benchmark process is killed
+
+    Returns:
+        Result dictionary (with positive-class outputs under 'outputs')
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        images_path = os.path.join(tmp_dir, 'images.npy')
+        np.save(images_path, np.asarray(images, dtype=np.float32))
+
+        ctx = mp.get_context('spawn')
+        queue = ctx.Queue()
+        process = ctx.Process(
+            target=_benchmark_worker,
+            args=(str(model_path), images_path, runs, batch_size, num_threads, queue)
+        )
+        process.start()
+
+        # Poll so a crashed worker is reported instead of waiting for the timeout
+        result = None
+        deadline = time.monotonic() + timeout
+        while result is None and time.monotonic() < deadline:
+            try:
+                result = queue.get(timeout=1)
+            except queue_module.Empty:
+                if not process.is_alive() and queue.empty():
+                    result = {'error': f'benchmark process exited with code {process.exitcode}'}
+        if result is None:
+            result = {'error': f'timed out after {timeout}s'}
+
+        process.join(timeout=10)
+        if process.is_alive():
+            process.kill()
+
+    return result
+
+
+def benchmark_variants(paths, images, labels=None, runs=100, batch_size=32, num_threads=None,
+                       reference='keras'):
+    """
+    Benchmark several model files one after another.
+
+    Args:
+        paths: Dictionary of variant name -> model path
+        images: Test images
+        labels: True labels, for accuracy/AUC (optional)
+        runs: Warm latency runs per model
+        batch_size: Throughput batch size
+        num_threads: CPU threads
+        reference: Variant whose predictions the others are compared with
+                   ('agreement') when there are no labels
+
+    Returns:
+        Dictionary of variant name -> result
+    """
+    from sklearn.metrics import accuracy_score, roc_auc_score
+
+    results = {}
+    outputs = {}
+    for name, path in paths.items():
+        print(f"⏱️  Benchmarking {name} ({Path(path).name})...")
+        result = benchmark_model(path, images, runs, batch_size, num_threads)
+
+        if 'error' in result:
+            print(f"   ⚠️  {result['error']}")
+        else:
+            proba = outputs[name] = np.array(result.pop('outputs'))
+            if labels is not None:
+                result['accuracy'] = float(accuracy_score(labels, (proba > 0.5).astype(int)))
+                if len(np.unique(labels)) > 1:
+                    result['auc'] = float(roc_auc_score(labels, proba))
+
+        results[name] = result
+
+    # Without labels, fidelity is agreement with the reference model's predictions
+    if labels is None and reference in outputs:
+        reference_pred = outputs[reference] > 0.5
+        for name, proba in outputs.items():
+            results[name]['agreement'] = float(np.mean((proba > 0.5) == reference_pred))
+
+    return results
+
+
+def fidelity_metric(results, names=None):
+    """
+    Metric that checks the variants' predictions.
+
+    Args:
+        results: Benchmark results
+        names: Variants to consider (default all without errors)
+
+    Returns:
+        'accuracy' (labels given), 'agreement' (with the reference model)
+        or None if neither is available for every variant
+    """
+    names = [n for n in (names or results) if n in results and 'error' not in results[n]]
+    for metric in ('accuracy', 'agreement'):
+        if names and all(metric in results[n] for n in names):
+            return metric
+    return None
+
+
+def pareto_recommendation(results, candidates=None, max_accuracy_drop=0.01):
+    """
+    Recommend a variant from the latency/accuracy Pareto front.
+
+    A variant is on the front if no other variant is both at least as fast
+    (p50) and at least as accurate, and strictly better in one. The
+    recommendation is the fastest front variant within max_accuracy_drop
+    of the most accurate one. Accuracy is label accuracy, or agreement
+    with the reference model when there were no labels (see
+    fidelity_metric); with neither there is no recommendation, since
+    speed alone would just pick the fastest file.
+
+    Args:
+        results: Benchmark results
+        candidates: Variant names eligible for recommendation (default all)
+        max_accuracy_drop: Accuracy tolerance vs the best candidate
+
+    Returns:
+        Recommended variant name and the list of Pareto-front variants
+    """
+    names = [n for n in (candidates or results) if n in results and 'error' not in results[n]]
+    metric = fidelity_metric(results, names)
+    if metric is None:
+        return None, []
+
+    acc = {n: results[n][metric] for n in names}
+    lat = {n: results[n]['p50_ms'] for n in names}
+
+    front = [
+        n for n in names
+        if not any(lat[o] <= lat[n] and acc[o] >= acc[n] and (lat[o] < lat[n] or acc[o] > acc[n])
+                   for o in names)
+    ]
+
+    best_acc = max(acc[n] for n in front)
+    eligible = [n for n in front if best_acc - acc[n] <= max_accuracy_drop]
+    recommended = min(eligible, key=lambda n: lat[n])
+
+    return recommended, front
+
+
+def print_benchmark_table(results, recommended=None, front=(), metric='accuracy'):
+    """Print the benchmark results (metric: 'accuracy' or 'agreement')."""
+    metric = metric or 'accuracy'
+    print("\n📊 CPU Benchmark:")
+    print(f"   {'Variant':<10}{'Size (MB)':>10}{'Load (ms)':>11}{'p50 (ms)':>10}{'p99 (ms)':>10}"
+          f"{'img/s':>9}{'Peak RSS':>10}{metric.capitalize():>10}  Pareto")
+    for name, r in results.items():
+        if 'error' in r:
+            print(f"   {name:<10}  {r['error']}")
+            continue
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else 'n/a'
+        acc = f"{r[metric]:.4f}" if metric in r else 'n/a'
+        print(f"   {name:<10}{r['size_mb']:>10.2f}{r['load_ms']:>11.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r['throughput_ips']:>9.1f}{rss:>10}{acc:>10}  {'*' if name in front else ''}")
+
+    if recommended is not None:
+        print(f"\n🏆 Recommended (latency/{metric} Pareto): {recommended}")
+
+
+def main(args):
+    """Benchmark the exported variants in a model directory."""
+    from sklearn.model_selection import train_test_split
+    from preprocessing import UltrasoundPreprocessor
+    from train import load_dataset
+
+    model_dir = Path(args.model_dir)
+
+    preprocessor = UltrasoundPreprocessor(target_size=(224, 224))
+    X, y = load_dataset(args.data_dir, preprocessor)
+
+    # Test split as in train.py
+    _, X_temp, _, y_temp = train_test_split(X, y, test_size=0.3, stratify=y, random_state=42)
+    _, X_test, _, y_test = train_test_split(X_temp, y_temp, test_size=0.5, stratify=y_temp, random_state=42)
+
+    paths = {
+        p.stem.replace('kidney_stone_', ''): p
+        for p in sorted(model_dir.glob('kidney_stone_*.tflite'))
+    }
+    tflite_names = list(paths)
+    if args.keras_model:
+        paths['keras'] = Path(args.keras_model)
+
+    results = benchmark_variants(paths, X_test, y_test, args.runs, args.batch_size, args.num_threads)
+    recommended, front = pareto_recommendation(results, tflite_names)
+    print_benchmark_table(results, recommended, front, fidelity_metric(results, tflite_names))
+
+    metadata_path = model_dir / 'model_metadata.json'
+    metadata = json.loads(metadata_path.read_text()) if metadata_path.exists() else {}
+    metadata['benchmark'] = results
+    metadata['pareto_front'] = front
+    if recommended is not None:
+        metadata['recommended'] = recommended
+        metadata['recommendation_rule'] = 'latency/accuracy pareto'
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    print(f"\nBenchmark saved to: {metadata_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CPU benchmark of exported model variants')
+    parser.add_argument('--model_dir', type=str, default='../models/tflite',
+                       help='Directory with kidney_stone_*.tflite files')
+    parser.add_argument('--keras_model', type=str, default='../models/end_to_end_cnn.keras',
+                       help='Source Keras model to benchmark alongside (empty to skip)')
+    parser.add_argument('--data_dir', type=str, default='../data/processed',
+                       help='Path to processed dataset')
+    parser.add_argument('--runs', type=int, default=100,
+                       help='Warm single-image runs for latency percentiles')
+    parser.add_argument('--batch_size', type=int, default=32,
+                       help='Batch size for throughput')
+    parser.add_argument('--num_threads', type=int, default=None,
+                       help='CPU threads (default: runtime default)')
+
+    args = parser.parse_args()
+    main(args)
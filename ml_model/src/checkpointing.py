@@ -0,0 +1,445 @@
+"""
+RayScan ML Model - Training Checkpoints
+Preemption-safe training state (weights, optimizer, epoch and batch
+cursor, RNG, learning rate and callback state) written atomically every
+few minutes, plus an on-disk cache of the preprocessed dataset
+"""
+
+import hashlib
+import math
+import os
+import pickle
+import random
+import signal
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from tensorflow import keras
+
+
+# Callback attributes that make up EarlyStopping / ReduceLROnPlateau /
+# ModelCheckpoint progress (reset by Keras at the start of every fit)
+CALLBACK_STATE_ATTRS = ('wait', 'best', 'cooldown_counter', 'stopped_epoch', 'best_epoch',
+                        'best_weights')
+
+
+def _atomic_write(path, write_fn):
+    """
+    Write a file atomically: into a temporary file next to it, fsynced,
+    then renamed over the target. A crash mid-write leaves the previous
+    version intact.
+
+    Args:
+        path: Target path
+        write_fn: Function writing to an open binary file object
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def dataset_fingerprint(data_dir, extra=''):
+    """
+    Identify a dataset directory by its file names, sizes and mtimes.
+
+    Args:
+        data_dir: Dataset directory
+        extra: Additional identifier (e.g. the preprocessing fingerprint)
+
+    Returns:
+        Hex digest string
+    """
+    data_dir = Path(data_dir)
+    h = hashlib.blake2b(digest_size=16)
+    for path in sorted(p for p in data_dir.rglob('*') if p.is_file()):
+        stat = path.stat()
+        h.update(f'{path.relative_to(data_dir)}|{stat.st_size}|{stat.st_mtime_ns}\n'.encode())
+    h.update(str(extra).encode())
+    return h.hexdigest()
+
+
+def cached_dataset(cache_dir, data_dir, load_fn, fingerprint=''):
+    """
+    Load a preprocessed dataset from the cache, or build and cache it.
+
+    The cache is keyed by the dataset files and the preprocessing
+    fingerprint, so a resumed run skips re-reading and re-preprocessing
+    the images. Images are returned memory-mapped (read-only).
+
+    Args:
+        cache_dir: Cache directory
+        data_dir: Dataset directory (for the cache key)
+        load_fn: Function returning (X, y) on a cache miss
+        fingerprint: Preprocessing identifier
+
+    Returns:
+        X, y
+    """
+    cache_dir = Path(cache_dir)
+    key = dataset_fingerprint(data_dir, fingerprint)
+    x_path = cache_dir / f'{key}_X.npy'
+    y_path = cache_dir / f'{key}_y.npy'
+
+    # X is written last, so its presence marks a complete entry
+    if x_path.exists() and y_path.exists():
+        X = np.load(x_path, mmap_mode='r')
+        y = np.load(y_path)
+        print(f"Loaded cached dataset {key[:12]} {X.shape}")
+        return X, y
+
+    X, y = load_fn()
+    _atomic_write(y_path, lambda f: np.save(f, y))
+    _atomic_write(x_path, lambda f: np.save(f, X))
+    print(f"Cached dataset {key[:12]} {X.shape} to: {cache_dir}")
+
+    return X, y
+
+
+def keras_augmentation(datagen):
+    """
+    Seeded batch transform for an ImageDataGenerator (for EpochOrderSequence).
+
+    Args:
+        datagen: ImageDataGenerator with the augmentation settings
+
+    Returns:
+        Function (batch, seed) -> augmented batch
+    """
+    def transform(batch, seed):
+        out = np.empty(batch.shape, dtype=keras.backend.floatx())
+        for i, image in enumerate(batch):
+            out[i] = datagen.standardize(datagen.random_transform(image, seed=(seed + i) % (2 ** 32)))
+        return out
+
+    return transform
+
+
+class EpochOrderSequence(keras.utils.Sequence):
+    """
+    Training batches in a reproducible per-epoch order.
+
+    The sample order of an epoch depends only on (seed, epoch) and each
+    batch's augmentation only on (seed, epoch, batch), so a run resumed
+    mid-epoch sees exactly the batches it would have seen. `start_batch`
+    skips the batches already trained in the interrupted epoch.
+
+    Pass shuffle=False to model.fit: the sequence shuffles itself.
+    """
+
+    def __init__(self, x, y, batch_size=32, seed=42, shuffle=True, load=None, transform=None):
+        """
+        Args:
+            x: Samples (array, or array of file paths with `load`)
+            y: Labels
+            batch_size: Batch size
+            seed: Seed for sample order and augmentation
+            shuffle: Shuffle the samples every epoch
+            load: Optional function mapping a batch of x to images
+            transform: Optional function (batch, seed) -> augmented batch
+        """
+        self.x = x
+        self.y = np.asarray(y)
+        self.batch_size = batch_size
+        self.seed = seed
+        self.shuffle = shuffle
+        self.load = load
+        self.transform = transform
+
+        self.epoch = 0
+        self.start_batch = 0
+        self._order = None
+
+    @property
+    def n_batches(self):
+        """Number of batches in a full epoch."""
+        return math.ceil(len(self.y) / self.batch_size)
+
+    def order(self, epoch):
+        """Sample order of an epoch."""
+        if self._order is None or self._order[0] != epoch:
+            if self.shuffle:
+                indices = np.random.default_rng([self.seed, epoch]).permutation(len(self.y))
+            else:
+                indices = np.arange(len(self.y))
+            self._order = (epoch, indices)
+        return self._order[1]
+
+    def __len__(self):
+        return self.n_batches - self.start_batch
+
+    def __getitem__(self, index):
+        batch = self.start_batch + index
+        indices = self.order(self.epoch)[batch * self.batch_size:(batch + 1) * self.batch_size]
+
+        images = self.x[indices]
+        if self.load is not None:
+            images = self.load(images)
+        if self.transform is not None:
+            batch_seed = int(np.random.SeedSequence([self.seed, self.epoch, batch]).generate_state(1)[0])
+            images = self.transform(images, batch_seed)
+
+        return images, self.y[indices]
+
+    def on_epoch_end(self):
+        self.epoch += 1
+        self.start_batch = 0
+
+
+class TrainingStateCheckpoint(keras.callbacks.Callback):
+    """
+    Periodic, atomic checkpoint of the full training state.
+
+    Unlike ModelCheckpoint (best weights only) this stores everything
+    needed to continue an interrupted run as if it had not stopped:
+    model weights, optimizer slots and iteration count, learning rate,
+    epoch and batch cursor of the EpochOrderSequence, NumPy/Python RNG
+    state, EarlyStopping / ReduceLROnPlateau / ModelCheckpoint
+    progress and the history so far. Multi-phase training (e.g. frozen
+    base, then fine-tuning) is tracked per phase, so completed phases
+    are skipped on resume.
+
+    State is written every `interval_minutes` (checked after each batch)
+    and when the process receives SIGTERM (spot/preemptible shutdown
+    notice), after which training exits.
+
+    Use fit() rather than adding the callback to model.fit directly.
+    """
+
+    def __init__(self, path, interval_minutes=10, resume=False, handle_sigterm=True):
+        """
+        Args:
+            path: Checkpoint file
+            interval_minutes: Minutes between checkpoints
+            resume: Continue from an existing checkpoint at path
+            handle_sigterm: Save and exit on SIGTERM
+        """
+        super().__init__()
+        self.path = Path(path)
+        self.interval = interval_minutes * 60
+        self.handle_sigterm = handle_sigterm
+
+        self.state = self._load() if resume else None
+        if resume and self.state is None:
+            print(f"No training state at {self.path}, starting from scratch")
+        elif self.state is not None:
+            print(f"Resuming from {self.path} (phase '{self.state['phase']}', "
+                  f"{self.state['epoch']} epochs + {self.state['batch']} batches)")
+
+        self.completed_phases = dict(self.state['completed_phases']) if self.state else {}
+
+        self.phase = None
+        self.sequence = None
+        self.tracked = []
+        self.history = {}
+        self.epoch = 0
+        self.batch = 0
+
+        self._pending_callbacks = None
+        self._pending_metrics = None
+        self._last_save = None
+        self._preempted = False
+        self._previous_handler = None
+
+    def _load(self):
+        if not self.path.exists():
+            return None
+        with open(self.path, 'rb') as f:
+            return pickle.load(f)
+
+    # ------------------------------------------------------------------
+    # Capture / restore
+    # ------------------------------------------------------------------
+
+    def _callback_states(self):
+        return [{attr: getattr(cb, attr) for attr in CALLBACK_STATE_ATTRS if hasattr(cb, attr)}
+                for cb in self.tracked]
+
+    def _apply_callback_states(self, states):
+        for cb, cb_state in zip(self.tracked, states):
+            for attr, value in cb_state.items():
+                setattr(cb, attr, value)
+
+    def _capture(self):
+        optimizer = self.model.optimizer
+        learning_rate = optimizer.learning_rate
+        if isinstance(learning_rate, keras.optimizers.schedules.LearningRateSchedule):
+            # Schedules are a function of the (saved) iteration count
+            learning_rate = None
+        else:
+            learning_rate = float(keras.backend.get_value(learning_rate))
+
+        return {
+            'phase': self.phase,
+            'completed_phases': self.completed_phases,
+            'epoch': self.epoch,
+            'batch': self.batch,
+            'weights': self.model.get_weights(),
+            # Running epoch metrics (sums and counts), needed mid-epoch only
+            'metrics': [v.numpy() for m in self.model.metrics for v in m.variables] if self.batch else [],
+            'optimizer': [v.numpy() for v in optimizer.variables],
+            'learning_rate': learning_rate,
+            'numpy_rng': np.random.get_state(),
+            'python_rng': random.getstate(),
+            'callbacks': self._callback_states(),
+            'history': self.history,
+            'saved_at': time.time(),
+        }
+
+    def _restore(self, state):
+        """Restore model, optimizer, RNG and cursor from a state of this phase."""
+        self.model.set_weights(state['weights'])
+
+        optimizer = self.model.optimizer
+        optimizer.build(self.model.trainable_variables)
+        if len(optimizer.variables) == len(state['optimizer']):
+            for variable, value in zip(optimizer.variables, state['optimizer']):
+                variable.assign(value)
+        else:
+            print("Optimizer state does not match the model; optimizer restarts")
+        if state['learning_rate'] is not None:
+            keras.backend.set_value(optimizer.learning_rate, state['learning_rate'])
+
+        np.random.set_state(state['numpy_rng'])
+        random.setstate(state['python_rng'])
+
+        self.epoch, self.batch = state['epoch'], state['batch']
+        self.history = {key: list(values) for key, values in state['history'].items()}
+        self._pending_callbacks = state['callbacks']
+        self._pending_metrics = state['metrics'] or None
+
+    def save(self):
+        """Write the current training state (atomically)."""
+        state = self._capture()
+        _atomic_write(self.path, lambda f: pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL))
+        self._last_save = time.monotonic()
+        print(f"\nTraining state saved to: {self.path} ({self.epoch} epochs + {self.batch} batches)")
+
+    # ------------------------------------------------------------------
+    # Training
+    # ------------------------------------------------------------------
+
+    def fit(self, model, sequence, epochs, phase='train', callbacks=(), **fit_kwargs):
+        """
+        model.fit with resumable training state.
+
+        Args:
+            model: Compiled Keras model
+            sequence: EpochOrderSequence with the training data
+            epochs: Total number of epochs of this phase
+            phase: Phase name (distinct per fit call of a multi-phase run)
+            callbacks: Other Keras callbacks; their progress is checkpointed too
+            **fit_kwargs: Passed to model.fit (validation_data, class_weight, ...)
+
+        Returns:
+            History of the whole phase (including epochs before a resume)
+        """
+        self.model = model
+        self.phase = phase
+        self.sequence = sequence
+        self.tracked = list(callbacks)
+        self.history = {}
+        self.epoch, self.batch = 0, 0
+        self._pending_callbacks = None
+        self._pending_metrics = None
+
+        history = keras.callbacks.History()
+        history.set_model(model)
+
+        if phase in self.completed_phases:
+            print(f"Phase '{phase}' already completed, skipping")
+            if self.state is not None:
+                model.set_weights(self.state['weights'])
+            history.history = self.completed_phases[phase]
+            history.epoch = list(range(len(next(iter(history.history.values()), []))))
+            return history
+
+        if self.state is not None and self.state['phase'] == phase:
+            self._restore(self.state)
+        sequence.epoch, sequence.start_batch = self.epoch, self.batch
+
+        callbacks = self.tracked + [self]  # last: restores the others after their reset
+        fit_kwargs = dict(fit_kwargs, shuffle=False)
+
+        if self.batch and self.epoch < epochs:
+            # Finish the interrupted epoch, then continue with full epochs
+            model.fit(sequence, initial_epoch=self.epoch, epochs=self.epoch + 1,
+                      callbacks=callbacks, **fit_kwargs)
+            if not model.stop_training:
+                model.fit(sequence, initial_epoch=self.epoch, epochs=epochs,
+                          callbacks=callbacks, **fit_kwargs)
+        elif self.epoch < epochs:
+            model.fit(sequence, initial_epoch=self.epoch, epochs=epochs,
+                      callbacks=callbacks, **fit_kwargs)
+
+        self.completed_phases[phase] = self.history
+        self.save()
+        self.state = None
+
+        history.history = self.history
+        history.epoch = list(range(len(next(iter(self.history.values()), []))))
+        return history
+
+    def _on_sigterm(self, signum, frame):
+        self._preempted = True
+
+    def on_train_begin(self, logs=None):
+        if self._pending_callbacks is not None:
+            self._apply_callback_states(self._pending_callbacks)
+            self._pending_callbacks = None
+        self._last_save = time.monotonic()
+
+        if self.handle_sigterm and threading.current_thread() is threading.main_thread():
+            self._previous_handler = signal.signal(signal.SIGTERM, self._on_sigterm)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self.batch = self.sequence.start_batch
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.batch = self.sequence.start_batch + batch + 1
+
+        if self._pending_metrics is not None:
+            # Keras metric states are running sums (built on the first
+            # step), so adding the saved totals makes the resumed epoch
+            # report the same loss/metrics as an uninterrupted one
+            variables = [v for m in self.model.metrics for v in m.variables]
+            if len(variables) == len(self._pending_metrics):
+                for variable, value in zip(variables, self._pending_metrics):
+                    variable.assign_add(value)
+            self._pending_metrics = None
+
+        if self._preempted:
+            self.save()
+            print("Preempted: rerun with --resume to continue")
+            raise SystemExit(128 + signal.SIGTERM)
+
+        if time.monotonic() - self._last_save >= self.interval:
+            self.save()
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+        self.epoch, self.batch = epoch + 1, 0
+
+        if time.monotonic() - self._last_save >= self.interval:
+            self.save()
+
+    def on_train_end(self, logs=None):
+        # Carry callback progress into the next fit call of this phase
+        self._pending_callbacks = self._callback_states()
+
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGTERM, self._previous_handler)
+            self._previous_handler = None
@@ -0,0 +1,498 @@
+"""
+RayScan ML Model - Knowledge Distillation
+Train a compact CPU student on the soft probabilities of a VGG16 teacher
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+import cv2
+import tensorflow as tf
+from pathlib import Path
+from tensorflow import keras
+from tensorflow.keras import layers
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, recall_score, roc_auc_score
+
+from preprocessing import UltrasoundPreprocessor, gray_to_rgb
+from models import EndToEndCNN, HybridClassifier
+from feature_store import FeatureStore
+
+
+def _file_hash(paths):
+    """Hash the bytes of model files (identifies a trained teacher)."""
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _positive_proba(output):
+    """Probability of the positive class from a sigmoid or softmax output."""
+    output = np.asarray(output)
+    if output.ndim == 1:
+        return output
+    return output[:, -1]
+
+
+class Teacher:
+    """
+    Wraps a trained VGG16 model (HybridClassifier or fine-tuned Keras model)
+    as a source of positive-class probabilities on 3-channel images.
+    """
+
+    def __init__(self, kind, path, classifier='xgboost'):
+        """
+        Load the teacher.
+
+        Args:
+            kind: 'hybrid' (VGG16 + XGBoost/RF directory saved by train.py)
+                  or 'keras' (e.g. vgg16_best.keras from train_vgg16_model.py)
+            path: Model directory or .keras file
+            classifier: Classifier type of a hybrid teacher
+        """
+        self.kind = kind
+        self.path = Path(path)
+
+        if kind == 'hybrid':
+            self.hybrid = HybridClassifier(feature_extractor='vgg16', classifier=classifier)
+            self.hybrid.load(str(self.path))
+            self.model = self.hybrid.feature_extractor.model
+            files = [
+                self.path / 'vgg16_feature_extractor.keras',
+                self.path / f'{classifier}_classifier.pkl'
+            ]
+        else:
+            self.model = keras.models.load_model(str(self.path))
+            files = [self.path]
+
+        self.size_mb = sum(os.path.getsize(f) for f in files) / (1024 * 1024)
+        self.fingerprint = f"teacher={kind}:{_file_hash(files)}"
+
+    def predict_proba(self, images):
+        """Positive-class probability for a batch of images, shape (N, 1)."""
+        if self.kind == 'hybrid':
+            features = self.hybrid.feature_extractor.extract_features(images)
+            proba = self.hybrid.classifier.predict_proba(features)
+        else:
+            proba = self.model.predict(images, verbose=0)
+        return _positive_proba(proba).reshape(-1, 1).astype(np.float32)
+
+    def soft_probabilities(self, images, feature_store=None, preprocessing_fingerprint=''):
+        """
+        Teacher probabilities for all images, computed once and cached.
+
+        Args:
+            images: 3-channel teacher inputs
+            feature_store: Optional FeatureStore for the cached probabilities
+            preprocessing_fingerprint: Preprocessing identifier for the cache key
+
+        Returns:
+            Positive-class probabilities (N,)
+        """
+        if feature_store is None:
+            return self.predict_proba(images)[:, 0]
+
+        proba = feature_store.get_or_extract(
+            self.model, images, self.predict_proba,
+            preprocessing_fingerprint=f"{preprocessing_fingerprint}|{self.fingerprint}",
+            batch_size=256
+        )
+        return np.asarray(proba)[:, 0]
+
+
+def soften(proba, temperature=1.0, eps=1e-6):
+    """
+    Soften binary probabilities by dividing their logits by a temperature.
+
+    Args:
+        proba: Positive-class probabilities
+        temperature: Temperature (> 1 gives softer targets)
+
+    Returns:
+        Softened probabilities
+    """
+    proba = np.clip(proba, eps, 1 - eps)
+    logits = np.log(proba) - np.log1p(-proba)
+    return 1.0 / (1.0 + np.exp(-logits / temperature))
+
+
+def distillation_targets(y, teacher_proba, temperature=2.0):
+    """
+    Pair the hard labels with the softened teacher probabilities.
+
+    Args:
+        y: Hard labels
+        teacher_proba: Teacher positive-class probabilities
+        temperature: Softening temperature for the teacher
+
+    Returns:
+        Float targets (N, 2): hard label, softened teacher probability
+    """
+    soft = soften(teacher_proba, temperature)
+    return np.stack([y, soft], axis=1).astype(np.float32)
+
+
+class DistillationLoss(keras.losses.Loss):
+    """
+    Hinton-style distillation loss for a sigmoid student.
+
+    alpha * BCE(y, p) + (1 - alpha) * T^2 * BCE(teacher_T, p_T), where p_T
+    is the student's probability with its logit divided by T, the same
+    temperature as the teacher targets. T only applies during training:
+    the student's own output (T = 1) stays calibrated to the hard labels.
+    The T^2 factor keeps the soft term's gradients on the same scale as
+    the hard term's.
+    """
+
+    def __init__(self, alpha=0.3, temperature=2.0, eps=1e-6, name='distillation_loss'):
+        """
+        Args:
+            alpha: Weight of the hard-label loss
+            temperature: Temperature of the soft targets and student logits
+            eps: Probability clipping before taking logits
+        """
+        super().__init__(name=name)
+        self.alpha = alpha
+        self.temperature = temperature
+        self.eps = eps
+
+    def call(self, y_true, y_pred):
+        hard, soft = y_true[:, :1], y_true[:, 1:2]
+        proba = tf.clip_by_value(y_pred, self.eps, 1 - self.eps)
+        logits = tf.math.log(proba) - tf.math.log1p(-proba)
+
+        hard_loss = keras.losses.binary_crossentropy(hard, proba)
+        soft_loss = keras.losses.binary_crossentropy(soft, tf.sigmoid(logits / self.temperature))
+        return self.alpha * hard_loss + (1 - self.alpha) * self.temperature ** 2 * soft_loss
+
+
+def thresholded_accuracy(y_true, y_pred):
+    """Accuracy of the predictions against the hard labels (first target column)."""
+    return tf.reduce_mean(tf.cast(
+        tf.equal(y_true[:, :1] > 0.5, y_pred > 0.5), tf.float32
+    ))
+
+
+def build_mobilenet_student(input_size=150, alpha=0.35, weights='imagenet'):
+    """
+    MobileNetV2 student on 3-channel [0, 1] images.
+
+    Rescaling to [-1, 1] is part of the model, so the saved artifact takes
+    the same inputs as the rest of the pipeline.
+
+    Args:
+        input_size: Input side length
+        alpha: MobileNetV2 width multiplier
+        weights: 'imagenet' or None
+
+    Returns:
+        Keras model with a single sigmoid output
+    """
+    base = keras.applications.MobileNetV2(
+        include_top=False,
+        input_shape=(input_size, input_size, 3),
+        alpha=alpha,
+        weights=weights
+    )
+
+    inputs = keras.Input(shape=(input_size, input_size, 3))
+    x = layers.Rescaling(2.0, offset=-1.0)(inputs)
+    x = base(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(0.3)(x)
+    outputs = layers.Dense(1, activation='sigmoid')(x)
+
+    return keras.Model(inputs, outputs, name=f'mobilenetv2_{input_size}_student')
+
+
+def build_student(student='cnn', width_multiplier=0.25, input_size=150, weights='imagenet'):
+    """
+    Build the student model.
+
+    Args:
+        student: 'cnn' (narrow EndToEndCNN on grayscale) or 'mobilenetv2'
+        width_multiplier: Width of the EndToEndCNN student
+        input_size: Input side length of the MobileNetV2 student
+        weights: Initial MobileNetV2 weights
+
+    Returns:
+        Keras model (compiled for distillation by train_student)
+    """
+    if student == 'cnn':
+        return EndToEndCNN(input_shape=(224, 224, 1), width_multiplier=width_multiplier).model
+    return build_mobilenet_student(input_size, weights=weights)
+
+
+def prepare_student_inputs(X_gray, student='cnn', input_size=150):
+    """
+    Convert grayscale preprocessed images to the student's input format.
+
+    Args:
+        X_gray: Grayscale images (N, H, W, 1)
+        student: 'cnn' or 'mobilenetv2'
+        input_size: MobileNetV2 input side length
+
+    Returns:
+        Student inputs
+    """
+    if student == 'cnn':
+        return X_gray
+
+    resized = np.empty((len(X_gray), input_size, input_size, 1), dtype=np.float32)
+    for i, img in enumerate(X_gray):
+        resized[i, ..., 0] = cv2.resize(img, (input_size, input_size), interpolation=cv2.INTER_AREA)
+    return gray_to_rgb(resized)
+
+
+def train_student(model, X_train, t_train, X_val, t_val, epochs=30, batch_size=32, alpha=0.3,
+                  temperature=2.0, checkpoint_path='../models/distilled_student.keras'):
+    """
+    Fit the student with the distillation loss.
+
+    val_thresholded_accuracy is measured against the hard labels, so it
+    is the student's real validation accuracy.
+
+    Args:
+        model: Student model
+        X_train: Student training inputs
+        t_train: Distillation targets (see distillation_targets)
+        X_val, t_val: Validation inputs and distillation targets
+        epochs: Number of epochs
+        batch_size: Batch size
+        alpha: Weight of the hard-label loss
+        temperature: Distillation temperature (same as the targets')
+        checkpoint_path: Where the best student is saved
+
+    Returns:
+        Training history
+    """
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=0.001),
+        loss=DistillationLoss(alpha, temperature),
+        metrics=[thresholded_accuracy]
+    )
+
+    callbacks = [
+        EarlyStopping(
+            monitor='val_loss',
+            patience=8,
+            restore_best_weights=True
+        ),
+        ReduceLROnPlateau(
+            monitor='val_loss',
+            factor=0.5,
+            patience=4,
+            min_lr=1e-7
+        ),
+        ModelCheckpoint(
+            checkpoint_path,
+            monitor='val_thresholded_accuracy',
+            save_best_only=True
+        )
+    ]
+
+    return model.fit(
+        X_train, t_train,
+        validation_data=(X_val, t_val),
+        epochs=epochs,
+        batch_size=batch_size,
+        callbacks=callbacks
+    )
+
+
+def latency_per_image(predict_fn, images, runs=30, warmup=3):
+    """
+    Median single-image latency of a prediction function.
+
+    Args:
+        predict_fn: Function taking a batch of one image
+        images: Sample images to cycle through
+        runs: Timed runs
+        warmup: Untimed warm-up runs
+
+    Returns:
+        Median latency in milliseconds
+    """
+    for i in range(warmup):
+        predict_fn(images[i % len(images)][np.newaxis])
+
+    timings = []
+    for i in range(runs):
+        x = images[i % len(images)][np.newaxis]
+        start = time.perf_counter()
+        predict_fn(x)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings))
+
+
+def compare_teacher_student(teacher, student, X_teacher, X_student, y):
+    """
+    Report accuracy, agreement, latency and size of teacher and student.
+
+    Args:
+        teacher: Teacher
+        student: Trained student Keras model
+        X_teacher: Teacher inputs (3-channel)
+        X_student: Student inputs
+        y: Hard labels
+
+    Returns:
+        Report dictionary
+    """
+    teacher_proba = teacher.predict_proba(X_teacher)[:, 0]
+    student_proba = student.predict(X_student, verbose=0).ravel()
+    teacher_pred = (teacher_proba > 0.5).astype(int)
+    student_pred = (student_proba > 0.5).astype(int)
+
+    student_fn = lambda x: student(x, training=False)
+    report = {
+        'teacher': {
+            'accuracy': float(accuracy_score(y, teacher_pred)),
+            'recall': float(recall_score(y, teacher_pred)),
+            'auc': float(roc_auc_score(y, teacher_proba)),
+            'latency_ms': latency_per_image(teacher.predict_proba, X_teacher),
+            'size_mb': teacher.size_mb,
+        },
+        'student': {
+            'accuracy': float(accuracy_score(y, student_pred)),
+            'recall': float(recall_score(y, student_pred)),
+            'auc': float(roc_auc_score(y, student_proba)),
+            'latency_ms': latency_per_image(student_fn, X_student),
+            'params': int(student.count_params()),
+        },
+        'agreement': float(np.mean(teacher_pred == student_pred)),
+        'mean_abs_proba_diff': float(np.mean(np.abs(teacher_proba - student_proba))),
+    }
+    report['speedup'] = report['teacher']['latency_ms'] / report['student']['latency_ms']
+
+    return report
+
+
+def print_report(report):
+    """Print the teacher vs student comparison."""
+    t, s = report['teacher'], report['student']
+    print("\n📊 Teacher vs Student (test set):")
+    print(f"   {'':<10}{'Accuracy':>10}{'Recall':>9}{'AUC':>8}{'Latency (ms)':>14}{'Size (MB)':>11}")
+    print(f"   {'Teacher':<10}{t['accuracy']:>10.4f}{t['recall']:>9.4f}{t['auc']:>8.4f}"
+          f"{t['latency_ms']:>14.2f}{t['size_mb']:>11.2f}")
+    print(f"   {'Student':<10}{s['accuracy']:>10.4f}{s['recall']:>9.4f}{s['auc']:>8.4f}"
+          f"{s['latency_ms']:>14.2f}{s['size_mb']:>11.2f}")
+    print(f"\n   Agreement: {report['agreement']:.4f}  "
+          f"Mean |p_teacher - p_student|: {report['mean_abs_proba_diff']:.4f}  "
+          f"Speedup: {report['speedup']:.1f}x")
+
+
+def main(args):
+    """Distill the teacher into a student on the processed dataset."""
+    from train import load_dataset
+
+    models_dir = Path(args.output_dir)
+    models_dir.mkdir(parents=True, exist_ok=True)
+
+    preprocessor = UltrasoundPreprocessor(target_size=(224, 224))
+    X, y = load_dataset(args.data_dir, preprocessor)
+    X_rgb = gray_to_rgb(X)
+
+    # Same split as train.py
+    idx = np.arange(len(y))
+    train_idx, temp_idx = train_test_split(idx, test_size=0.3, stratify=y, random_state=42)
+    val_idx, test_idx = train_test_split(temp_idx, test_size=0.5, stratify=y[temp_idx], random_state=42)
+
+    print(f"\n🎓 Loading {args.teacher} teacher from {args.teacher_path}...")
+    teacher = Teacher(args.teacher, args.teacher_path, classifier=args.teacher_classifier)
+
+    feature_store = FeatureStore(args.feature_cache) if args.feature_cache else None
+    teacher_proba = teacher.soft_probabilities(
+        X_rgb, feature_store, preprocessing_fingerprint=preprocessor.fingerprint(for_vgg=True)
+    )
+
+    targets = distillation_targets(y, teacher_proba, args.temperature)
+
+    print(f"\n🧪 Training {args.student} student...")
+    X_student = prepare_student_inputs(X, args.student, args.input_size)
+    student = build_student(args.student, args.width_multiplier, args.input_size)
+
+    name = (f'distilled_cnn_w{args.width_multiplier:g}' if args.student == 'cnn'
+            else f'distilled_mobilenetv2_{args.input_size}')
+    student_path = models_dir / f'{name}.keras'
+
+    train_student(
+        student,
+        X_student[train_idx], targets[train_idx],
+        X_student[val_idx], targets[val_idx],
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        alpha=args.alpha,
+        temperature=args.temperature,
+        checkpoint_path=str(student_path)
+    )
+
+    # Standard metrics only, so the artifact loads without this module
+    student.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    student.save(str(student_path))
+
+    report = compare_teacher_student(
+        teacher, student, X_rgb[test_idx], X_student[test_idx], y[test_idx]
+    )
+    report['student']['size_mb'] = os.path.getsize(student_path) / (1024 * 1024)
+    report['config'] = {
+        'teacher': args.teacher,
+        'student': args.student,
+        'alpha': args.alpha,
+        'temperature': args.temperature,
+        'width_multiplier': args.width_multiplier,
+        'input_size': args.input_size,
+    }
+
+    print_report(report)
+
+    report_path = models_dir / f'{name}_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nStudent saved to: {student_path}")
+    print(f"Report saved to: {report_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Distill a VGG16 teacher into a compact student')
+    parser.add_argument('--data_dir', type=str, default='../data/processed',
+                       help='Path to processed dataset')
+    parser.add_argument('--teacher', type=str, default='hybrid',
+                       choices=['hybrid', 'keras'],
+                       help='Teacher type: VGG16 hybrid directory or fine-tuned VGG16 .keras file')
+    parser.add_argument('--teacher_path', type=str, default='../models/vgg16_xgboost',
+                       help='Teacher model directory or .keras file')
+    parser.add_argument('--teacher_classifier', type=str, default='xgboost',
+                       choices=['xgboost', 'random_forest'],
+                       help='Classifier of a hybrid teacher')
+    parser.add_argument('--student', type=str, default='cnn',
+                       choices=['cnn', 'mobilenetv2'],
+                       help='Student architecture')
+    parser.add_argument('--width_multiplier', type=float, default=0.25,
+                       help='Width of the EndToEndCNN student')
+    parser.add_argument('--input_size', type=int, default=150,
+                       help='Input size of the MobileNetV2 student')
+    parser.add_argument('--alpha', type=float, default=0.3,
+                       help='Weight of the hard-label loss in the distillation loss')
+    parser.add_argument('--temperature', type=float, default=2.0,
+                       help='Distillation temperature (teacher targets and student logits)')
+    parser.add_argument('--epochs', type=int, default=30,
+                       help='Number of training epochs')
+    parser.add_argument('--batch_size', type=int, default=32,
+                       help='Batch size')
+    parser.add_argument('--feature_cache', type=str, default='../models/feature_cache',
+                       help='Directory for cached teacher probabilities (empty to disable)')
+    parser.add_argument('--output_dir', type=str, default='../models',
+                       help='Directory for the student and report')
+
+    args = parser.parse_args()
+    main(args)
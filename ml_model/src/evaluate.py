@@ -4,15 +4,342 @@ Comprehensive evaluation for kidney stone detection model
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from sklearn.metrics import (
     accuracy_score, precision_score, recall_score, f1_score,
-    roc_auc_score, roc_curve, precision_recall_curve, average_precision_score,
+    roc_auc_score, average_precision_score,
     confusion_matrix, classification_report
 )
 from pathlib import Path
 
+from report_renderer import (
+    new_figure, finish_figure, render_figures,
+    confusion_matrix_figure, roc_figure, pr_figure, threshold_figure
+)
+
+
+def _safe_divide(numerator, denominator):
+    """Elementwise division with 0 where the denominator is 0 (zero_division=0)."""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def threshold_sweep(y_true, y_score, thresholds=None):
+    """
+    Confusion counts and metrics at many thresholds in O(n log n).
+
+    Scores are sorted once; the number of true positives among the k
+    highest scores is a cumulative sum, so each threshold (predict
+    positive when score >= threshold) is a binary search instead of a
+    pass over the data.
+
+    Args:
+        y_true: Binary labels
+        y_score: Positive-class scores
+        thresholds: Threshold grid; None uses every unique score
+                    (descending), i.e. every distinct operating point
+
+    Returns:
+        Dictionary of arrays aligned with 'thresholds': tp, fp, tn, fn,
+        precision, recall (= tpr), specificity, fpr, f1, accuracy
+    """
+    y_true = np.asarray(y_true).ravel().astype(int)
+    y_score = np.asarray(y_score, dtype=float).ravel()
+
+    order = np.argsort(-y_score, kind='mergesort')
+    sorted_scores = y_score[order]
+    cum_tp = np.concatenate([[0], np.cumsum(y_true[order])])
+
+    if thresholds is None:
+        # Last index of each run of tied scores
+        distinct = np.r_[np.flatnonzero(np.diff(sorted_scores)), len(sorted_scores) - 1]
+        thresholds = sorted_scores[distinct]
+    thresholds = np.asarray(thresholds, dtype=float)
+
+    # Number of scores >= threshold (scores are descending, so search on -score)
+    n_predicted = np.searchsorted(-sorted_scores, -thresholds, side='right')
+
+    positives = cum_tp[-1]
+    negatives = len(y_true) - positives
+
+    tp = cum_tp[n_predicted]
+    fp = n_predicted - tp
+    fn = positives - tp
+    tn = negatives - fp
+
+    precision = _safe_divide(tp, tp + fp)
+    recall = _safe_divide(tp, positives)
+
+    return {
+        'thresholds': thresholds,
+        'tp': tp,
+        'fp': fp,
+        'tn': tn,
+        'fn': fn,
+        'precision': precision,
+        'recall': recall,
+        'tpr': recall,
+        'specificity': _safe_divide(tn, negatives),
+        'fpr': _safe_divide(fp, negatives),
+        'f1': _safe_divide(2 * precision * recall, precision + recall),
+        'accuracy': _safe_divide(tp + tn, len(y_true)),
+    }
+
+
+def _resample_counts(n, n_resamples, rng):
+    """(n_resamples, n) matrix of how often each sample is drawn in a bootstrap resample."""
+    idx = rng.integers(0, n, size=(n_resamples, n))
+    idx += (np.arange(n_resamples) * n)[:, None]
+    return np.bincount(idx.ravel(), minlength=n_resamples * n).reshape(n_resamples, n)
+
+
+def _weighted_auc(weights, y_true, y_score):
+    """
+    Rank-based AUC-ROC for every row of a sample-weight matrix.
+
+    Scores are sorted and grouped into ties once; each resample's AUC is
+    then the weighted count of negatives ranked below each positive (ties
+    count half), from cumulative sums over the tie groups.
+    """
+    order = np.argsort(y_score, kind='mergesort')
+    sorted_scores = y_score[order]
+    group_starts = np.r_[0, np.flatnonzero(np.diff(sorted_scores)) + 1]
+
+    positive = y_true[order] == 1
+    sorted_weights = weights[:, order]
+    pos = np.add.reduceat(sorted_weights * positive, group_starts, axis=1)
+    neg = np.add.reduceat(sorted_weights * ~positive, group_starts, axis=1)
+
+    neg_below = np.cumsum(neg, axis=1) - neg
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (pos * (neg_below + 0.5 * neg)).sum(axis=1) / (pos.sum(axis=1) * neg.sum(axis=1))
+
+
+def bootstrap_confidence_intervals(y_true, y_pred, y_proba, n_resamples=2000, confidence=0.95,
+                                   seed=42, chunk_elements=4_000_000):
+    """
+    Percentile bootstrap confidence intervals for the main metrics.
+
+    All resamples are evaluated at once: a resampling-count matrix turns
+    the confusion counts into matrix-vector products and AUC into a
+    weighted rank computation, with no per-resample metric calls.
+
+    Args:
+        y_true: Binary labels
+        y_pred: Hard predictions
+        y_proba: Positive-class scores
+        n_resamples: Bootstrap resamples
+        confidence: Interval coverage
+        seed: Random seed
+        chunk_elements: Max resample-matrix entries held at once
+
+    Returns:
+        Dictionary of metric name -> {'estimate', 'lower', 'upper'}
+        (metric names as in ModelEvaluator.results)
+    """
+    y_true = np.asarray(y_true).ravel().astype(int)
+    y_pred = np.asarray(y_pred).ravel().astype(int)
+    y_proba = np.asarray(y_proba, dtype=float).ravel()
+    n = len(y_true)
+
+    outcomes = np.stack([
+        (y_true == 1) & (y_pred == 1),  # tp
+        (y_true == 0) & (y_pred == 1),  # fp
+        (y_true == 0) & (y_pred == 0),  # tn
+        (y_true == 1) & (y_pred == 0),  # fn
+    ], axis=1).astype(float)
+
+    def metrics(weights):
+        tp, fp, tn, fn = (weights @ outcomes).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'accuracy': (tp + tn) / (tp + fp + tn + fn),
+                'recall': tp / (tp + fn),  # Sensitivity
+                'specificity': tn / (tn + fp),
+                'f1_score': 2 * tp / (2 * tp + fp + fn),
+                'auc_roc': _weighted_auc(weights, y_true, y_proba),
+            }
+
+    rng = np.random.default_rng(seed)
+    chunk = max(1, chunk_elements // max(n, 1))
+    samples = {}
+    for start in range(0, n_resamples, chunk):
+        for name, values in metrics(_resample_counts(n, min(chunk, n_resamples - start), rng)).items():
+            samples.setdefault(name, []).append(values)
+
+    estimates = metrics(np.ones((1, n)))
+    alpha = (1 - confidence) / 2 * 100
+
+    intervals = {}
+    for name, values in samples.items():
+        values = np.concatenate(values)
+        # Resamples without both classes leave a metric undefined
+        lower, upper = np.nanpercentile(values, [alpha, 100 - alpha])
+        intervals[name] = {
+            'estimate': float(estimates[name][0]),
+            'lower': float(lower),
+            'upper': float(upper),
+        }
+
+    return intervals
+
+
+def _counts_as_samples(tn, fp, fn, tp):
+    """Confusion counts as 4 weighted (y_true, y_pred) samples for sklearn metrics."""
+    return np.array([0, 0, 1, 1]), np.array([0, 1, 0, 1]), np.array([tn, fp, fn, tp])
+
+
+class StreamingEvaluator:
+    """
+    Incremental binary-classification metrics with memory independent of
+    dataset size.
+
+    Keeps the confusion counts of the hard predictions and fixed-bin
+    histograms of the positive-class scores per true class. Threshold
+    metrics at bin edges are exact; AUC-ROC and average precision are
+    approximated by treating the scores in a bin as tied (error shrinks
+    with n_bins).
+    """
+
+    def __init__(self, n_bins=1000):
+        """
+        Initialize accumulators.
+
+        Args:
+            n_bins: Score histogram bins over [0, 1]
+        """
+        self.n_bins = n_bins
+        self.edges = np.linspace(0, 1, n_bins + 1)
+        self.pos_hist = np.zeros(n_bins, dtype=np.int64)
+        self.neg_hist = np.zeros(n_bins, dtype=np.int64)
+        self.counts = np.zeros((2, 2), dtype=np.int64)  # [true, pred]
+
+    def update(self, y_true, y_proba, y_pred=None):
+        """
+        Add a batch.
+
+        Args:
+            y_true: Binary labels
+            y_proba: Positive-class scores in [0, 1]
+            y_pred: Hard predictions (default: y_proba > 0.5)
+        """
+        y_true = np.asarray(y_true).ravel().astype(int)
+        y_proba = np.asarray(y_proba, dtype=float).ravel()
+        y_pred = (y_proba > 0.5).astype(int) if y_pred is None else np.asarray(y_pred).ravel().astype(int)
+
+        bins = np.clip((y_proba * self.n_bins).astype(int), 0, self.n_bins - 1)
+        self.pos_hist += np.bincount(bins[y_true == 1], minlength=self.n_bins)
+        self.neg_hist += np.bincount(bins[y_true == 0], minlength=self.n_bins)
+        self.counts += np.bincount(y_true * 2 + y_pred, minlength=4).reshape(2, 2)
+
+    @property
+    def n_samples(self):
+        """Samples seen so far."""
+        return int(self.counts.sum())
+
+    def confusion_matrix(self):
+        """Confusion matrix of the hard predictions ([[tn, fp], [fn, tp]])."""
+        return self.counts.copy()
+
+    def threshold_sweep(self, thresholds=None):
+        """
+        Confusion counts and metrics across thresholds, from the histograms.
+
+        Args:
+            thresholds: Threshold grid (snapped up to the next bin edge);
+                        None uses every bin edge (descending)
+
+        Returns:
+            Dictionary of arrays, same keys as threshold_sweep
+        """
+        if thresholds is None:
+            thresholds = self.edges[:-1][::-1]
+        thresholds = np.asarray(thresholds, dtype=float)
+
+        # Samples in bins at or above each threshold's bin
+        start = np.searchsorted(self.edges, thresholds - 1e-12, side='left')
+        tp_above = np.r_[np.cumsum(self.pos_hist[::-1])[::-1], 0]
+        fp_above = np.r_[np.cumsum(self.neg_hist[::-1])[::-1], 0]
+
+        positives = self.pos_hist.sum()
+        negatives = self.neg_hist.sum()
+
+        tp = tp_above[start]
+        fp = fp_above[start]
+        fn = positives - tp
+        tn = negatives - fp
+
+        precision = _safe_divide(tp, tp + fp)
+        recall = _safe_divide(tp, positives)
+
+        return {
+            'thresholds': thresholds,
+            'tp': tp,
+            'fp': fp,
+            'tn': tn,
+            'fn': fn,
+            'precision': precision,
+            'recall': recall,
+            'tpr': recall,
+            'specificity': _safe_divide(tn, negatives),
+            'fpr': _safe_divide(fp, negatives),
+            'f1': _safe_divide(2 * precision * recall, precision + recall),
+            'accuracy': _safe_divide(tp + tn, positives + negatives),
+        }
+
+    def auc_roc(self):
+        """AUC-ROC with scores in the same bin counted as ties."""
+        positives, negatives = self.pos_hist.sum(), self.neg_hist.sum()
+        neg_below = np.cumsum(self.neg_hist) - self.neg_hist
+        return float(np.sum(self.pos_hist * (neg_below + 0.5 * self.neg_hist)) / (positives * negatives))
+
+    def average_precision(self):
+        """Average precision over the non-empty bins (descending)."""
+        occupied = (self.pos_hist + self.neg_hist)[::-1] > 0
+        tp = np.cumsum(self.pos_hist[::-1])[occupied]
+        fp = np.cumsum(self.neg_hist[::-1])[occupied]
+
+        recall = tp / self.pos_hist.sum()
+        precision = tp / (tp + fp)
+        return float(np.sum(np.diff(np.r_[0.0, recall]) * precision))
+
+    def classification_report(self, class_names):
+        """Text report in sklearn's classification_report layout, from the counts."""
+        y_true, y_pred, weights = _counts_as_samples(*self.counts.ravel())
+        report = classification_report(y_true, y_pred, sample_weight=weights,
+                                       target_names=class_names, output_dict=True)
+
+        rows = list(class_names) + ['macro avg', 'weighted avg']
+        width = max(len(name) for name in rows)
+
+        def row(name, r):
+            return (f"{name:>{width}} {r['precision']:>10.2f}{r['recall']:>10.2f}"
+                    f"{r['f1-score']:>10.2f}{int(r['support']):>10}")
+
+        lines = [' ' * (width + 1) + ''.join(f'{h:>10}' for h in ('precision', 'recall', 'f1-score', 'support')), '']
+        lines += [row(name, report[name]) for name in class_names]
+        lines.append('')
+        lines.append(f"{'accuracy':>{width}} {'':>20}{report['accuracy']:>10.2f}{self.n_samples:>10}")
+        lines += [row(name, report[name]) for name in ('macro avg', 'weighted avg')]
+
+        return '\n'.join(lines) + '\n'
+
+    def results(self):
+        """Metrics with the same keys as ModelEvaluator.evaluate."""
+        y_true, y_pred, weights = _counts_as_samples(*self.counts.ravel())
+
+        return {
+            'accuracy': accuracy_score(y_true, y_pred, sample_weight=weights),
+            'precision': precision_score(y_true, y_pred, sample_weight=weights),
+            'recall': recall_score(y_true, y_pred, sample_weight=weights),  # Sensitivity
+            'specificity': self.counts[0, 0] / self.counts[0].sum(),
+            'f1_score': f1_score(y_true, y_pred, sample_weight=weights),
+            'auc_roc': self.auc_roc(),
+            'average_precision': self.average_precision(),
+        }
+
 
 class ModelEvaluator:
     """
@@ -30,6 +357,8 @@ class ModelEvaluator:
         self.model = model
         self.class_names = class_names
         self.results = {}
+        self.stream = None
+        self.confidence_intervals = None
 
     def evaluate(self, X_test, y_test):
         """
@@ -43,13 +372,22 @@ class ModelEvaluator:
             Dictionary of metrics
         """
         # Get predictions
-        if hasattr(self.model, 'predict_proba'):
-            y_pred = self.model.predict(X_test)
-            y_proba = self.model.predict_proba(X_test)[:, 1]
-        else:
-            y_proba = self.model.predict(X_test).flatten()
-            y_pred = (y_proba > 0.5).astype(int)
+        y_pred, y_proba = self._predict(X_test)
 
+        return self.evaluate_predictions(y_test, y_pred, y_proba)
+
+    def evaluate_predictions(self, y_test, y_pred, y_proba):
+        """
+        Compute metrics from precomputed predictions (no inference).
+
+        Args:
+            y_test: Test labels
+            y_pred: Hard predictions
+            y_proba: Positive-class probabilities
+
+        Returns:
+            Dictionary of metrics
+        """
         # Calculate metrics
         self.results = {
             'accuracy': accuracy_score(y_test, y_pred),
@@ -65,9 +403,90 @@ class ModelEvaluator:
         self.y_test = y_test
         self.y_pred = y_pred
         self.y_proba = y_proba
+        self._score_sweep = None
+        self.stream = None
+        self.confidence_intervals = None
+
+        return self.results
+
+    def evaluate_generator(self, batches, n_bins=1000):
+        """
+        Evaluate batch by batch with memory independent of dataset size.
+
+        Only confusion counts and score histograms are kept (see
+        StreamingEvaluator), so AUC-ROC, average precision and the curves
+        are histogram approximations; the report and plots work as after
+        evaluate().
+
+        Args:
+            batches: Iterable of (X_batch, y_batch)
+            n_bins: Score histogram bins
+
+        Returns:
+            Dictionary of metrics
+        """
+        stream = StreamingEvaluator(n_bins)
+
+        for X_batch, y_batch in batches:
+            y_pred, y_proba = self._predict(X_batch)
+            stream.update(y_batch, y_proba, y_pred)
+
+            # A HybridClassifier memoizes features per array; drop each
+            # batch's entry so no batch outlives its iteration
+            if hasattr(self.model, 'invalidate_features'):
+                self.model.invalidate_features(X_batch)
+
+        self.results = stream.results()
+
+        # Plots read the accumulators instead of per-sample arrays
+        self.stream = stream
+        self.y_test = self.y_pred = self.y_proba = None
+        self._score_sweep = None
+        self.confidence_intervals = None
 
         return self.results
 
+    def bootstrap_ci(self, n_resamples=2000, confidence=0.95, seed=42):
+        """
+        Bootstrap confidence intervals for accuracy, sensitivity,
+        specificity, F1 and AUC-ROC (see bootstrap_confidence_intervals).
+
+        Args:
+            n_resamples: Bootstrap resamples
+            confidence: Interval coverage
+            seed: Random seed
+
+        Returns:
+            Dictionary of metric name -> {'estimate', 'lower', 'upper'}
+        """
+        if self.stream is not None:
+            raise ValueError("Bootstrap needs per-sample predictions; use evaluate() instead of "
+                             "evaluate_generator()")
+
+        self.confidence_intervals = bootstrap_confidence_intervals(
+            self.y_test, self.y_pred, self.y_proba, n_resamples, confidence, seed
+        )
+        self.confidence_level = confidence
+
+        return self.confidence_intervals
+
+    def _predict(self, X):
+        """Hard predictions and positive-class probabilities."""
+        if hasattr(self.model, 'predict_with_proba'):
+            y_pred, y_proba = self.model.predict_with_proba(X)
+            y_proba = y_proba[:, 1]
+        elif hasattr(self.model, 'predict_proba'):
+            # One pass: hard labels from the probabilities, as HybridClassifier does
+            proba = self.model.predict_proba(X)
+            classes = getattr(self.model, 'classes_', np.arange(proba.shape[1]))
+            y_pred = classes[np.argmax(proba, axis=1)]
+            y_proba = proba[:, 1]
+        else:
+            y_proba = self.model.predict(X).flatten()
+            y_pred = (y_proba > 0.5).astype(int)
+
+        return y_pred, y_proba
+
     def _specificity(self, y_true, y_pred):
         """Calculate specificity (true negative rate)."""
         tn, fp, fn, tp = confusion_matrix(y_true, y_pred).ravel()
@@ -88,8 +507,21 @@ class ModelEvaluator:
         print(f"   AUC-ROC:           {self.results['auc_roc']:.4f}")
         print(f"   Average Precision: {self.results['average_precision']:.4f}")
 
+        if self.confidence_intervals:
+            print(f"\n📏 {self.confidence_level:.0%} Bootstrap Confidence Intervals:")
+            labels = {
+                'accuracy': 'Accuracy', 'recall': 'Sensitivity', 'specificity': 'Specificity',
+                'f1_score': 'F1-Score', 'auc_roc': 'AUC-ROC',
+            }
+            for name, label in labels.items():
+                ci = self.confidence_intervals[name]
+                print(f"   {label + ':':<19}{ci['estimate']:.4f}  [{ci['lower']:.4f}, {ci['upper']:.4f}]")
+
         print("\n📋 Classification Report:")
-        print(classification_report(self.y_test, self.y_pred, target_names=self.class_names))
+        if self.stream is not None:
+            print(self.stream.classification_report(self.class_names))
+        else:
+            print(classification_report(self.y_test, self.y_pred, target_names=self.class_names))
 
         # Medical interpretation
         print("\n🏥 Medical Interpretation:")
@@ -102,169 +534,167 @@ class ModelEvaluator:
             print("\n   ⚠️  WARNING: Recall is below 95%. In medical applications,")
             print("      missing kidney stones (false negatives) can be dangerous.")
 
-    def plot_confusion_matrix(self, save_path=None, figsize=(8, 6)):
-        """Plot confusion matrix with counts and percentages."""
-        cm = confusion_matrix(self.y_test, self.y_pred)
-        cm_normalized = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
-
-        fig, ax = plt.subplots(figsize=figsize)
-
-        # Create annotations with counts and percentages
-        annotations = np.array([[f'{count}\n({pct:.1%})'
-                                for count, pct in zip(row_count, row_pct)]
-                               for row_count, row_pct in zip(cm, cm_normalized)])
-
-        sns.heatmap(cm, annot=annotations, fmt='', cmap='Blues', ax=ax,
-                   xticklabels=self.class_names, yticklabels=self.class_names)
-
-        ax.set_xlabel('Predicted Label', fontsize=12)
-        ax.set_ylabel('True Label', fontsize=12)
-        ax.set_title('Confusion Matrix', fontsize=14)
-
-        plt.tight_layout()
-
-        if save_path:
-            plt.savefig(save_path, dpi=150, bbox_inches='tight')
-            print(f"Confusion matrix saved to: {save_path}")
+    def _confusion_matrix_data(self):
+        """Figure arguments for the confusion matrix."""
+        if self.stream is not None:
+            cm = self.stream.confusion_matrix()
+        else:
+            cm = confusion_matrix(self.y_test, self.y_pred)
 
-        plt.show()
+        return {
+            'cm': cm,
+            'class_names': self.class_names,
+        }
 
-    def plot_roc_curve(self, save_path=None, figsize=(8, 6)):
-        """Plot ROC curve."""
-        fpr, tpr, thresholds = roc_curve(self.y_test, self.y_proba)
+    def threshold_analysis(self, thresholds=None):
+        """
+        Confusion counts and metrics across thresholds (see threshold_sweep).
 
-        fig, ax = plt.subplots(figsize=figsize)
+        Args:
+            thresholds: Threshold grid; None uses every unique score
+                        (every bin edge after evaluate_generator)
 
-        ax.plot(fpr, tpr, 'b-', linewidth=2,
-               label=f'ROC Curve (AUC = {self.results["auc_roc"]:.4f})')
-        ax.plot([0, 1], [0, 1], 'r--', linewidth=1, label='Random Classifier')
+        Returns:
+            Dictionary of metric arrays aligned with 'thresholds'
+        """
+        if self.stream is not None:
+            return self.stream.threshold_sweep(thresholds)
+
+        if thresholds is not None:
+            return threshold_sweep(self.y_test, self.y_proba, thresholds)
+
+        # The all-scores sweep backs the ROC/PR curves and optimal threshold
+        if getattr(self, '_score_sweep', None) is None:
+            self._score_sweep = threshold_sweep(self.y_test, self.y_proba)
+        return self._score_sweep
+
+    def optimal_threshold(self):
+        """Threshold maximizing TPR - FPR (Youden's J) over all unique scores."""
+        sweep = self.threshold_analysis()
+        return float(sweep['thresholds'][np.argmax(sweep['tpr'] - sweep['fpr'])])
+
+    def _roc_data(self):
+        """Figure arguments for the ROC curve, including the optimal threshold."""
+        sweep = self.threshold_analysis()
+
+        # Start the curve at (0, 0): nothing predicted positive
+        fpr = np.r_[0.0, sweep['fpr']]
+        tpr = np.r_[0.0, sweep['tpr']]
+
+        # Operating point maximizing TPR - FPR (Youden's J)
+        optimal_idx = int(np.argmax(tpr[1:] - fpr[1:])) + 1
+
+        return {
+            'fpr': fpr,
+            'tpr': tpr,
+            'auc': self.results['auc_roc'],
+            'optimal_idx': optimal_idx,
+            'optimal_threshold': float(sweep['thresholds'][optimal_idx - 1]),
+        }
 
-        # Highlight operating point
-        optimal_idx = np.argmax(tpr - fpr)
-        optimal_threshold = thresholds[optimal_idx]
-        ax.scatter(fpr[optimal_idx], tpr[optimal_idx], c='green', s=100,
-                  label=f'Optimal Threshold ({optimal_threshold:.3f})', zorder=5)
+    def _pr_data(self):
+        """Figure arguments for the Precision-Recall curve."""
+        sweep = self.threshold_analysis()
 
-        ax.set_xlabel('False Positive Rate (1 - Specificity)', fontsize=12)
-        ax.set_ylabel('True Positive Rate (Sensitivity)', fontsize=12)
-        ax.set_title('Receiver Operating Characteristic (ROC) Curve', fontsize=14)
-        ax.legend(loc='lower right')
-        ax.grid(True, alpha=0.3)
+        # Start the curve at (recall 0, precision 1) like sklearn
+        return {
+            'precision': np.r_[1.0, sweep['precision']],
+            'recall': np.r_[0.0, sweep['recall']],
+            'average_precision': self.results['average_precision'],
+        }
 
-        plt.tight_layout()
+    def _threshold_data(self, thresholds=None):
+        """Figure arguments for the threshold analysis."""
+        if thresholds is None:
+            thresholds = np.linspace(0, 1, 100)
+        sweep = self.threshold_analysis(thresholds)
+
+        # Thresholds where every sample falls in one class are shown as 0
+        n_predicted = sweep['tp'] + sweep['fp']
+        n_samples = sweep['tp'] + sweep['fp'] + sweep['tn'] + sweep['fn']
+        degenerate = (n_predicted == 0) | (n_predicted == n_samples)
+
+        def masked(values):
+            return np.where(degenerate, 0.0, values)
+
+        return {
+            'thresholds': sweep['thresholds'],
+            'precisions': masked(sweep['precision']),
+            'recalls': masked(sweep['recall']),
+            'specificities': masked(sweep['specificity']),
+            'f1s': masked(sweep['f1']),
+        }
 
-        if save_path:
-            plt.savefig(save_path, dpi=150, bbox_inches='tight')
-            print(f"ROC curve saved to: {save_path}")
+    def plot_confusion_matrix(self, save_path=None, figsize=(8, 6), show=True):
+        """Plot confusion matrix with counts and percentages."""
+        fig = confusion_matrix_figure(**self._confusion_matrix_data(), figsize=figsize, interactive=show)
+        finish_figure(fig, save_path, show, 'Confusion matrix')
 
-        plt.show()
+    def plot_roc_curve(self, save_path=None, figsize=(8, 6), show=True):
+        """Plot ROC curve."""
+        data = self._roc_data()
+        fig = roc_figure(**data, figsize=figsize, interactive=show)
+        finish_figure(fig, save_path, show, 'ROC curve')
 
-        return optimal_threshold
+        return data['optimal_threshold']
 
-    def plot_precision_recall_curve(self, save_path=None, figsize=(8, 6)):
+    def plot_precision_recall_curve(self, save_path=None, figsize=(8, 6), show=True):
         """Plot Precision-Recall curve."""
-        precision, recall, thresholds = precision_recall_curve(self.y_test, self.y_proba)
-
-        fig, ax = plt.subplots(figsize=figsize)
-
-        ax.plot(recall, precision, 'b-', linewidth=2,
-               label=f'PR Curve (AP = {self.results["average_precision"]:.4f})')
-
-        ax.set_xlabel('Recall (Sensitivity)', fontsize=12)
-        ax.set_ylabel('Precision', fontsize=12)
-        ax.set_title('Precision-Recall Curve', fontsize=14)
-        ax.legend(loc='lower left')
-        ax.grid(True, alpha=0.3)
-
-        plt.tight_layout()
-
-        if save_path:
-            plt.savefig(save_path, dpi=150, bbox_inches='tight')
-            print(f"PR curve saved to: {save_path}")
+        fig = pr_figure(**self._pr_data(), figsize=figsize, interactive=show)
+        finish_figure(fig, save_path, show, 'PR curve')
 
-        plt.show()
-
-    def plot_threshold_analysis(self, save_path=None, figsize=(10, 6)):
+    def plot_threshold_analysis(self, save_path=None, figsize=(10, 6), show=True):
         """
         Analyze metrics across different thresholds.
         Important for choosing optimal threshold in medical applications.
         """
-        thresholds = np.linspace(0, 1, 100)
-
-        precisions = []
-        recalls = []
-        specificities = []
-        f1s = []
-
-        for thresh in thresholds:
-            y_pred_thresh = (self.y_proba >= thresh).astype(int)
-
-            # Handle edge cases
-            if np.sum(y_pred_thresh) == 0 or np.sum(y_pred_thresh) == len(y_pred_thresh):
-                precisions.append(0)
-                recalls.append(0)
-                specificities.append(0)
-                f1s.append(0)
-                continue
-
-            precisions.append(precision_score(self.y_test, y_pred_thresh, zero_division=0))
-            recalls.append(recall_score(self.y_test, y_pred_thresh, zero_division=0))
-
-            tn, fp, fn, tp = confusion_matrix(self.y_test, y_pred_thresh).ravel()
-            specificities.append(tn / (tn + fp) if (tn + fp) > 0 else 0)
-
-            f1s.append(f1_score(self.y_test, y_pred_thresh, zero_division=0))
-
-        fig, ax = plt.subplots(figsize=figsize)
-
-        ax.plot(thresholds, precisions, 'b-', label='Precision', linewidth=2)
-        ax.plot(thresholds, recalls, 'g-', label='Recall (Sensitivity)', linewidth=2)
-        ax.plot(thresholds, specificities, 'r-', label='Specificity', linewidth=2)
-        ax.plot(thresholds, f1s, 'purple', label='F1-Score', linewidth=2, linestyle='--')
-
-        # Mark current threshold (0.5)
-        ax.axvline(x=0.5, color='gray', linestyle='--', alpha=0.5, label='Default (0.5)')
+        fig = threshold_figure(**self._threshold_data(), figsize=figsize, interactive=show)
+        finish_figure(fig, save_path, show, 'Threshold analysis')
 
-        ax.set_xlabel('Classification Threshold', fontsize=12)
-        ax.set_ylabel('Score', fontsize=12)
-        ax.set_title('Metrics vs Classification Threshold', fontsize=14)
-        ax.legend(loc='center right')
-        ax.grid(True, alpha=0.3)
-
-        plt.tight_layout()
-
-        if save_path:
-            plt.savefig(save_path, dpi=150, bbox_inches='tight')
-            print(f"Threshold analysis saved to: {save_path}")
-
-        plt.show()
-
-    def generate_full_report(self, output_dir='../models/evaluation'):
+    def generate_full_report(self, output_dir='../models/evaluation', parallel=True, max_workers=None,
+                             n_bootstrap=2000):
         """
         Generate complete evaluation report with all plots.
 
+        Curves are computed here; the PNGs are rendered off-screen in a
+        process pool.
+
         Args:
             output_dir: Directory to save all outputs
+            parallel: Render figures in a process pool
+            max_workers: Render processes (default: CPU count)
+            n_bootstrap: Resamples for confidence intervals (0 to skip;
+                         skipped after evaluate_generator)
         """
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
 
         print("\n📊 Generating Full Evaluation Report...")
 
+        if n_bootstrap and self.stream is None:
+            self.bootstrap_ci(n_bootstrap)
+
         # Print metrics
         self.print_report()
 
         # Generate plots
-        self.plot_confusion_matrix(output_path / 'confusion_matrix.png')
-        optimal_threshold = self.plot_roc_curve(output_path / 'roc_curve.png')
-        self.plot_precision_recall_curve(output_path / 'pr_curve.png')
-        self.plot_threshold_analysis(output_path / 'threshold_analysis.png')
+        roc_data = self._roc_data()
+        optimal_threshold = roc_data['optimal_threshold']
+        render_figures([
+            (confusion_matrix_figure, self._confusion_matrix_data(), output_path / 'confusion_matrix.png'),
+            (roc_figure, roc_data, output_path / 'roc_curve.png'),
+            (pr_figure, self._pr_data(), output_path / 'pr_curve.png'),
+            (threshold_figure, self._threshold_data(), output_path / 'threshold_analysis.png'),
+        ], max_workers, parallel)
 
         # Save metrics to JSON
         import json
         metrics_path = output_path / 'metrics.json'
+        metrics = dict(self.results)
+        if self.confidence_intervals:
+            metrics['confidence_intervals'] = self.confidence_intervals
         with open(metrics_path, 'w') as f:
-            json.dump(self.results, f, indent=2)
+            json.dump(metrics, f, indent=2)
 
         print(f"\n✅ Full report saved to: {output_path}")
         print(f"   - Metrics: metrics.json")
@@ -277,25 +707,148 @@ class ModelEvaluator:
         return self.results
 
 
-def compare_models(models_dict, X_test, y_test, save_path=None):
+def _uses_tensorflow(model):
+    """Whether inference runs TensorFlow (Keras models and CNN-based hybrids)."""
+    root_module = type(model).__module__.split('.')[0]
+    return root_module in ('keras', 'tensorflow', 'tf_keras') or hasattr(model, 'feature_extractor')
+
+
+def _prediction_fingerprint(model):
+    """Hash of a model's learned state, for the prediction cache."""
+    import joblib
+    from feature_store import model_fingerprint
+
+    if hasattr(model, 'feature_extractor'):
+        return model_fingerprint(model.feature_extractor.model) + joblib.hash(model.classifier)
+    if hasattr(model, 'get_weights'):
+        return model_fingerprint(model)
+    return joblib.hash(model)
+
+
+def _predict_worker(model, X_spec):
+    """Predict on the shared test set in a pool worker."""
+    from parallel_utils import attach_shared
+    return ModelEvaluator(model)._predict(attach_shared(X_spec))
+
+
+def predict_models(models_dict, X_test, predictions_dir=None, parallel=True, max_workers=None):
+    """
+    Predictions of several models on one test set.
+
+    sklearn/XGBoost models run concurrently in a process pool that reads
+    X_test from shared memory (one copy, no per-task pickling). TensorFlow
+    models run one at a time in this process meanwhile: TF already uses
+    all cores per model, and separate TF processes would each reload the
+    runtime and compete for memory.
+
+    With predictions_dir, predictions are saved per model as
+    {name}.npz and reused when both the model's weights and X_test are
+    unchanged, so later comparisons and ensembles skip inference.
+
+    Args:
+        models_dict: Dictionary of {model_name: model}
+        X_test: Test inputs
+        predictions_dir: Directory for persisted predictions (optional)
+        parallel: Use a process pool for non-TensorFlow models
+        max_workers: Pool size (default: CPU count)
+
+    Returns:
+        Dictionary of {model_name: (y_pred, y_proba)}
+    """
+    import os
+    import multiprocessing as mp
+    from concurrent.futures import ProcessPoolExecutor
+    from feature_store import array_fingerprint
+    from parallel_utils import SharedArray
+
+    predictions, pending, fingerprints = {}, {}, {}
+
+    if predictions_dir is not None:
+        predictions_path = Path(predictions_dir)
+        predictions_path.mkdir(parents=True, exist_ok=True)
+        data_fp = array_fingerprint(X_test)
+
+    for name, model in models_dict.items():
+        if predictions_dir is not None:
+            fingerprints[name] = _prediction_fingerprint(model)
+            cache_file = predictions_path / f'{name}.npz'
+            if cache_file.exists():
+                cached = np.load(cache_file)
+                if str(cached['data_fingerprint']) == data_fp and str(cached['model_fingerprint']) == fingerprints[name]:
+                    predictions[name] = (cached['y_pred'], cached['y_proba'])
+                    print(f"   ♻️  {name}: reusing saved predictions")
+                    continue
+        pending[name] = model
+
+    pool_models = {n: m for n, m in pending.items() if not _uses_tensorflow(m)}
+    tf_models = {n: m for n, m in pending.items() if n not in pool_models}
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(pool_models))
+    if not parallel or max_workers <= 1:
+        tf_models = pending
+        pool_models = {}
+
+    futures = {}
+    shared = SharedArray(X_test) if pool_models else None
+    try:
+        executor = ProcessPoolExecutor(max_workers, mp_context=mp.get_context('spawn')) if pool_models else None
+        try:
+            for name, model in pool_models.items():
+                futures[name] = executor.submit(_predict_worker, model, shared.spec)
+
+            # TF queue runs while the pool works
+            for name, model in tf_models.items():
+                print(f"   🔮 {name}: predicting")
+                predictions[name] = ModelEvaluator(model)._predict(X_test)
+
+            for name, future in futures.items():
+                predictions[name] = future.result()
+                print(f"   🔮 {name}: predicted in worker")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    finally:
+        if shared is not None:
+            shared.close()
+
+    if predictions_dir is not None:
+        for name in pending:
+            y_pred, y_proba = predictions[name]
+            np.savez(predictions_path / f'{name}.npz', y_pred=y_pred, y_proba=y_proba,
+                     data_fingerprint=data_fp, model_fingerprint=fingerprints[name])
+
+    return {name: predictions[name] for name in models_dict}
+
+
+def compare_models(models_dict, X_test, y_test, save_path=None, show=True,
+                   predictions_dir=None, parallel=True, max_workers=None):
     """
     Compare multiple models on the same test set.
 
+    Inference is shared and parallelized by predict_models; metrics are
+    then computed from the predictions.
+
     Args:
         models_dict: Dictionary of {model_name: model}
         X_test, y_test: Test data
         save_path: Path to save comparison plot
+        show: Display the plot (False renders off-screen only)
+        predictions_dir: Directory to persist/reuse per-model predictions
+        parallel: Run sklearn/XGBoost models in a process pool
+        max_workers: Pool size (default: CPU count)
 
     Returns:
         Comparison dataframe
     """
     import pandas as pd
 
+    predictions = predict_models(models_dict, X_test, predictions_dir, parallel, max_workers)
+
     results = []
 
     for name, model in models_dict.items():
         evaluator = ModelEvaluator(model)
-        metrics = evaluator.evaluate(X_test, y_test)
+        metrics = evaluator.evaluate_predictions(y_test, *predictions[name])
         metrics['model'] = name
         results.append(metrics)
 
@@ -306,7 +859,8 @@ def compare_models(models_dict, X_test, y_test, save_path=None):
     print(df.round(4).to_string())
 
     # Plot comparison
-    fig, ax = plt.subplots(figsize=(12, 6))
+    fig = new_figure((12, 6), interactive=show)
+    ax = fig.subplots()
 
     metrics_to_plot = ['accuracy', 'precision', 'recall', 'f1_score', 'auc_roc']
     x = np.arange(len(metrics_to_plot))
@@ -324,13 +878,8 @@ def compare_models(models_dict, X_test, y_test, save_path=None):
     ax.set_ylim(0, 1)
     ax.grid(True, alpha=0.3, axis='y')
 
-    plt.tight_layout()
-
-    if save_path:
-        plt.savefig(save_path, dpi=150, bbox_inches='tight')
-        print(f"Comparison plot saved to: {save_path}")
-
-    plt.show()
+    fig.tight_layout()
+    finish_figure(fig, save_path, show, 'Comparison plot')
 
     return df
 
@@ -11,6 +11,98 @@ from pathlib import Path
 import json
 
 
+class RepresentativeDataset:
+    """
+    Stream stratified, shuffled calibration images from the dataset on disk.
+
+    Only file paths are kept in memory; images are read and preprocessed
+    one at a time as the converter asks for them. Instances are picklable,
+    so they can be sent to conversion worker processes.
+    """
+
+    def __init__(self, data_dir, num_samples=300, target_size=(224, 224), for_vgg=False,
+                 train_only=True, seed=42):
+        """
+        Initialize representative dataset.
+
+        Args:
+            data_dir: Dataset directory with stone/ and normal/ subdirs
+            num_samples: Number of calibration images
+            target_size: Preprocessing target size
+            for_vgg: Whether to prepare 3-channel VGG16 inputs
+            train_only: Sample only from the training split used by train.py,
+                        so test images are never used for calibration
+            seed: Sampling seed
+        """
+        from sklearn.model_selection import train_test_split
+        from preprocessing import list_dataset_files
+
+        # Same readable-file list as train.load_dataset, so the split
+        # indices below match train.py's split of the loaded arrays
+        files, labels = list_dataset_files(data_dir)
+        files = [str(f) for f in files]
+
+        if not files:
+            raise ValueError(f"No images found in {data_dir}")
+
+        labels = np.array(labels)
+        indices = np.arange(len(files))
+        if train_only and len(np.unique(labels)) > 1:
+            indices, _ = train_test_split(indices, test_size=0.3, stratify=labels, random_state=42)
+
+        # Stratified sample: each class in proportion, at least one image
+        rng = np.random.default_rng(seed)
+        num_samples = min(num_samples, len(indices))
+        chosen = []
+        for label in np.unique(labels[indices]):
+            class_idx = indices[labels[indices] == label]
+            n = max(1, int(round(num_samples * len(class_idx) / len(indices))))
+            chosen.extend(rng.choice(class_idx, min(n, len(class_idx)), replace=False))
+        chosen = rng.permutation(chosen)
+
+        self.files = [files[i] for i in chosen]
+        self.labels = labels[chosen]
+        self.target_size = tuple(target_size)
+        self.for_vgg = for_vgg
+
+    def __len__(self):
+        return len(self.files)
+
+    def __call__(self):
+        """Yield one preprocessed image per step, as the TFLite converter expects."""
+        from preprocessing import UltrasoundPreprocessor
+
+        preprocessor = UltrasoundPreprocessor(target_size=self.target_size)
+        for path in self.files:
+            try:
+                if self.for_vgg:
+                    img = preprocessor.preprocess_for_vgg(path)
+                else:
+                    img = preprocessor.preprocess_single(path)[..., np.newaxis]
+            except ValueError:
+                continue  # file changed since it was listed
+            yield [img[np.newaxis].astype(np.float32)]
+
+
+def _representative_generator(representative_data, num_samples=100, seed=42):
+    """
+    Calibration generator for a RepresentativeDataset or an in-memory array.
+
+    Arrays are sampled in shuffled order, since label-sorted arrays would
+    otherwise calibrate on a single class.
+    """
+    if callable(representative_data):
+        return representative_data
+
+    def representative_dataset():
+        rng = np.random.default_rng(seed)
+        count = min(num_samples, len(representative_data))
+        for i in rng.choice(len(representative_data), count, replace=False):
+            yield [representative_data[i:i+1].astype(np.float32)]
+
+    return representative_dataset
+
+
 class TFLiteExporter:
     """
     Export Keras models to TensorFlow Lite format for mobile deployment.
@@ -85,14 +177,16 @@ class TFLiteExporter:
 
         return size_mb
 
-    def export_int8_full(self, output_path, representative_data):
+    def export_int8_full(self, output_path, representative_data, num_samples=100):
         """
         Full INT8 quantization with representative dataset.
         Smallest size, best for mobile CPU.
 
         Args:
             output_path: Path to save .tflite file
-            representative_data: Sample of training data for calibration
+            representative_data: RepresentativeDataset streaming from disk,
+                                 or an array of training samples
+            num_samples: Calibration samples drawn from an array
 
         Returns:
             Model size in MB
@@ -101,12 +195,7 @@ class TFLiteExporter:
         converter.optimizations = [tf.lite.Optimize.DEFAULT]
 
         # Representative dataset generator
-        def representative_dataset():
-            for i in range(min(100, len(representative_data))):
-                sample = representative_data[i:i+1].astype(np.float32)
-                yield [sample]
-
-        converter.representative_dataset = representative_dataset
+        converter.representative_dataset = _representative_generator(representative_data, num_samples)
         converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
         converter.inference_input_type = tf.uint8
         converter.inference_output_type = tf.uint8
@@ -121,108 +210,308 @@ class TFLiteExporter:
 
         return size_mb
 
-    def verify_model(self, tflite_path, test_images, expected_outputs=None):
+    def export_qat_int8(self, output_path, representative_data=None, num_samples=100):
+        """
+        Full INT8 export of a quantization-aware trained model.
+
+        Quantization ranges were learned by the fake-quant nodes during
+        training, so no calibration is needed; representative_data is only
+        used for ops QAT did not cover.
+
+        Args:
+            output_path: Path to save .tflite file
+            representative_data: Optional RepresentativeDataset or sample array
+            num_samples: Calibration samples drawn from an array
+
+        Returns:
+            Model size in MB
+        """
+        converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        if representative_data is not None:
+            converter.representative_dataset = _representative_generator(representative_data, num_samples)
+
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+
+        tflite_model = converter.convert()
+
+        with open(output_path, 'wb') as f:
+            f.write(tflite_model)
+
+        size_mb = len(tflite_model) / (1024 * 1024)
+        print(f"QAT INT8 TFLite model: {output_path} ({size_mb:.2f} MB)")
+
+        return size_mb
+
+    def verify_model(self, tflite_path, test_images, expected_outputs=None, test_labels=None,
+                     batch_size=32, num_threads=None):
         """
-        Verify TFLite model produces correct outputs.
+        Verify TFLite model outputs and accuracy against Keras on a test set.
+
+        The whole test set is streamed through the interpreter in batches
+        (input tensor resized to batch_size), so verification also measures
+        throughput.
 
         Args:
             tflite_path: Path to .tflite file
-            test_images: Sample images for testing
-            expected_outputs: Expected outputs (optional)
+            test_images: Test images
+            expected_outputs: Reference outputs (Keras predictions are
+                              computed if not given)
+            test_labels: True labels, for accuracy/AUC deltas (optional)
+            batch_size: Images per interpreter invoke
+            num_threads: Interpreter threads (None = TFLite default)
 
         Returns:
-            True if verification passes
+            Verification report; report['passed'] is True if verification passes
         """
-        # Load TFLite model
-        interpreter = tf.lite.Interpreter(model_path=str(tflite_path))
-        interpreter.allocate_tensors()
+        import time
 
+        interpreter = tf.lite.Interpreter(model_path=str(tflite_path), num_threads=num_threads)
         input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
 
-        print(f"\nModel Verification:")
-        print(f"  Input shape: {input_details[0]['shape']}")
+        print(f"\nModel Verification: {Path(tflite_path).name}")
+        print(f"  Input shape: {input_details[0]['shape_signature']}")
         print(f"  Input type: {input_details[0]['dtype']}")
-        print(f"  Output shape: {output_details[0]['shape']}")
+        print(f"  Output shape: {output_details[0]['shape_signature']}")
         print(f"  Output type: {output_details[0]['dtype']}")
 
-        # Test inference
-        results = []
-        for img in test_images[:5]:
-            # Prepare input
-            input_data = np.expand_dims(img, axis=0).astype(input_details[0]['dtype'])
+        start = time.perf_counter()
+        results = run_tflite_inference(tflite_path, test_images, num_threads, batch_size)
+        tflite_ips = len(test_images) / (time.perf_counter() - start)
+
+        if expected_outputs is None:
+            start = time.perf_counter()
+            expected_outputs = self.model.predict(test_images, batch_size=batch_size, verbose=0)
+            keras_ips = len(test_images) / (time.perf_counter() - start)
+        else:
+            keras_ips = None
+
+        diff = np.abs(results.reshape(len(results), -1) - np.asarray(expected_outputs).reshape(len(results), -1))
+
+        report = {
+            'num_images': int(len(test_images)),
+            'batch_size': batch_size,
+            'num_threads': num_threads,
+            'max_diff': float(diff.max()),
+            'mean_diff': float(diff.mean()),
+            'tflite_images_per_sec': tflite_ips,
+            'keras_images_per_sec': keras_ips,
+        }
 
-            # Handle quantized input
-            if input_details[0]['dtype'] == np.uint8:
-                input_scale, input_zero = input_details[0]['quantization']
-                input_data = (img / input_scale + input_zero).astype(np.uint8)
-                input_data = np.expand_dims(input_data, axis=0)
+        print(f"  Sample predictions: {[f'{r:.4f}' for r in _positive_proba(results)[:5]]}")
+        print(f"  Max / mean difference from Keras: {report['max_diff']:.6f} / {report['mean_diff']:.6f}")
+        print(f"  Throughput: {tflite_ips:.1f} images/sec"
+              + (f" (Keras: {keras_ips:.1f})" if keras_ips else ""))
 
-            interpreter.set_tensor(input_details[0]['index'], input_data)
-            interpreter.invoke()
+        passed = report['max_diff'] < 0.1
 
-            output = interpreter.get_tensor(output_details[0]['index'])
+        if test_labels is not None:
+            from sklearn.metrics import accuracy_score, roc_auc_score
 
-            # Handle quantized output
-            if output_details[0]['dtype'] == np.uint8:
-                output_scale, output_zero = output_details[0]['quantization']
-                output = (output.astype(np.float32) - output_zero) * output_scale
+            tflite_proba = _positive_proba(results)
+            keras_proba = _positive_proba(expected_outputs)
+            tflite_acc = accuracy_score(test_labels, (tflite_proba > 0.5).astype(int))
+            keras_acc = accuracy_score(test_labels, (keras_proba > 0.5).astype(int))
 
-            results.append(output[0])
+            report['accuracy'] = float(tflite_acc)
+            report['accuracy_delta'] = float(tflite_acc - keras_acc)
+            if len(np.unique(test_labels)) > 1:
+                tflite_auc = roc_auc_score(test_labels, tflite_proba)
+                report['auc'] = float(tflite_auc)
+                report['auc_delta'] = float(tflite_auc - roc_auc_score(test_labels, keras_proba))
 
-        print(f"  Sample predictions: {[f'{r[0]:.4f}' for r in results]}")
+            print(f"  Accuracy: {tflite_acc:.4f} (delta vs Keras: {report['accuracy_delta']:+.4f})")
+            if 'auc' in report:
+                print(f"  AUC: {report['auc']:.4f} (delta vs Keras: {report['auc_delta']:+.4f})")
 
-        if expected_outputs is not None:
-            keras_results = self.model.predict(test_images[:5], verbose=0)
-            max_diff = np.max(np.abs(np.array(results).flatten() - keras_results.flatten()))
-            print(f"  Max difference from Keras: {max_diff:.6f}")
+            passed = passed and report['accuracy_delta'] >= -0.01
 
-            if max_diff < 0.1:
-                print("  ✅ Verification PASSED")
-                return True
-            else:
-                print("  ⚠️  Verification WARNING: Large difference detected")
-                return False
+        report['passed'] = bool(passed)
+
+        if passed:
+            print("  ✅ Verification PASSED")
+        else:
+            print("  ⚠️  Verification WARNING: Large difference detected")
+
+        return report
+
+    def export_variant(self, variant, output_path, representative_data=None, num_samples=100):
+        """
+        Export one named variant ('basic', 'dynamic', 'float16' or 'int8').
+
+        Args:
+            variant: Variant name
+            output_path: Path to save .tflite file
+            representative_data: Calibration data (int8 only)
+            num_samples: Calibration samples drawn from an array
+
+        Returns:
+            Model size in MB
+        """
+        if variant == 'basic':
+            return self.export_basic(output_path)
+        if variant == 'int8':
+            return self.export_int8_full(output_path, representative_data, num_samples)
+        return self.export_quantized(output_path, variant)
+
+    def export_parallel(self, variant_paths, representative_data=None, max_workers=None,
+                        memory_limit_mb=None, timeout=1800, num_samples=100):
+        """
+        Convert variants in parallel, each in an isolated worker process.
+
+        The model is passed to the workers as a temporary .keras file. A
+        variant that fails, exceeds its memory cap or times out is reported
+        in the returned failures instead of aborting the other conversions.
 
-        return True
+        Args:
+            variant_paths: Dictionary of variant name -> output .tflite path
+            representative_data: Calibration data for int8
+            max_workers: Concurrent conversions (default: one per variant,
+                         at most the CPU count)
+            memory_limit_mb: Address-space cap per worker (RLIMIT_AS, where
+                             supported). TensorFlow reserves a lot of virtual
+                             memory, so keep this well above the model size
+            timeout: Seconds allowed per variant
+            num_samples: Calibration samples drawn from an array
 
-    def export_all(self, output_dir, representative_data=None, test_images=None):
+        Returns:
+            Sizes in MB of the converted variants and a dictionary of
+            failed variant -> error message
+        """
+        import queue as queue_module
+        import tempfile
+        import time
+        import multiprocessing as mp
+
+        max_workers = max_workers or min(len(variant_paths), os.cpu_count() or 1)
+        ctx = mp.get_context('spawn')
+        queue = ctx.Queue()
+        sizes, failures = {}, {}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            keras_path = os.path.join(tmp_dir, 'model.keras')
+            self.model.save(keras_path)
+
+            # A RepresentativeDataset is sent as is (it only holds file
+            # paths); arrays are sampled once and shared through a file
+            representative = representative_data
+            if representative_data is not None and not callable(representative_data):
+                representative = os.path.join(tmp_dir, 'representative.npy')
+                samples = np.concatenate([b[0] for b in _representative_generator(representative_data, num_samples)()])
+                np.save(representative, samples)
+
+            pending = list(variant_paths.items())
+            running = {}
+
+            while pending or running:
+                # Start workers up to the limit
+                while pending and len(running) < max_workers:
+                    name, path = pending.pop(0)
+                    process = ctx.Process(
+                        target=_convert_worker,
+                        args=(keras_path, self.input_shape, name, str(path), representative,
+                              memory_limit_mb, queue)
+                    )
+                    process.start()
+                    running[name] = (process, time.monotonic())
+
+                try:
+                    name, size, error = queue.get(timeout=0.5)
+                except queue_module.Empty:
+                    pass
+                else:
+                    # A late result from a worker already reaped (timed out)
+                    # stays a failure
+                    if name in running:
+                        if error is None:
+                            sizes[name] = size
+                        else:
+                            failures[name] = error
+                        running.pop(name)[0].join(timeout=10)
+
+                # Reap crashed (e.g. OOM-killed) and timed-out workers
+                for name, (process, started) in list(running.items()):
+                    if not process.is_alive() and queue.empty():
+                        failures[name] = f'worker exited with code {process.exitcode}'
+                        running.pop(name)
+                    elif time.monotonic() - started > timeout:
+                        process.kill()
+                        process.join()
+                        failures[name] = f'timed out after {timeout}s'
+                        running.pop(name)
+
+        for name, error in failures.items():
+            print(f"⚠️  {name} conversion failed: {error}")
+
+        # Keep the caller's variant order
+        sizes = {name: sizes[name] for name in variant_paths if name in sizes}
+        return sizes, failures
+
+    def export_all(self, output_dir, representative_data=None, test_images=None, test_labels=None,
+                   batch_size=32, num_threads=None, benchmark=None, parallel=True, max_workers=None,
+                   memory_limit_mb=None, timeout=1800, calibration_samples=100):
         """
         Export model in all formats for comparison.
 
         Args:
             output_dir: Directory to save models
-            representative_data: Data for INT8 calibration
+            representative_data: Data for INT8 calibration: a
+                                 RepresentativeDataset streaming from disk
+                                 or an array of training samples
             test_images: Images for verification
+            test_labels: Labels for accuracy/AUC verification (optional)
+            batch_size: Verification batch size
+            num_threads: Interpreter threads for verification
+            benchmark: Benchmark every variant and the Keras model on the
+                       local CPU and recommend from the latency/accuracy
+                       Pareto front (default: whenever test_images is given).
+                       Accuracy needs test_labels; without them it is
+                       agreement with the Keras model's predictions.
+                       Without a benchmark the recommendation falls back to
+                       the size rule
+            parallel: Convert variants in parallel worker processes
+            max_workers: Concurrent conversions (parallel only)
+            memory_limit_mb: Per-worker memory cap (parallel only)
+            timeout: Per-variant timeout in seconds (parallel only)
+            calibration_samples: Calibration samples drawn from an array
 
         Returns:
             Dictionary of model sizes
         """
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
-
-        sizes = {}
+        if benchmark is None:
+            benchmark = test_images is not None
 
         print("\n" + "="*60)
         print("TFLite Model Export")
         print("="*60)
 
-        # Basic (no quantization)
-        basic_path = output_path / 'kidney_stone_basic.tflite'
-        sizes['basic'] = self.export_basic(basic_path)
-
-        # Dynamic quantization
-        dynamic_path = output_path / 'kidney_stone_dynamic.tflite'
-        sizes['dynamic'] = self.export_quantized(dynamic_path, 'dynamic')
-
-        # Float16 quantization
-        float16_path = output_path / 'kidney_stone_float16.tflite'
-        sizes['float16'] = self.export_quantized(float16_path, 'float16')
-
+        # Basic (no quantization), dynamic and float16 quantization, and
         # INT8 full quantization (if representative data provided)
+        variants = ['basic', 'dynamic', 'float16']
         if representative_data is not None:
-            int8_path = output_path / 'kidney_stone_int8.tflite'
-            sizes['int8'] = self.export_int8_full(int8_path, representative_data)
+            variants.append('int8')
+        variant_paths = {name: output_path / f'kidney_stone_{name}.tflite' for name in variants}
+
+        failures = {}
+        if parallel:
+            sizes, failures = self.export_parallel(
+                variant_paths, representative_data, max_workers, memory_limit_mb, timeout,
+                num_samples=calibration_samples
+            )
+        else:
+            sizes = {
+                name: self.export_variant(name, path, representative_data, calibration_samples)
+                for name, path in variant_paths.items()
+            }
+
+        if not sizes:
+            raise RuntimeError(f"All TFLite conversions failed: {failures}")
 
         # Print comparison
         print("\n📊 Model Size Comparison:")
@@ -233,30 +522,75 @@ class TFLiteExporter:
         smallest = min(sizes, key=sizes.get)
         print(f"\n🏆 Smallest model: {smallest} ({sizes[smallest]:.2f} MB)")
 
-        # Recommend best for mobile
+        # Size rule: only the fallback when there is nothing to benchmark
         if sizes.get('dynamic', float('inf')) < 50:
             recommended = 'dynamic'
         elif sizes.get('float16', float('inf')) < 50:
             recommended = 'float16'
         else:
             recommended = 'basic'
+        recommendation_rule = ('size < 50 MB (fallback: no test data to benchmark)' if test_images is None
+                               else 'size < 50 MB (fallback: benchmark disabled)')
 
-        print(f"📱 Recommended for mobile: {recommended}")
-
-        # Verify models
+        # Verify models (Keras reference outputs computed once)
+        verification = {}
         if test_images is not None:
             print("\n🔍 Verifying models...")
+            keras_outputs = self.model.predict(test_images, batch_size=batch_size, verbose=0)
             for name in sizes.keys():
                 path = output_path / f'kidney_stone_{name}.tflite'
-                self.verify_model(path, test_images)
+                verification[name] = self.verify_model(
+                    path, test_images, keras_outputs, test_labels,
+                    batch_size=batch_size, num_threads=num_threads
+                )
 
         # Save metadata
         metadata = {
             'input_shape': list(self.input_shape),
             'sizes_mb': sizes,
             'recommended': recommended,
+            'recommendation_rule': recommendation_rule,
             'class_names': ['Normal', 'Stone']
         }
+        if verification:
+            metadata['verification'] = verification
+        if failures:
+            metadata['failed'] = failures
+
+        # CPU benchmark (each model in a fresh process)
+        if benchmark and test_images is not None:
+            import tempfile
+            from benchmark import (benchmark_variants, fidelity_metric, pareto_recommendation,
+                                   print_benchmark_table)
+
+            print("\n⏱️  Benchmarking models...")
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                keras_path = Path(tmp_dir) / 'source_model.keras'
+                self.model.save(str(keras_path))
+
+                paths = {name: output_path / f'kidney_stone_{name}.tflite' for name in sizes}
+                paths['keras'] = keras_path
+                results = benchmark_variants(paths, test_images, test_labels,
+                                             batch_size=batch_size, num_threads=num_threads)
+
+            # Without labels the variants are checked against the Keras model's predictions
+            pareto_pick, front = pareto_recommendation(results, list(sizes))
+            metric = fidelity_metric(results, list(sizes))
+            print_benchmark_table(results, pareto_pick, front, metric)
+
+            metadata['benchmark'] = results
+            metadata['pareto_front'] = front
+            if pareto_pick is not None:
+                metadata['recommended'] = pareto_pick
+                metadata['recommendation_rule'] = ('latency/accuracy pareto' if metric == 'accuracy'
+                                                   else 'latency/keras-agreement pareto')
+            elif metric is None:
+                metadata['recommendation_rule'] = ('size < 50 MB (fallback: no labels or Keras reference '
+                                                   'to check benchmarked variants)')
+            else:
+                metadata['recommendation_rule'] = 'size < 50 MB (fallback: no benchmarked variant)'
+
+        print(f"\n📱 Recommended for mobile: {metadata['recommended']} ({metadata['recommendation_rule']})")
 
         with open(output_path / 'model_metadata.json', 'w') as f:
             json.dump(metadata, f, indent=2)
@@ -266,6 +600,199 @@ class TFLiteExporter:
         return sizes
 
 
+def _convert_worker(keras_path, input_shape, variant, output_path, representative, memory_limit_mb, queue):
+    """Convert one variant in a worker process and report (name, size, error)."""
+    try:
+        if memory_limit_mb:
+            try:
+                import resource
+                limit = int(memory_limit_mb) * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            except (ImportError, ValueError, OSError):
+                pass  # no address-space limits on this platform
+
+        model = keras.models.load_model(keras_path, compile=False)
+        if isinstance(representative, str):
+            representative = np.load(representative)
+
+        size = TFLiteExporter(model, input_shape).export_variant(
+            variant, output_path, representative, num_samples=len(representative) if representative is not None else 0
+        )
+        queue.put((variant, size, None))
+    except MemoryError:
+        queue.put((variant, None, 'out of memory'))
+    except Exception as e:
+        queue.put((variant, None, f'{type(e).__name__}: {e}'))
+
+
+def _positive_proba(outputs):
+    """Positive-class probability from sigmoid (N, 1) or softmax (N, 2) outputs."""
+    outputs = np.asarray(outputs)
+    return outputs.reshape(len(outputs), -1)[:, -1]
+
+
+def run_tflite_inference(tflite_path, images, num_threads=None, batch_size=32):
+    """
+    Run a TFLite model over a set of images in batches.
+
+    The input tensor is resized to batch_size once; the last partial batch
+    is zero-padded. Quantized (uint8/int8) inputs and outputs are converted
+    with the tensor's scale and zero point, so outputs are always float.
+
+    Args:
+        tflite_path: Path to .tflite file
+        images: Float images (N, H, W, C)
+        num_threads: Interpreter threads (None = TFLite default)
+        batch_size: Images per invoke
+
+    Returns:
+        Model outputs (N, ...) as float32
+    """
+    interpreter = tf.lite.Interpreter(model_path=str(tflite_path), num_threads=num_threads)
+    input_details = interpreter.get_input_details()[0]
+
+    batch_size = max(1, min(batch_size, len(images)))
+    interpreter.resize_tensor_input(
+        input_details['index'], [batch_size] + list(images.shape[1:]), strict=False
+    )
+    interpreter.allocate_tensors()
+
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+
+    in_quantized = input_details['dtype'] in (np.uint8, np.int8)
+    out_quantized = output_details['dtype'] in (np.uint8, np.int8)
+    in_scale, in_zero = input_details['quantization']
+    out_scale, out_zero = output_details['quantization']
+
+    outputs = []
+    batch = np.zeros([batch_size] + list(images.shape[1:]), dtype=np.float32)
+    for start in range(0, len(images), batch_size):
+        n = min(batch_size, len(images) - start)
+        batch[:n] = images[start:start + n]
+        batch[n:] = 0
+
+        if in_quantized:
+            info = np.iinfo(input_details['dtype'])
+            input_data = np.clip(np.round(batch / in_scale + in_zero), info.min, info.max)
+            input_data = input_data.astype(input_details['dtype'])
+        else:
+            input_data = batch
+
+        interpreter.set_tensor(input_details['index'], input_data)
+        interpreter.invoke()
+        output = interpreter.get_tensor(output_details['index'])[:n]
+
+        if out_quantized:
+            output = (output.astype(np.float32) - out_zero) * out_scale
+
+        outputs.append(output.astype(np.float32))
+
+    return np.concatenate(outputs)
+
+
+def tflite_latency(tflite_path, sample, runs=50, warmup=5, num_threads=None):
+    """
+    Median single-image CPU latency of a TFLite model.
+
+    Args:
+        tflite_path: Path to .tflite file
+        sample: One float image (H, W, C)
+        runs: Timed invocations
+        warmup: Untimed invocations
+        num_threads: Interpreter threads
+
+    Returns:
+        Median latency in milliseconds
+    """
+    import time
+
+    interpreter = tf.lite.Interpreter(model_path=str(tflite_path), num_threads=num_threads)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+
+    input_data = np.expand_dims(sample, axis=0).astype(np.float32)
+    if input_details['dtype'] in (np.uint8, np.int8):
+        scale, zero = input_details['quantization']
+        input_data = np.round(input_data / scale + zero).astype(input_details['dtype'])
+    interpreter.set_tensor(input_details['index'], input_data)
+
+    for _ in range(warmup):
+        interpreter.invoke()
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        interpreter.invoke()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings))
+
+
+def compare_int8_variants(float_model, qat_model, X_test, y_test, representative_data,
+                          output_dir, max_accuracy_drop=0.01):
+    """
+    Compare float32, post-training INT8 and QAT INT8 TFLite models.
+
+    Args:
+        float_model: Trained float Keras model
+        qat_model: Quantization-aware fine-tuned copy (or None to skip QAT)
+        X_test, y_test: Test data
+        representative_data: Calibration samples for post-training INT8
+        output_dir: Directory for the .tflite files and the comparison
+        max_accuracy_drop: Largest accuracy loss vs float32 accepted for
+                           the recommended int8 variant
+
+    Returns:
+        Dictionary of per-variant metrics and the recommended variant
+    """
+    from sklearn.metrics import accuracy_score, roc_auc_score
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    input_shape = float_model.input_shape[1:]
+    exporter = TFLiteExporter(float_model, input_shape)
+
+    paths = {
+        'float32': output_path / 'kidney_stone_basic.tflite',
+        'ptq_int8': output_path / 'kidney_stone_int8.tflite',
+    }
+    exporter.export_basic(paths['float32'])
+    exporter.export_int8_full(paths['ptq_int8'], representative_data)
+
+    if qat_model is not None:
+        paths['qat_int8'] = output_path / 'kidney_stone_qat_int8.tflite'
+        TFLiteExporter(qat_model, input_shape).export_qat_int8(paths['qat_int8'], representative_data)
+
+    variants = {}
+    for name, path in paths.items():
+        proba = run_tflite_inference(path, X_test).ravel()
+        variants[name] = {
+            'accuracy': float(accuracy_score(y_test, (proba > 0.5).astype(int))),
+            'auc': float(roc_auc_score(y_test, proba)),
+            'latency_ms': tflite_latency(path, X_test[0]),
+            'size_mb': os.path.getsize(path) / (1024 * 1024),
+        }
+
+    float_acc = variants['float32']['accuracy']
+    int8_ok = [n for n in variants if n != 'float32'
+               and float_acc - variants[n]['accuracy'] <= max_accuracy_drop]
+    recommended = min(int8_ok, key=lambda n: variants[n]['latency_ms']) if int8_ok else 'float32'
+
+    print("\n📊 Float32 vs INT8 (test set):")
+    print(f"   {'Variant':<10}{'Accuracy':>10}{'AUC':>8}{'Latency (ms)':>14}{'Size (MB)':>11}")
+    for name, v in variants.items():
+        print(f"   {name:<10}{v['accuracy']:>10.4f}{v['auc']:>8.4f}{v['latency_ms']:>14.2f}{v['size_mb']:>11.2f}")
+    print(f"\n🏆 Recommended: {recommended}")
+
+    comparison = {'variants': variants, 'recommended': recommended}
+    with open(output_path / 'int8_comparison.json', 'w') as f:
+        json.dump(comparison, f, indent=2)
+
+    return comparison
+
+
 def create_flutter_model(keras_model, output_path, representative_data=None):
     """
     Create optimized TFLite model for Flutter app.
@@ -310,5 +837,8 @@ if __name__ == "__main__":
     print("\nUsage:")
     print("  exporter = TFLiteExporter(trained_model)")
     print("  exporter.export_all('output_dir/')")
+    print("\nINT8 calibration streamed from disk:")
+    print("  rep = RepresentativeDataset('../data/processed', num_samples=500)")
+    print("  exporter.export_all('output_dir/', representative_data=rep)")
     print("\nFor Flutter:")
     print("  create_flutter_model(model, 'kidney_stone.tflite')")
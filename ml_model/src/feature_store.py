@@ -0,0 +1,175 @@
+"""
+RayScan ML Model - Feature Store
+On-disk cache of extracted CNN/VGG16 feature matrices, so classifier
+experiments don't repeat the feature extractor forward pass
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def array_fingerprint(array, chunk_rows=256):
+    """
+    Content hash of an array (shape, dtype and values).
+
+    Args:
+        array: Numpy array (hashed in chunks, so memmaps are not loaded at once)
+        chunk_rows: Number of rows hashed per chunk
+
+    Returns:
+        Hex digest string
+    """
+    array = np.asarray(array)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((array.shape, array.dtype.str)).encode())
+
+    for start in range(0, max(len(array), 1), chunk_rows):
+        h.update(np.ascontiguousarray(array[start:start + chunk_rows]).tobytes())
+
+    return h.hexdigest()
+
+
+def model_fingerprint(model):
+    """
+    Hash of a Keras model's weights (shapes and values).
+
+    Layer names are ignored on purpose: Keras auto-numbers them per
+    session, so two identical extractors would otherwise hash differently.
+
+    Args:
+        model: Keras model
+
+    Returns:
+        Hex digest string
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for weights in model.get_weights():
+        h.update(str((weights.shape, weights.dtype.str)).encode())
+        h.update(np.ascontiguousarray(weights).tobytes())
+    return h.hexdigest()
+
+
+class FeatureStore:
+    """
+    Persist extracted feature matrices as memory-mapped .npy files.
+
+    Entries are keyed by the extractor weights hash, the preprocessing
+    fingerprint and the hash of the input images, so a cached matrix is
+    only reused for exactly the same extractor and data.
+    """
+
+    def __init__(self, cache_dir='../models/feature_cache', dtype='float32'):
+        """
+        Initialize feature store.
+
+        Args:
+            cache_dir: Directory for cached feature files
+            dtype: Storage dtype, 'float32' or 'float16' (half the disk space)
+        """
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported feature dtype: {dtype}")
+
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+
+    def key(self, extractor_hash, preprocessing_fingerprint, data_hash):
+        """Build the cache key for an extractor / preprocessing / data triple."""
+        h = hashlib.blake2b(digest_size=16)
+        for part in (extractor_hash, preprocessing_fingerprint, data_hash, self.dtype):
+            h.update(str(part).encode())
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f'{key}.npy'
+
+    def load(self, key, as_float32=True):
+        """
+        Load cached features.
+
+        Args:
+            key: Cache key
+            as_float32: Convert float16 storage to an in-memory float32 array;
+                        if False the memmap is returned as stored
+
+        Returns:
+            Feature matrix, or None if not cached
+        """
+        path = self._path(key)
+        if not path.exists():
+            return None
+
+        features = np.load(path, mmap_mode='r')
+        if as_float32 and features.dtype != np.float32:
+            features = np.asarray(features, dtype=np.float32)
+        return features
+
+    def get_or_extract(self, model, images, extract_fn, preprocessing_fingerprint='',
+                       batch_size=1024, as_float32=True):
+        """
+        Return cached features for images, extracting and storing them on a miss.
+
+        Features are written batch by batch into a temporary memmap which is
+        renamed into place only when complete, so an interrupted extraction
+        never leaves a partial entry behind.
+
+        Args:
+            model: Keras model whose weights identify the extractor
+            images: Preprocessed images
+            extract_fn: Function mapping a batch of images to a 2D feature batch
+            preprocessing_fingerprint: String identifying the preprocessing
+            batch_size: Number of images passed to extract_fn at a time
+            as_float32: See load()
+
+        Returns:
+            Feature matrix
+        """
+        key = self.key(model_fingerprint(model), preprocessing_fingerprint,
+                       array_fingerprint(images))
+
+        features = self.load(key, as_float32)
+        if features is not None:
+            print(f"Loaded cached features {key[:12]} {features.shape}")
+            return features
+
+        path = self._path(key)
+        tmp_path = path.with_name(f'{key}.{os.getpid()}.tmp.npy')
+
+        first = np.asarray(extract_fn(images[:batch_size]))
+        stored = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=self.dtype,
+            shape=(len(images),) + first.shape[1:]
+        )
+        stored[:len(first)] = first
+
+        for start in range(batch_size, len(images), batch_size):
+            stored[start:start + batch_size] = extract_fn(images[start:start + batch_size])
+
+        stored.flush()
+        shape = stored.shape
+        del stored
+        os.replace(tmp_path, path)
+
+        metadata = {
+            'shape': list(shape),
+            'dtype': self.dtype,
+            'preprocessing': preprocessing_fingerprint,
+        }
+        with open(path.with_suffix('.json'), 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+        print(f"Cached features {key[:12]} {shape} ({self.dtype})")
+
+        return self.load(key, as_float32)
+
+    def clear(self):
+        """Delete all cached feature files."""
+        for path in self.cache_dir.glob('*.npy'):
+            path.unlink()
+        for path in self.cache_dir.glob('*.json'):
+            path.unlink()
@@ -8,8 +8,8 @@ import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 import cv2
-import matplotlib.pyplot as plt
-from matplotlib import cm
+
+from report_renderer import gradcam_figure, finish_figure, render_figures
 
 
 class GradCAM:
@@ -18,6 +18,8 @@ class GradCAM:
     Generates visual explanations for CNN predictions.
     """
 
+    title = 'Grad-CAM'
+
     def __init__(self, model, layer_name=None):
         """
         Initialize Grad-CAM.
@@ -81,39 +83,75 @@ class GradCAM:
         if len(image.shape) == 3:
             image = np.expand_dims(image, axis=0)
 
-        # Cast to float32
-        image = tf.cast(image, tf.float32)
+        heatmaps, _ = self.compute_heatmaps(image[:1], class_idx, eps=eps)
+        return heatmaps[0]
 
-        # Record gradients
-        with tf.GradientTape() as tape:
-            tape.watch(image)
-            conv_outputs, predictions = self.grad_model(image)
+    def compute_heatmaps(self, images, class_idx=None, batch_size=32, eps=1e-8):
+        """
+        Compute heatmaps and predictions for many images, one pass per batch.
 
-            if class_idx is None:
-                class_idx = tf.argmax(predictions[0])
+        Each sample's class score depends only on its own activations, so
+        the gradient of the summed batch scores gives every sample's own
+        gradients from a single GradientTape pass.
+
+        Args:
+            images: Preprocessed images (N, H, W, C)
+            class_idx: Target class: None (predicted class), an int for
+                       all images, or one index per image
+            batch_size: Images per forward/backward pass
+            eps: Small value to avoid division by zero
 
-            # Get prediction for target class
-            if len(predictions.shape) == 2 and predictions.shape[1] == 1:
-                # Binary classification with single output
-                class_output = predictions[0, 0]
-            else:
-                class_output = predictions[0, class_idx]
+        Returns:
+            Heatmaps (N, h, w) and model predictions (N, outputs)
+        """
+        if class_idx is not None and np.ndim(class_idx) == 0:
+            class_idx = np.full(len(images), class_idx)
+
+        heatmaps, predictions = [], []
+        for start in range(0, len(images), batch_size):
+            batch = tf.convert_to_tensor(images[start:start + batch_size], dtype=tf.float32)
+            batch_idx = None if class_idx is None else class_idx[start:start + batch_size]
+
+            batch_heatmaps, batch_predictions = self._heatmap_batch(batch, batch_idx, eps)
+            heatmaps.append(batch_heatmaps.numpy())
+            predictions.append(batch_predictions.numpy())
+
+        return np.concatenate(heatmaps), np.concatenate(predictions)
+
+    @staticmethod
+    def _class_scores(predictions, class_idx):
+        """Per-sample score of the target class."""
+        if predictions.shape[-1] == 1:
+            # Binary classification with single output
+            return predictions[:, 0]
+
+        if class_idx is None:
+            class_idx = tf.argmax(predictions, axis=-1)
+        class_idx = tf.cast(class_idx, tf.int32)
+        return tf.gather(predictions, class_idx, axis=1, batch_dims=1)
+
+    @staticmethod
+    def _normalize(heatmaps, eps):
+        """ReLU and scale each heatmap to [0, 1]."""
+        heatmaps = tf.maximum(heatmaps, 0)
+        return heatmaps / (tf.reduce_max(heatmaps, axis=(1, 2), keepdims=True) + eps)
+
+    def _heatmap_batch(self, images, class_idx, eps):
+        """Grad-CAM heatmaps and predictions for one batch."""
+        with tf.GradientTape() as tape:
+            conv_outputs, predictions = self.grad_model(images, training=False)
+            class_output = tf.reduce_sum(self._class_scores(predictions, class_idx))
 
         # Compute gradients
         grads = tape.gradient(class_output, conv_outputs)
 
-        # Global average pooling of gradients
-        pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
+        # Global average pooling of gradients, per sample
+        pooled_grads = tf.reduce_mean(grads, axis=(1, 2), keepdims=True)
 
         # Weight feature maps by gradients
-        conv_outputs = conv_outputs[0]
-        heatmap = tf.reduce_sum(conv_outputs * pooled_grads, axis=-1)
-
-        # ReLU and normalize
-        heatmap = tf.maximum(heatmap, 0)
-        heatmap = heatmap / (tf.reduce_max(heatmap) + eps)
+        heatmaps = tf.reduce_sum(conv_outputs * pooled_grads, axis=-1)
 
-        return heatmap.numpy()
+        return self._normalize(heatmaps, eps), predictions
 
     def overlay_heatmap(self, heatmap, original_image, alpha=0.4, colormap=cv2.COLORMAP_JET):
         """
@@ -153,7 +191,8 @@ class GradCAM:
 
         return superimposed
 
-    def visualize(self, image, original_image, class_idx=None, save_path=None, figsize=(15, 5)):
+    def visualize(self, image, original_image, class_idx=None, save_path=None, figsize=(15, 5),
+                  heatmap=None, prediction=None, show=True):
         """
         Generate and display Grad-CAM visualization.
 
@@ -163,20 +202,33 @@ class GradCAM:
             class_idx: Target class index
             save_path: Path to save figure
             figsize: Figure size
+            heatmap: Precomputed heatmap (e.g. from compute_heatmaps)
+            prediction: Precomputed model output for the image
+            show: Display the figure (False renders off-screen only)
 
         Returns:
             Heatmap and superimposed image
         """
-        # Compute heatmap
-        heatmap = self.compute_heatmap(image, class_idx)
+        # Compute heatmap and prediction in one pass unless given
+        if heatmap is None or prediction is None:
+            if len(image.shape) == 3:
+                image = np.expand_dims(image, axis=0)
+            heatmaps, predictions = self.compute_heatmaps(image[:1], class_idx)
+            heatmap, prediction = heatmaps[0], predictions[0]
 
         # Create overlay
         superimposed = self.overlay_heatmap(heatmap, original_image)
 
-        # Get prediction
-        if len(image.shape) == 3:
-            image = np.expand_dims(image, axis=0)
-        pred = self.model.predict(image, verbose=0)
+        fig = gradcam_figure(**self._figure_kwargs(heatmap, superimposed, prediction, original_image,
+                                                   figsize), interactive=show)
+
+        finish_figure(fig, save_path, show, 'Visualization')
+
+        return heatmap, superimposed
+
+    def _figure_kwargs(self, heatmap, superimposed, prediction, original_image, figsize=(15, 5)):
+        """Plain-data arguments for report_renderer.gradcam_figure."""
+        pred = np.asarray(prediction).reshape(1, -1)
 
         if pred.shape[-1] == 1:
             pred_class = 'Stone' if pred[0, 0] > 0.5 else 'Normal'
@@ -185,37 +237,35 @@ class GradCAM:
             pred_class = 'Stone' if np.argmax(pred) == 1 else 'Normal'
             confidence = np.max(pred)
 
-        # Plot
-        fig, axes = plt.subplots(1, 3, figsize=figsize)
-
-        # Original image
-        if len(original_image.shape) == 2:
-            axes[0].imshow(original_image, cmap='gray')
-        else:
-            axes[0].imshow(original_image)
-        axes[0].set_title('Original Image', fontsize=12)
-        axes[0].axis('off')
-
-        # Heatmap
-        axes[1].imshow(heatmap, cmap='jet')
-        axes[1].set_title('Grad-CAM Heatmap', fontsize=12)
-        axes[1].axis('off')
-
-        # Superimposed
-        axes[2].imshow(cv2.cvtColor(superimposed, cv2.COLOR_BGR2RGB))
-        axes[2].set_title(f'Prediction: {pred_class} ({confidence:.1%})', fontsize=12)
-        axes[2].axis('off')
-
-        plt.suptitle('Grad-CAM Visualization for Kidney Stone Detection', fontsize=14, y=1.02)
-        plt.tight_layout()
-
-        if save_path:
-            plt.savefig(save_path, dpi=150, bbox_inches='tight')
-            print(f"Visualization saved to: {save_path}")
+        return {
+            'original_image': original_image,
+            'heatmap': heatmap,
+            'superimposed': superimposed,
+            'pred_class': pred_class,
+            'confidence': float(confidence),
+            'heatmap_title': f'{self.title} Heatmap',
+            'figsize': figsize,
+        }
+
+    def render_tasks(self, heatmaps, predictions, original_images, save_paths):
+        """
+        Overlay heatmaps and build report_renderer tasks for them.
 
-        plt.show()
+        Args:
+            heatmaps: Heatmaps from compute_heatmaps
+            predictions: Predictions from compute_heatmaps
+            original_images: Original images for display
+            save_paths: Output PNG path per image
 
-        return heatmap, superimposed
+        Returns:
+            List of (figure_fn, kwargs, save_path) tasks
+        """
+        return [
+            (gradcam_figure,
+             self._figure_kwargs(heatmap, self.overlay_heatmap(heatmap, orig), pred, orig),
+             save_path)
+            for heatmap, pred, orig, save_path in zip(heatmaps, predictions, original_images, save_paths)
+        ]
 
 
 class GradCAMPlusPlus(GradCAM):
@@ -224,38 +274,15 @@ class GradCAMPlusPlus(GradCAM):
     Better localization than standard Grad-CAM.
     """
 
-    def compute_heatmap(self, image, class_idx=None, eps=1e-8):
-        """
-        Compute Grad-CAM++ heatmap.
+    title = 'Grad-CAM++'
 
-        Args:
-            image: Preprocessed image (batch of 1)
-            class_idx: Class index for gradient computation
-            eps: Small value to avoid division by zero
-
-        Returns:
-            Heatmap as numpy array
-        """
-        # Ensure batch dimension
-        if len(image.shape) == 3:
-            image = np.expand_dims(image, axis=0)
-
-        image = tf.cast(image, tf.float32)
-
-        # First forward pass
+    def _heatmap_batch(self, images, class_idx, eps):
+        """Grad-CAM++ heatmaps and predictions for one batch."""
         with tf.GradientTape() as tape1:
             with tf.GradientTape() as tape2:
-                tape1.watch(image)
-                tape2.watch(image)
-                conv_outputs, predictions = self.grad_model(image)
-
-                if class_idx is None:
-                    class_idx = tf.argmax(predictions[0])
-
-                if len(predictions.shape) == 2 and predictions.shape[1] == 1:
-                    class_output = predictions[0, 0]
-                else:
-                    class_output = predictions[0, class_idx]
+                conv_outputs, predictions = self.grad_model(images, training=False)
+                class_scores = self._class_scores(predictions, class_idx)
+                class_output = tf.reduce_sum(class_scores)
 
             # First-order gradients
             first_grads = tape2.gradient(class_output, conv_outputs)
@@ -263,53 +290,224 @@ class GradCAMPlusPlus(GradCAM):
         # Second-order gradients
         second_grads = tape1.gradient(first_grads, conv_outputs)
 
-        conv_outputs = conv_outputs[0]
-        first_grads = first_grads[0]
-        second_grads = second_grads[0]
-
         # Compute weights (alpha)
-        global_sum = tf.reduce_sum(tf.exp(class_output) * conv_outputs, axis=(0, 1))
+        scores = tf.reshape(tf.exp(class_scores), (-1, 1, 1, 1))
+        global_sum = tf.reduce_sum(scores * conv_outputs, axis=(1, 2), keepdims=True)
         alpha_num = second_grads
         alpha_denom = 2.0 * second_grads + global_sum * tf.pow(first_grads, 3)
         alpha_denom = tf.where(alpha_denom != 0, alpha_denom, tf.ones_like(alpha_denom) * eps)
 
         alphas = alpha_num / alpha_denom
-        weights = tf.reduce_sum(alphas * tf.maximum(first_grads, 0), axis=(0, 1))
+        weights = tf.reduce_sum(alphas * tf.maximum(first_grads, 0), axis=(1, 2), keepdims=True)
 
         # Generate heatmap
-        heatmap = tf.reduce_sum(conv_outputs * weights, axis=-1)
-        heatmap = tf.maximum(heatmap, 0)
-        heatmap = heatmap / (tf.reduce_max(heatmap) + eps)
+        heatmaps = tf.reduce_sum(conv_outputs * weights, axis=-1)
 
-        return heatmap.numpy()
+        return self._normalize(heatmaps, eps), predictions
 
 
-def batch_gradcam(model, images, original_images, output_dir, layer_name=None):
+class CAM(GradCAM):
+    """
+    Class Activation Mapping for models ending in GlobalAveragePooling2D -> Dense.
+
+    The pooled features feed a small dense head, so the gradient of the
+    class logit with respect to the last feature maps is the head's
+    input gradient, spread uniformly over the spatial positions. It is
+    computed analytically from the dense weights, making a heatmap cost a
+    single forward pass (no backward pass through the convolutions). For
+    a single GAP -> Dense layer this is the original CAM; for deeper heads
+    it equals Grad-CAM on the pre-activation score up to a positive scale.
+    """
+
+    title = 'CAM'
+
+    # Dense activations the analytical head gradient supports
+    HIDDEN_ACTIVATIONS = ('relu', 'linear')
+    OUTPUT_ACTIVATIONS = ('relu', 'linear', 'sigmoid', 'softmax')
+
+    def __init__(self, model):
+        """
+        Initialize CAM.
+
+        Args:
+            model: Trained Keras model with a GlobalAveragePooling2D head
+
+        Raises:
+            ValueError: If the model does not end in a supported GAP head
+        """
+        self.model = model
+        self.pool_layer, self.head_layers = self.find_gap_head(model)
+        self.layer_name = self.pool_layer.name
+
+        # Feature maps entering the pooling layer, and predictions
+        self.grad_model = keras.Model(
+            inputs=model.input,
+            outputs=[self.pool_layer.input, model.output]
+        )
+
+    @classmethod
+    def find_gap_head(cls, model):
+        """
+        Find the GlobalAveragePooling2D layer and the dense head after it.
+
+        The head must be a plain chain of Dense, Dropout and
+        BatchNormalization layers ending in the model output.
+
+        Args:
+            model: Keras model
+
+        Returns:
+            Pooling layer and list of head layers
+
+        Raises:
+            ValueError: If there is no such head
+        """
+        pool_idx = None
+        for i, layer in enumerate(model.layers):
+            if isinstance(layer, keras.layers.GlobalAveragePooling2D):
+                pool_idx = i
+        if pool_idx is None:
+            raise ValueError("No GlobalAveragePooling2D layer found in the model")
+
+        pool_layer = model.layers[pool_idx]
+        head_layers = model.layers[pool_idx + 1:]
+        dense_layers = [l for l in head_layers if isinstance(l, keras.layers.Dense)]
+        if not dense_layers or not isinstance(head_layers[-1], keras.layers.Dense):
+            raise ValueError("GlobalAveragePooling2D is not followed by a Dense head")
+
+        previous = pool_layer
+        for layer in head_layers:
+            if not isinstance(layer, (keras.layers.Dense, keras.layers.Dropout,
+                                      keras.layers.BatchNormalization)):
+                raise ValueError(f"Unsupported head layer: {layer.__class__.__name__}")
+            if layer.input is not previous.output:
+                raise ValueError(f"Head layer {layer.name} is not a simple chain")
+            previous = layer
+
+        for layer in dense_layers:
+            supported = cls.OUTPUT_ACTIVATIONS if layer is head_layers[-1] else cls.HIDDEN_ACTIVATIONS
+            if layer.get_config()['activation'] not in supported:
+                raise ValueError(f"Unsupported activation in {layer.name}: "
+                                 f"{layer.get_config()['activation']}")
+
+        if model.output is not head_layers[-1].output:
+            raise ValueError("Dense head does not produce the model output")
+
+        return pool_layer, head_layers
+
+    @classmethod
+    def supports(cls, model):
+        """Whether the model has a head CAM can explain."""
+        try:
+            cls.find_gap_head(model)
+            return True
+        except (ValueError, AttributeError):
+            return False
+
+    def _head_gradients(self, pooled, predictions, class_idx):
+        """Gradient of the target logit w.r.t. the pooled features, per sample."""
+        # Forward through the head, keeping the hidden outputs for ReLU masks
+        outputs = []
+        x = pooled
+        for layer in self.head_layers[:-1]:
+            x = layer(x, training=False)
+            outputs.append(x)
+
+        output_layer = self.head_layers[-1]
+        kernel = tf.convert_to_tensor(output_layer.kernel)
+        if kernel.shape[-1] == 1:
+            grads = tf.tile(tf.transpose(kernel), (tf.shape(pooled)[0], 1))
+        else:
+            if class_idx is None:
+                class_idx = tf.argmax(predictions, axis=-1)
+            grads = tf.gather(tf.transpose(kernel), tf.cast(class_idx, tf.int32))
+
+        # Back through the hidden layers
+        for layer, output in zip(reversed(self.head_layers[:-1]), reversed(outputs)):
+            if isinstance(layer, keras.layers.Dense):
+                if layer.get_config()['activation'] == 'relu':
+                    grads = grads * tf.cast(output > 0, grads.dtype)
+                grads = tf.matmul(grads, layer.kernel, transpose_b=True)
+            elif isinstance(layer, keras.layers.BatchNormalization):
+                scale = tf.math.rsqrt(layer.moving_variance + layer.epsilon)
+                if layer.scale:
+                    scale = scale * layer.gamma
+                grads = grads * scale
+
+        return grads
+
+    def _heatmap_batch(self, images, class_idx, eps):
+        """CAM heatmaps and predictions for one batch, forward pass only."""
+        feature_maps, predictions = self.grad_model(images, training=False)
+        pooled = tf.reduce_mean(feature_maps, axis=(1, 2))
+
+        weights = self._head_gradients(pooled, predictions, class_idx)
+        heatmaps = tf.einsum('bhwc,bc->bhw', feature_maps, weights)
+
+        return self._normalize(heatmaps, eps), predictions
+
+
+def create_explainer(model, layer_name=None):
+    """
+    Create the cheapest explainer that supports the model.
+
+    Models ending in GlobalAveragePooling2D -> Dense get the forward-only
+    CAM; other models (or an explicit layer_name) fall back to Grad-CAM.
+
+    Args:
+        model: Trained Keras model
+        layer_name: Conv layer to visualize (forces Grad-CAM)
+
+    Returns:
+        CAM or GradCAM instance
+    """
+    if layer_name is None and CAM.supports(model):
+        return CAM(model)
+    return GradCAM(model, layer_name)
+
+
+def batch_gradcam(model, images, original_images, output_dir, layer_name=None, batch_size=32,
+                  parallel=True, max_workers=None):
     """
     Generate Grad-CAM visualizations for multiple images.
 
+    Heatmaps are computed first; the PNGs are then rendered off-screen
+    in a process pool.
+
     Args:
         model: Trained model
         images: Batch of preprocessed images
         original_images: Batch of original images
         output_dir: Directory to save visualizations
         layer_name: Name of conv layer to visualize
+        batch_size: Images per Grad-CAM pass
+        parallel: Render figures in a process pool
+        max_workers: Render processes (default: CPU count)
+
+    Returns:
+        List of saved paths
     """
     from pathlib import Path
-    import os
 
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    gradcam = GradCAM(model, layer_name)
+    gradcam = create_explainer(model, layer_name)
 
-    for i, (img, orig) in enumerate(zip(images, original_images)):
-        save_path = output_path / f'gradcam_{i:04d}.png'
-        gradcam.visualize(img, orig, save_path=save_path)
-        print(f"Processed {i+1}/{len(images)}")
+    # Heatmaps and predictions for all images, one pass per batch
+    heatmaps, predictions = gradcam.compute_heatmaps(images, batch_size=batch_size)
 
+    save_paths = [output_path / f'gradcam_{i:04d}.png' for i in range(len(images))]
+    tasks = gradcam.render_tasks(heatmaps, predictions, original_images, save_paths)
 
-def generate_gradcam_report(model, X_test, y_test, original_images, output_dir, n_samples=10):
+    paths = render_figures(tasks, max_workers, parallel)
+    print(f"Processed {len(paths)}/{len(images)}")
+
+    return paths
+
+
+def generate_gradcam_report(model, X_test, y_test, original_images, output_dir, n_samples=10,
+                            batch_size=32, parallel=True, max_workers=None):
     """
     Generate Grad-CAM report with correct and incorrect predictions.
 
@@ -319,19 +517,20 @@ def generate_gradcam_report(model, X_test, y_test, original_images, output_dir,
         original_images: Original test images (for visualization)
         output_dir: Output directory
         n_samples: Number of samples per category
+        batch_size: Images per Grad-CAM pass
+        parallel: Render figures in a process pool
+        max_workers: Render processes (default: CPU count)
     """
     from pathlib import Path
 
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    gradcam = GradCAM(model)
+    gradcam = create_explainer(model)
 
-    # Get predictions
-    if hasattr(model, 'predict_proba'):
-        probs = model.predict_proba(X_test)[:, 1]
-    else:
-        probs = model.predict(X_test).flatten()
+    # Heatmaps and predictions from the same pass per batch
+    heatmaps, predictions = gradcam.compute_heatmaps(X_test, batch_size=batch_size)
+    probs = predictions[:, -1]
 
     preds = (probs > 0.5).astype(int)
 
@@ -362,19 +561,20 @@ def generate_gradcam_report(model, X_test, y_test, original_images, output_dir,
         ('false_negatives', fn_indices, 'Missed Stones (Stone → Normal)'),
     ]
 
+    tasks = []
     for category_name, indices, title in categories:
         category_dir = output_path / category_name
         category_dir.mkdir(exist_ok=True)
 
         print(f"\nGenerating {title} visualizations...")
 
-        for i, idx in enumerate(indices):
-            save_path = category_dir / f'{category_name}_{i:02d}.png'
-            gradcam.visualize(
-                X_test[idx],
-                original_images[idx],
-                save_path=save_path
-            )
+        save_paths = [category_dir / f'{category_name}_{i:02d}.png' for i in range(len(indices))]
+        tasks += gradcam.render_tasks(
+            heatmaps[indices], predictions[indices], [original_images[idx] for idx in indices], save_paths
+        )
+
+    # Render all PNGs off-screen once the heatmaps are done
+    render_figures(tasks, max_workers, parallel)
 
     print(f"\n✅ Grad-CAM report saved to: {output_path}")
     print(f"   - True Positives: {len(tp_indices)} images")
@@ -389,5 +589,8 @@ if __name__ == "__main__":
     print("\nUsage:")
     print("  gradcam = GradCAM(trained_model)")
     print("  heatmap, overlay = gradcam.visualize(preprocessed_img, original_img)")
+    print("  heatmaps, predictions = gradcam.compute_heatmaps(images, batch_size=32)")
+    print("\nGAP-headed models (forward pass only):")
+    print("  explainer = create_explainer(trained_model)  # CAM, else Grad-CAM")
     print("\nFor batch processing:")
     print("  batch_gradcam(model, images, originals, 'output_dir/')")
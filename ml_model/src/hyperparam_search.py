@@ -0,0 +1,473 @@
+"""
+RayScan ML Model - Hyperparameter Search
+Successive-halving / Hyperband search over the hybrid models' XGBoost and
+RandomForest hyperparameters, run on cached extracted features
+"""
+
+import math
+import time
+import json
+import argparse
+import itertools
+import numpy as np
+import xgboost as xgb
+from pathlib import Path
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, recall_score, roc_auc_score
+
+from preprocessing import UltrasoundPreprocessor
+from models import HybridClassifier, XGBOOST_DEFAULTS, RANDOM_FOREST_DEFAULTS
+from feature_store import FeatureStore
+
+
+# Candidate values per classifier; max_depth is always bounded so every
+# config has a predicted cost
+SEARCH_SPACES = {
+    'xgboost': {
+        'n_estimators': [25, 50, 100, 200, 400],
+        'max_depth': [2, 3, 4, 6, 8],
+        'learning_rate': [0.03, 0.1, 0.3],
+        'subsample': [0.7, 1.0],
+        'colsample_bytree': [0.5, 1.0],
+        'min_child_weight': [1, 5],
+    },
+    'random_forest': {
+        'n_estimators': [25, 50, 100, 200, 400],
+        'max_depth': [4, 6, 8, 10, 16],
+        'max_features': ['sqrt', 'log2', 0.3],
+        'min_samples_leaf': [1, 2, 5],
+    },
+}
+
+
+def default_classifier(classifier_type):
+    """Unfitted classifier with HybridClassifier's default hyperparameters."""
+    if classifier_type == 'xgboost':
+        return xgb.XGBClassifier(**XGBOOST_DEFAULTS)
+    return RandomForestClassifier(**RANDOM_FOREST_DEFAULTS)
+
+
+def sample_configs(space, n_configs, rng):
+    """
+    Draw distinct configurations from a search space.
+
+    Args:
+        space: Dictionary of parameter name -> candidate values
+        n_configs: Number of configurations (capped at the grid size)
+        rng: numpy Generator
+
+    Returns:
+        List of parameter dictionaries
+    """
+    names = list(space)
+    grid = list(itertools.product(*(space[name] for name in names)))
+    picks = rng.choice(len(grid), size=min(n_configs, len(grid)), replace=False)
+    return [dict(zip(names, grid[i])) for i in picks]
+
+
+def predicted_cost(params):
+    """
+    Predicted inference cost of a tree ensemble.
+
+    Every tree is walked from the root to at most max_depth, so
+    n_estimators x max_depth bounds the node visits per prediction.
+
+    Args:
+        params: Classifier hyperparameters
+
+    Returns:
+        Node visits per sample (upper bound)
+    """
+    return int(params['n_estimators'] * params['max_depth'])
+
+
+def objective(result, recall_target=0.97, latency_weight=0.02, max_cost=1):
+    """
+    Score a trial for ranking (higher is better).
+
+    Accuracy minus a latency penalty (latency_weight at the most expensive
+    config in the space) and a steep penalty for missing the recall target.
+
+    Args:
+        result: Trial result with accuracy, recall and cost
+        recall_target: Minimum validation recall
+        latency_weight: Accuracy traded for the full cost range
+        max_cost: Largest predicted cost in the search space
+
+    Returns:
+        Objective value
+    """
+    recall_shortfall = max(0.0, recall_target - result['recall'])
+    return (result['accuracy']
+            - latency_weight * result['cost'] / max_cost
+            - 10.0 * recall_shortfall)
+
+
+def measure_predict_latency(classifier, features, runs=50, warmup=5):
+    """
+    Median single-sample predict_proba latency in milliseconds.
+
+    Args:
+        classifier: Fitted classifier
+        features: Feature matrix to draw samples from
+        runs: Timed predictions
+        warmup: Untimed predictions first
+
+    Returns:
+        Median latency (ms)
+    """
+    timings = []
+    for i in range(warmup + runs):
+        sample = features[i % len(features)][None]
+        start = time.perf_counter()
+        classifier.predict_proba(sample)
+        if i >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def _evaluate_config(classifier, params, train_features, y_train, val_features, y_val, n_jobs=None):
+    """
+    Fit an unfitted copy of the classifier with one configuration and score it.
+
+    Args:
+        classifier: Classifier template (cloned, never fitted itself)
+        params: Hyperparameters to set
+        train_features, y_train: Training features for this rung
+        val_features, y_val: Validation features
+        n_jobs: Threads for the classifier (None keeps its setting)
+
+    Returns:
+        Dictionary with validation metrics, predicted cost, fit time and
+        the fitted classifier
+    """
+    clf = clone(classifier).set_params(**params)
+    if n_jobs is not None and 'n_jobs' in clf.get_params():
+        clf.set_params(n_jobs=n_jobs)
+
+    start = time.perf_counter()
+    clf.fit(train_features, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    val_proba = clf.predict_proba(val_features)
+    val_pred = clf.classes_[np.argmax(val_proba, axis=1)]
+
+    return {
+        'params': params,
+        'cost': predicted_cost(params),
+        'accuracy': float(accuracy_score(y_val, val_pred)),
+        'recall': float(recall_score(y_val, val_pred)),
+        'auc': float(roc_auc_score(y_val, val_proba[:, 1])),
+        'fit_seconds': fit_seconds,
+        'classifier': clf,
+    }
+
+
+def _n_rungs(n_total, min_samples, eta):
+    """Rungs needed to grow from min_samples to n_total by a factor of eta."""
+    return int(math.floor(math.log(n_total / min(min_samples, n_total), eta) + 1e-9)) + 1
+
+
+def successive_halving(classifier, configs, train_features, y_train, val_features, y_val,
+                       n_rungs=None, min_samples=100, eta=3, recall_target=0.97, latency_weight=0.02,
+                       max_cost=1, n_jobs=-1, seed=42, bracket=0):
+    """
+    Run one successive-halving bracket.
+
+    Every rung fits the surviving configs in parallel on a stratified
+    subset of the training features (eta times larger each rung, the full
+    set in the last) and keeps the best 1/eta by objective.
+
+    Args:
+        classifier: Classifier template
+        configs: Parameter dictionaries to start with
+        train_features, y_train: Full training features
+        val_features, y_val: Validation features
+        n_rungs: Number of rungs (None derives it from min_samples)
+        min_samples: Training samples in the first rung
+        eta: Halving rate
+        recall_target: Minimum validation recall
+        latency_weight: Latency penalty weight (see objective)
+        max_cost: Largest predicted cost in the search space
+        n_jobs: Parallel trials (-1 = all cores)
+        seed: Seed for the rung subsets
+        bracket: Bracket number recorded in the trials
+
+    Returns:
+        List of trial results; only last-rung trials keep their classifier
+    """
+    from joblib import Parallel, delayed, cpu_count
+
+    n_total = len(y_train)
+    n_rungs = n_rungs or _n_rungs(n_total, min_samples, eta)
+
+    trials = []
+    survivors = configs
+
+    for rung in range(n_rungs):
+        n_samples = n_total if rung == n_rungs - 1 else int(n_total / eta ** (n_rungs - 1 - rung))
+        if n_samples < n_total:
+            rung_idx, _ = train_test_split(
+                np.arange(n_total), train_size=n_samples, stratify=y_train, random_state=seed
+            )
+        else:
+            rung_idx = np.arange(n_total)
+
+        # Split the cores between concurrent trials and classifier threads
+        n_parallel = min(len(survivors), cpu_count() if n_jobs in (None, -1) else n_jobs)
+        threads_per_fit = max(1, cpu_count() // n_parallel)
+
+        print(f"  Bracket {bracket}, rung {rung}: {len(survivors)} configs on {n_samples} samples "
+              f"({n_parallel} in parallel)")
+        # Threads: XGBoost/RandomForest release the GIL while fitting
+        results = Parallel(n_jobs=n_parallel, prefer='threads')(
+            delayed(_evaluate_config)(
+                classifier, params,
+                train_features[rung_idx], y_train[rung_idx],
+                val_features, y_val,
+                threads_per_fit
+            )
+            for params in survivors
+        )
+
+        last_rung = rung == n_rungs - 1
+        for r in results:
+            r.update(bracket=bracket, rung=rung, n_samples=n_samples,
+                     objective=objective(r, recall_target, latency_weight, max_cost))
+            if not last_rung:
+                del r['classifier']
+        trials.extend(results)
+
+        if last_rung:
+            break
+        ranked = sorted(results, key=lambda r: r['objective'], reverse=True)
+        survivors = [r['params'] for r in ranked[:max(1, len(results) // eta)]]
+
+    return trials
+
+
+def search_hyperparameters(train_features, y_train, val_features, y_val, classifier_type='xgboost',
+                           n_configs=27, eta=3, min_samples=100, hyperband=False,
+                           recall_target=0.97, latency_weight=0.02, n_jobs=-1, seed=42):
+    """
+    Search classifier hyperparameters on extracted features.
+
+    With hyperband=True, brackets from aggressive (many configs, small
+    first rung) to conservative (few configs, full data) are run, as in
+    Hyperband; otherwise one successive-halving bracket of n_configs.
+    The recommendation is the cheapest full-data config that meets the
+    recall target.
+
+    Args:
+        train_features, y_train: Training features
+        val_features, y_val: Validation features
+        classifier_type: 'xgboost' or 'random_forest'
+        n_configs: Configs in the (first) bracket
+        eta: Halving rate
+        min_samples: Training samples in the smallest rung
+        hyperband: Run Hyperband brackets instead of a single bracket
+        recall_target: Minimum validation recall for the recommendation
+        latency_weight: Accuracy traded for the full predicted cost range
+        n_jobs: Parallel trials (-1 = all cores)
+        seed: Seed for sampling configs and rung subsets
+
+    Returns:
+        Dictionary with all trials, the final (full-data) trials and the
+        recommended trial (or None), plus the fitted recommended classifier
+    """
+    rng = np.random.default_rng(seed)
+    space = SEARCH_SPACES[classifier_type]
+    max_cost = max(space['n_estimators']) * max(space['max_depth'])
+    classifier = default_classifier(classifier_type)
+
+    n_total = len(y_train)
+    s_max = _n_rungs(n_total, min_samples, eta) - 1
+    brackets = range(s_max, -1, -1) if hyperband else [s_max]
+
+    print(f"\n{'='*60}")
+    print(f"Hyperparameter search: {classifier_type.upper()} "
+          f"({'Hyperband' if hyperband else 'successive halving'}, eta={eta})")
+    print(f"{'='*60}")
+
+    start = time.perf_counter()
+    trials = []
+    for bracket, s in enumerate(brackets):
+        n = int(math.ceil((s_max + 1) / (s + 1) * eta ** s)) if hyperband else n_configs
+        trials.extend(successive_halving(
+            classifier, sample_configs(space, n, rng),
+            train_features, y_train, val_features, y_val,
+            n_rungs=s + 1,
+            eta=eta,
+            recall_target=recall_target,
+            latency_weight=latency_weight,
+            max_cost=max_cost,
+            n_jobs=n_jobs,
+            seed=seed,
+            bracket=bracket
+        ))
+    search_seconds = time.perf_counter() - start
+
+    final = [t for t in trials if t['n_samples'] == n_total]
+    for t in final:
+        t['latency_ms'] = measure_predict_latency(t['classifier'], val_features)
+
+    eligible = [t for t in final if t['recall'] >= recall_target]
+    recommended = min(eligible, key=lambda t: (t['cost'], -t['accuracy'])) if eligible else None
+
+    print_search_table(final, recommended, recall_target)
+    print(f"\n  {len(trials)} trials in {search_seconds:.1f}s "
+          f"({sum(t['fit_seconds'] for t in trials):.1f}s of fitting)")
+
+    return {
+        'trials': trials,
+        'final': final,
+        'recommended': recommended,
+        'classifier': recommended['classifier'] if recommended is not None else None,
+        'search_seconds': search_seconds,
+    }
+
+
+
+def print_search_table(final, recommended=None, recall_target=0.97):
+    """Print the full-data trials sorted by predicted cost."""
+    print("\n📊 Classifier Cost vs Accuracy (full training set):")
+    print(f"   {'Trees':>6}{'Depth':>6}{'Cost':>7}{'Latency (ms)':>14}{'Accuracy':>10}{'Recall':>9}{'AUC':>8}")
+    for t in sorted(final, key=lambda t: (t['cost'], -t['accuracy'])):
+        print(f"   {t['params']['n_estimators']:>6}{t['params']['max_depth']:>6}{t['cost']:>7}"
+              f"{t['latency_ms']:>14.3f}{t['accuracy']:>10.4f}{t['recall']:>9.4f}{t['auc']:>8.4f}")
+
+    if recommended is not None:
+        print(f"\n🏆 Cheapest classifier with recall >= {recall_target:.2f}: {recommended['params']} "
+              f"({recommended['latency_ms']:.3f} ms)")
+    else:
+        print(f"\n⚠️  No configuration reached recall >= {recall_target:.2f}")
+
+
+def load_classifier_params(path, model=None):
+    """
+    Read classifier hyperparameters from a search result or a plain JSON dict.
+
+    Args:
+        path: JSON file written by this module, or {param: value}
+        model: Expected model name (e.g. 'cnn_xgboost'); a search result
+               for a different model is ignored
+
+    Returns:
+        Parameter dictionary, or None if the file doesn't apply to model
+    """
+    with open(path) as f:
+        data = json.load(f)
+
+    if 'recommended' not in data:
+        return data
+
+    if model is not None and data.get('model') != model:
+        print(f"⚠️  {path} was tuned for {data.get('model')}, not {model}; using default hyperparameters")
+        return None
+    if data['recommended'] is None:
+        print(f"⚠️  {path} has no recommended configuration; using default hyperparameters")
+        return None
+    return data['recommended']['params']
+
+
+def _jsonable(trial):
+    """Trial result without the fitted classifier."""
+    return {k: v for k, v in trial.items() if k != 'classifier'}
+
+
+def main(args):
+    """Extract (or load cached) features and run the search."""
+    from train import load_dataset
+
+    for_vgg = args.feature_extractor == 'vgg16'
+    preprocessor = UltrasoundPreprocessor(target_size=(224, 224))
+    X, y = load_dataset(args.data_dir, preprocessor, for_vgg=for_vgg)
+
+    # Same split as train.py
+    X_train, X_temp, y_train, y_temp = train_test_split(
+        X, y, test_size=0.3, stratify=y, random_state=42
+    )
+    X_val, _, y_val, _ = train_test_split(
+        X_temp, y_temp, test_size=0.5, stratify=y_temp, random_state=42
+    )
+
+    # Features come from the feature store, so repeated searches skip the extractor
+    model = HybridClassifier(
+        feature_extractor=args.feature_extractor,
+        classifier=args.classifier,
+        feature_store=FeatureStore(args.feature_cache, dtype=args.feature_dtype),
+        preprocessing_fingerprint=preprocessor.fingerprint(for_vgg=for_vgg)
+    )
+    print(f"Extracting features using {args.feature_extractor.upper()}...")
+    train_features = model.extract_features(X_train)
+    val_features = model.extract_features(X_val)
+
+    search = search_hyperparameters(
+        train_features, y_train, val_features, y_val,
+        classifier_type=args.classifier,
+        n_configs=args.n_configs,
+        eta=args.eta,
+        min_samples=args.min_samples,
+        hyperband=args.hyperband,
+        recall_target=args.recall_target,
+        latency_weight=args.latency_weight,
+        n_jobs=args.n_jobs,
+        seed=args.seed
+    )
+
+    name = f"{args.feature_extractor}_{args.classifier}"
+    output_path = Path(args.output or f'../models/hyperparam_search_{name}.json')
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump({
+            'model': name,
+            'recall_target': args.recall_target,
+            'latency_weight': args.latency_weight,
+            'recommended': _jsonable(search['recommended']) if search['recommended'] else None,
+            'final': [_jsonable(t) for t in search['final']],
+            'trials': [_jsonable(t) for t in search['trials']],
+            'search_seconds': search['search_seconds'],
+        }, f, indent=2)
+
+    print(f"\nSearch results saved to: {output_path}")
+    print(f"Train with them: python train.py --model {name} --classifier_params {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Successive-halving hyperparameter search for hybrid classifiers')
+    parser.add_argument('--data_dir', type=str, default='../data/processed',
+                       help='Path to processed dataset')
+    parser.add_argument('--feature_extractor', type=str, default='cnn',
+                       choices=['cnn', 'vgg16'],
+                       help='Feature extractor whose features are searched over')
+    parser.add_argument('--classifier', type=str, default='xgboost',
+                       choices=['xgboost', 'random_forest'],
+                       help='Classifier to tune')
+    parser.add_argument('--n_configs', type=int, default=27,
+                       help='Configurations in the successive-halving bracket')
+    parser.add_argument('--eta', type=int, default=3,
+                       help='Keep the best 1/eta configs per rung')
+    parser.add_argument('--min_samples', type=int, default=100,
+                       help='Training samples in the smallest rung')
+    parser.add_argument('--hyperband', action='store_true',
+                       help='Run Hyperband brackets instead of one bracket')
+    parser.add_argument('--recall_target', type=float, default=0.97,
+                       help='Minimum validation recall for the recommendation')
+    parser.add_argument('--latency_weight', type=float, default=0.02,
+                       help='Accuracy traded for the full tree count x depth range')
+    parser.add_argument('--n_jobs', type=int, default=-1,
+                       help='Parallel trials (-1 = all cores)')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Seed for sampling configs and rung subsets')
+    parser.add_argument('--feature_cache', type=str, default='../models/feature_cache',
+                       help='Directory for cached extracted features')
+    parser.add_argument('--feature_dtype', type=str, default='float16',
+                       choices=['float32', 'float16'],
+                       help='Storage dtype for cached features')
+    parser.add_argument('--output', type=str, default=None,
+                       help='Where to write the search results')
+
+    args = parser.parse_args()
+    main(args)
@@ -3,6 +3,8 @@ RayScan ML Model - Model Architectures
 Based on Paper 1 (IJECE 2023): CNN + VGG16 feature extraction with XGBoost classifier
 """
 
+import itertools
+from collections import OrderedDict
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
@@ -14,63 +16,86 @@ from sklearn.ensemble import RandomForestClassifier
 import joblib
 
 
+def _kernel_initializers(seed=None):
+    """
+    Per-layer kernel initializers derived from one seed.
+
+    Seeding the initializers (instead of keras.utils.set_random_seed)
+    makes the weights reproducible without resetting the caller's
+    Python/NumPy/TensorFlow random state.
+
+    Args:
+        seed: Base seed (None keeps Keras' unseeded default)
+
+    Returns:
+        Function returning the next layer's kernel initializer
+    """
+    if seed is None:
+        return lambda: 'glorot_uniform'
+    layer_seeds = itertools.count(seed)
+    return lambda: keras.initializers.GlorotUniform(seed=next(layer_seeds))
+
+
 class CustomCNN:
     """
     Custom CNN for feature extraction from kidney ultrasound images.
     Architecture based on Paper 1 methodology.
     """
 
-    def __init__(self, input_shape=(224, 224, 1), num_features=256):
+    def __init__(self, input_shape=(224, 224, 1), num_features=256, seed=None):
         """
         Initialize Custom CNN feature extractor.
 
         Args:
             input_shape: Input image shape (height, width, channels)
             num_features: Number of features in the output layer
+            seed: Optional seed for reproducible weight initialization
         """
         self.input_shape = input_shape
         self.num_features = num_features
+        self.seed = seed
         self.model = self._build_model()
 
     def _build_model(self):
         """Build the CNN feature extractor architecture."""
+        init = _kernel_initializers(self.seed)
         model = Sequential([
             # Block 1
             layers.Conv2D(32, (3, 3), activation='relu', padding='same',
-                         input_shape=self.input_shape),
+                         input_shape=self.input_shape, kernel_initializer=init()),
             layers.BatchNormalization(),
-            layers.Conv2D(32, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(32, (3, 3), activation='relu', padding='same', kernel_initializer=init()),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
             layers.Dropout(0.25),
 
             # Block 2
-            layers.Conv2D(64, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(64, (3, 3), activation='relu', padding='same', kernel_initializer=init()),
             layers.BatchNormalization(),
-            layers.Conv2D(64, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(64, (3, 3), activation='relu', padding='same', kernel_initializer=init()),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
             layers.Dropout(0.25),
 
             # Block 3
-            layers.Conv2D(128, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(128, (3, 3), activation='relu', padding='same', kernel_initializer=init()),
             layers.BatchNormalization(),
-            layers.Conv2D(128, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(128, (3, 3), activation='relu', padding='same', kernel_initializer=init()),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
             layers.Dropout(0.25),
 
             # Block 4
-            layers.Conv2D(256, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(256, (3, 3), activation='relu', padding='same', kernel_initializer=init()),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
             layers.Dropout(0.25),
 
             # Feature extraction output
             layers.Flatten(),
-            layers.Dense(512, activation='relu'),
+            layers.Dense(512, activation='relu', kernel_initializer=init()),
             layers.Dropout(0.5),
-            layers.Dense(self.num_features, activation='relu', name='features'),
+            layers.Dense(self.num_features, activation='relu', name='features', kernel_initializer=init()),
         ])
 
         return model
@@ -98,20 +123,26 @@ class VGG16FeatureExtractor:
     Based on Paper 1 methodology for high accuracy.
     """
 
-    def __init__(self, input_shape=(224, 224, 3), num_features=512):
+    def __init__(self, input_shape=(224, 224, 3), num_features=512, seed=None, cut_layer=None):
         """
         Initialize VGG16 feature extractor.
 
         Args:
             input_shape: Input image shape (must be 3 channels for VGG16)
             num_features: Number of features in the output layer
+            seed: Optional seed for reproducible initialization of the dense head
+            cut_layer: Optional VGG16 layer to truncate the backbone at
+                      (e.g. 'block3_pool'); None uses the full stack
         """
         self.input_shape = input_shape
         self.num_features = num_features
+        self.cut_layer = cut_layer
+        self.seed = seed
         self.model = self._build_model()
 
     def _build_model(self):
         """Build VGG16-based feature extractor."""
+        init = _kernel_initializers(self.seed)
         # Load pre-trained VGG16 (without top layers)
         base_model = VGG16(
             weights='imagenet',
@@ -119,6 +150,14 @@ class VGG16FeatureExtractor:
             input_shape=self.input_shape
         )
 
+        # Truncate the backbone (cheaper, lower-level features)
+        if self.cut_layer is not None:
+            base_model = Model(
+                inputs=base_model.input,
+                outputs=base_model.get_layer(self.cut_layer).output,
+                name=f'vgg16_{self.cut_layer}'
+            )
+
         # Freeze base model layers
         base_model.trainable = False
 
@@ -126,9 +165,9 @@ class VGG16FeatureExtractor:
         model = Sequential([
             base_model,
             layers.GlobalAveragePooling2D(),
-            layers.Dense(1024, activation='relu'),
+            layers.Dense(1024, activation='relu', kernel_initializer=init()),
             layers.Dropout(0.5),
-            layers.Dense(self.num_features, activation='relu', name='features'),
+            layers.Dense(self.num_features, activation='relu', name='features', kernel_initializer=init()),
         ])
 
         return model
@@ -171,57 +210,68 @@ class EndToEndCNN:
     End-to-end CNN classifier (for comparison with hybrid approach).
     """
 
-    def __init__(self, input_shape=(224, 224, 1)):
+    def __init__(self, input_shape=(224, 224, 1), width_multiplier=1.0):
         """
         Initialize end-to-end CNN classifier.
 
         Args:
             input_shape: Input image shape
+            width_multiplier: Scales every layer's filters/units; values
+                              below 1 give a narrow, cheaper network
+                              (e.g. a distillation student)
         """
         self.input_shape = input_shape
+        self.width_multiplier = width_multiplier
         self.model = self._build_model()
+        self.qat_model = None
+
+    def _width(self, units):
+        """Scale a layer width by the width multiplier."""
+        return max(8, int(round(units * self.width_multiplier)))
 
     def _build_model(self):
         """Build end-to-end CNN classifier."""
+        w = self._width
+
         model = Sequential([
             # Block 1
-            layers.Conv2D(32, (3, 3), activation='relu', padding='same',
+            layers.Conv2D(w(32), (3, 3), activation='relu', padding='same',
                          input_shape=self.input_shape),
             layers.BatchNormalization(),
-            layers.Conv2D(32, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(w(32), (3, 3), activation='relu', padding='same'),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
             layers.Dropout(0.25),
 
             # Block 2
-            layers.Conv2D(64, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(w(64), (3, 3), activation='relu', padding='same'),
             layers.BatchNormalization(),
-            layers.Conv2D(64, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(w(64), (3, 3), activation='relu', padding='same'),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
             layers.Dropout(0.25),
 
             # Block 3
-            layers.Conv2D(128, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(w(128), (3, 3), activation='relu', padding='same'),
             layers.BatchNormalization(),
-            layers.Conv2D(128, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(w(128), (3, 3), activation='relu', padding='same'),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
             layers.Dropout(0.25),
 
             # Block 4
-            layers.Conv2D(256, (3, 3), activation='relu', padding='same'),
+            layers.Conv2D(w(256), (3, 3), activation='relu', padding='same'),
             layers.BatchNormalization(),
             layers.MaxPooling2D((2, 2)),
             layers.Dropout(0.25),
 
             # Classification head
             layers.Flatten(),
-            layers.Dense(512, activation='relu'),
+            layers.Dense(w(512), activation='relu'),
             layers.Dropout(0.5),
-            layers.Dense(128, activation='relu'),
+            layers.Dense(w(128), activation='relu'),
             layers.Dropout(0.5),
-            layers.Dense(1, activation='sigmoid'),  # Binary classification
+            layers.Dense(1, activation='sigmoid', dtype='float32'),  # Binary classification (float32 output)
         ])
 
         model.compile(
@@ -232,7 +282,8 @@ class EndToEndCNN:
 
         return model
 
-    def train(self, X_train, y_train, X_val, y_val, epochs=50, batch_size=32):
+    def train(self, X_train, y_train, X_val, y_val, epochs=50, batch_size=32, augmentor=None,
+              qat=False, qat_epochs=5, checkpoint=None):
         """
         Train the end-to-end CNN.
 
@@ -241,6 +292,13 @@ class EndToEndCNN:
             X_val, y_val: Validation data
             epochs: Number of epochs
             batch_size: Batch size
+            augmentor: Optional DataAugmentor; training batches are then
+                       augmented on the fly in its tf.data pipeline
+            qat: Fine-tune a quantization-aware copy after float training
+                 (stored in self.qat_model, for int8 TFLite export)
+            qat_epochs: Quantization-aware fine-tuning epochs
+            checkpoint: Optional TrainingStateCheckpoint; float training then
+                        saves its full state periodically and resumes from it
 
         Returns:
             Training history
@@ -264,16 +322,84 @@ class EndToEndCNN:
             )
         ]
 
-        history = self.model.fit(
+        if checkpoint is not None:
+            from checkpointing import EpochOrderSequence
+
+            # Reproducible batch order and augmentation, so a resumed run
+            # continues mid-epoch exactly where it stopped
+            seed, transform = 42, None
+            if augmentor is not None:
+                seed = augmentor.seed if augmentor.seed is not None else seed
+                transform = lambda batch, batch_seed: augmentor.augment_train_batch(batch, seed=batch_seed)
+
+            history = checkpoint.fit(
+                self.model,
+                EpochOrderSequence(X_train, y_train, batch_size=batch_size, seed=seed,
+                                   transform=transform),
+                epochs=epochs,
+                phase='end_to_end',
+                callbacks=callbacks,
+                validation_data=(X_val, y_val)
+            )
+        elif augmentor is not None:
+            history = self.model.fit(
+                augmentor.make_train_dataset(X_train, y_train, batch_size=batch_size),
+                validation_data=(X_val, y_val),
+                epochs=epochs,
+                callbacks=callbacks
+            )
+        else:
+            history = self.model.fit(
+                X_train, y_train,
+                validation_data=(X_val, y_val),
+                epochs=epochs,
+                batch_size=batch_size,
+                callbacks=callbacks
+            )
+
+        if qat:
+            self.quantize_aware_fine_tune(X_train, y_train, X_val, y_val,
+                                          epochs=qat_epochs, batch_size=batch_size)
+
+        return history
+
+    def quantize_aware_fine_tune(self, X_train, y_train, X_val, y_val, epochs=5, batch_size=32,
+                                 learning_rate=1e-4):
+        """
+        Fine-tune a quantization-aware copy of the trained model.
+
+        Fake-quant nodes simulate int8 weights and activations during
+        training, so the full-int8 TFLite export keeps float accuracy.
+        self.model stays the float model.
+
+        Args:
+            X_train, y_train: Training data
+            X_val, y_val: Validation data
+            epochs: Fine-tuning epochs
+            batch_size: Batch size
+            learning_rate: Fine-tuning learning rate
+
+        Returns:
+            Training history of the QAT model
+        """
+        import tensorflow_model_optimization as tfmot
+
+        self.qat_model = tfmot.quantization.keras.quantize_model(self.model)
+        self.qat_model.compile(
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+            loss='binary_crossentropy',
+            metrics=['accuracy']
+        )
+
+        print(f"\nQuantization-aware fine-tuning ({epochs} epochs)...")
+        return self.qat_model.fit(
             X_train, y_train,
             validation_data=(X_val, y_val),
             epochs=epochs,
             batch_size=batch_size,
-            callbacks=callbacks
+            callbacks=[EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True)]
         )
 
-        return history
-
     def predict(self, images):
         """Make predictions."""
         return self.model.predict(images)
@@ -283,47 +409,126 @@ class EndToEndCNN:
         return self.model.summary()
 
 
+# Default classifier hyperparameters (overridable per HybridClassifier)
+XGBOOST_DEFAULTS = {
+    'n_estimators': 200,
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'objective': 'binary:logistic',
+    'eval_metric': 'logloss',
+    'use_label_encoder': False,
+    'random_state': 42,
+}
+
+RANDOM_FOREST_DEFAULTS = {
+    'n_estimators': 200,
+    'max_depth': 10,
+    'random_state': 42,
+    'n_jobs': -1,
+}
+
+
 class HybridClassifier:
     """
     Hybrid CNN + XGBoost/RandomForest classifier.
     Based on Paper 1 achieving 99.47% accuracy.
     """
 
-    def __init__(self, feature_extractor='cnn', classifier='xgboost'):
+    # Arrays whose features stay memoized (e.g. train + validation, or a
+    # predict() followed by predict_proba() on the same batch)
+    FEATURE_MEMO_SIZE = 2
+
+    def __init__(self, feature_extractor='cnn', classifier='xgboost', feature_store=None,
+                 preprocessing_fingerprint='', seed=42, extractor_kwargs=None, classifier_params=None):
         """
         Initialize hybrid classifier.
 
         Args:
             feature_extractor: 'cnn' or 'vgg16'
             classifier: 'xgboost' or 'random_forest'
+            feature_store: Optional FeatureStore to persist extracted features
+            preprocessing_fingerprint: Identifies the image preprocessing in
+                                       feature store keys
+            seed: Seed for the feature extractor's initial weights, so
+                  identical extractors share cached features
+            extractor_kwargs: Extra arguments for the feature extractor
+                              (e.g. input_shape, cut_layer)
+            classifier_params: Overrides for the classifier's default
+                               hyperparameters (e.g. from hyperparam_search.py)
         """
         self.feature_extractor_type = feature_extractor
         self.classifier_type = classifier
+        self.feature_store = feature_store
+        self.preprocessing_fingerprint = preprocessing_fingerprint
 
         # Initialize feature extractor
+        extractor_kwargs = extractor_kwargs or {}
         if feature_extractor == 'cnn':
-            self.feature_extractor = CustomCNN()
+            self.feature_extractor = CustomCNN(seed=seed, **extractor_kwargs)
         else:
-            self.feature_extractor = VGG16FeatureExtractor()
+            self.feature_extractor = VGG16FeatureExtractor(seed=seed, **extractor_kwargs)
 
         # Initialize classifier
         if classifier == 'xgboost':
             self.classifier = xgb.XGBClassifier(
-                n_estimators=200,
-                max_depth=6,
-                learning_rate=0.1,
-                objective='binary:logistic',
-                eval_metric='logloss',
-                use_label_encoder=False,
-                random_state=42
+                **{**XGBOOST_DEFAULTS, **(classifier_params or {})}
             )
         else:
             self.classifier = RandomForestClassifier(
-                n_estimators=200,
-                max_depth=10,
-                random_state=42,
-                n_jobs=-1
+                **{**RANDOM_FOREST_DEFAULTS, **(classifier_params or {})}
+            )
+
+        # Feature memo keyed by array identity, most recent last; each entry
+        # keeps a reference to its array so the id cannot be reused while
+        # the entry exists, so it is capped at FEATURE_MEMO_SIZE arrays
+        self._feature_memo = OrderedDict()
+
+    def extract_features(self, images):
+        """
+        Extract features, reusing the memo for a recently seen array.
+
+        The memo holds the last FEATURE_MEMO_SIZE arrays and is keyed by
+        object identity, so modifying an array in place
+        after it has been seen requires invalidate_features(). On a memo
+        miss the feature store (if any) is consulted before running the
+        extractor.
+
+        Args:
+            images: Preprocessed images
+
+        Returns:
+            Feature vectors
+        """
+        entry = self._feature_memo.get(id(images))
+        if entry is not None and entry[0] is images:
+            self._feature_memo.move_to_end(id(images))
+            return entry[1]
+
+        if self.feature_store is not None:
+            features = self.feature_store.get_or_extract(
+                self.feature_extractor.model,
+                images,
+                self.feature_extractor.extract_features,
+                preprocessing_fingerprint=self.preprocessing_fingerprint
             )
+        else:
+            features = self.feature_extractor.extract_features(images)
+        self._feature_memo[id(images)] = (images, features)
+        while len(self._feature_memo) > self.FEATURE_MEMO_SIZE:
+            self._feature_memo.popitem(last=False)
+        return features
+
+    def invalidate_features(self, images=None):
+        """
+        Drop memoized features.
+
+        Args:
+            images: Array whose features to drop; if None, clear everything
+        """
+        if images is None:
+            self._feature_memo.clear()
+        else:
+            self._feature_memo.pop(id(images), None)
 
     def train(self, X_train, y_train, X_val=None, y_val=None):
         """
@@ -337,11 +542,11 @@ class HybridClassifier:
             Training metrics
         """
         print(f"Extracting features using {self.feature_extractor_type.upper()}...")
-        train_features = self.feature_extractor.extract_features(X_train)
+        train_features = self.extract_features(X_train)
 
         print(f"Training {self.classifier_type.upper()} classifier...")
         if X_val is not None and self.classifier_type == 'xgboost':
-            val_features = self.feature_extractor.extract_features(X_val)
+            val_features = self.extract_features(X_val)
             self.classifier.fit(
                 train_features, y_train,
                 eval_set=[(val_features, y_val)],
@@ -366,7 +571,7 @@ class HybridClassifier:
         Returns:
             Predictions (0 or 1)
         """
-        features = self.feature_extractor.extract_features(images)
+        features = self.extract_features(images)
         return self.classifier.predict(features)
 
     def predict_proba(self, images):
@@ -379,9 +584,23 @@ class HybridClassifier:
         Returns:
             Prediction probabilities
         """
-        features = self.feature_extractor.extract_features(images)
+        features = self.extract_features(images)
         return self.classifier.predict_proba(features)
 
+    def predict_with_proba(self, images):
+        """
+        Get predictions and probabilities from a single feature extraction.
+
+        Args:
+            images: Preprocessed images
+
+        Returns:
+            Tuple of (predictions (0 or 1), prediction probabilities)
+        """
+        features = self.extract_features(images)
+        proba = self.classifier.predict_proba(features)
+        return self.classifier.classes_[np.argmax(proba, axis=1)], proba
+
     def save(self, path):
         """
         Save the trained model.
@@ -424,6 +643,9 @@ class HybridClassifier:
             os.path.join(path, f'{self.classifier_type}_classifier.pkl')
         )
 
+        # Features from the previous extractor weights are stale
+        self.invalidate_features()
+
         print(f"Model loaded from: {path}")
 
 
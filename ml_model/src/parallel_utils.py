@@ -0,0 +1,77 @@
+"""
+RayScan ML Model - Parallel Utilities
+Shared-memory arrays for handing large inputs (e.g. decoded test images)
+to worker processes without pickling a copy per task
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# Per-process cache of attached blocks (name -> (SharedMemory, array))
+_attached = {}
+
+
+class SharedArray:
+    """
+    A numpy array copied once into a shared memory block.
+
+    The creating process owns the block and unlinks it on close; workers
+    attach by name through `spec` and see the same memory read-only.
+    Use as a context manager so the block is released even on errors.
+    """
+
+    def __init__(self, array):
+        """
+        Copy an array into shared memory.
+
+        Args:
+            array: Numpy array (any shape/dtype)
+        """
+        array = np.ascontiguousarray(array)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.array = np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)
+        self.array[...] = array
+
+    @property
+    def spec(self):
+        """Picklable (name, shape, dtype) for attach_shared in a worker."""
+        return self._shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        """Release and unlink the block."""
+        if self._shm is not None:
+            self.array = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach_shared(spec):
+    """
+    Attach to a SharedArray from a worker process.
+
+    Attachments are cached per process, so a worker handling many tasks
+    maps the block once.
+
+    Args:
+        spec: SharedArray.spec
+
+    Returns:
+        Read-only numpy view of the shared array
+    """
+    name, shape, dtype = spec
+    if name not in _attached:
+        # Workers only read; the owner unlinks the block
+        shm = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        array.flags.writeable = False
+        _attached[name] = (shm, array)
+    return _attached[name][1]
@@ -6,6 +6,7 @@ Based on Paper 2 (AECE 2022): Bilateral Filter + CLAHE for ultrasound images
 import cv2
 import numpy as np
 import os
+import time
 from pathlib import Path
 from tqdm import tqdm
 import albumentations as A
@@ -27,7 +28,12 @@ class UltrasoundPreprocessor:
         self.target_size = target_size
 
         # CLAHE parameters (Contrast Limited Adaptive Histogram Equalization)
-        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        self.clahe_clip_limit = 2.0
+        self.clahe_tile_grid = (8, 8)
+        self.clahe = cv2.createCLAHE(clipLimit=self.clahe_clip_limit, tileGridSize=self.clahe_tile_grid)
+
+        # ROI crop margin (fraction of each side removed)
+        self.roi_margin = 0.05
 
         # Bilateral filter parameters (preserves edges while reducing noise)
         self.bilateral_d = 9  # Diameter of pixel neighborhood
@@ -65,17 +71,21 @@ class UltrasoundPreprocessor:
         """
         return self.clahe.apply(image)
 
-    def crop_roi(self, image, margin_percent=0.05):
+    def crop_roi(self, image, margin_percent=None):
         """
         Crop Region of Interest to remove scan metadata/borders.
 
         Args:
             image: Input image
             margin_percent: Percentage of image to crop from edges
+                           (defaults to self.roi_margin)
 
         Returns:
             Cropped image
         """
+        if margin_percent is None:
+            margin_percent = self.roi_margin
+
         h, w = image.shape[:2]
         margin_h = int(h * margin_percent)
         margin_w = int(w * margin_percent)
@@ -146,6 +156,22 @@ class UltrasoundPreprocessor:
 
         return img_3ch
 
+    def fingerprint(self, for_vgg=False):
+        """
+        Identify the preprocessing configuration (used as a cache key).
+
+        Args:
+            for_vgg: Whether images are prepared for VGG16 (3 channels)
+
+        Returns:
+            Short string describing every preprocessing parameter
+        """
+        return (
+            f"ultrasound-v1|size={tuple(self.target_size)}|roi={self.roi_margin}"
+            f"|bilateral={self.bilateral_d},{self.bilateral_sigma_color},{self.bilateral_sigma_space}"
+            f"|clahe={self.clahe_clip_limit},{tuple(self.clahe_tile_grid)}|vgg={bool(for_vgg)}"
+        )
+
     def preprocess_dataset(self, input_dir, output_dir, file_extensions=('.jpg', '.jpeg', '.png', '.bmp')):
         """
         Preprocess entire dataset directory.
@@ -197,8 +223,17 @@ class DataAugmentor:
     Data augmentation for training kidney stone detection model.
     """
 
-    def __init__(self, target_size=(224, 224)):
+    def __init__(self, target_size=(224, 224), seed=None):
+        """
+        Initialize augmentation pipelines.
+
+        Args:
+            target_size: Tuple (height, width) of augmented images
+            seed: Optional seed for the batched (NumPy / tf.data) path
+        """
         self.target_size = target_size
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
 
         # Training augmentation pipeline
         self.train_transform = A.Compose([
@@ -234,6 +269,257 @@ class DataAugmentor:
         augmented = self.val_transform(image=image)
         return augmented['image']
 
+    def augment_train_batch(self, images, seed=None):
+        """
+        Apply the training augmentation policy to a whole batch at once.
+
+        Batched version of augment_train. Random parameters are drawn for the
+        whole batch at once, rotate, flip, shift-scale-rotate and the final
+        resize are folded into a single affine matrix per image, and
+        brightness/contrast and Gaussian noise are applied to the batch as
+        array ops at the output resolution.
+
+        Args:
+            images: Batch of shape (N, H, W) or (N, H, W, C), uint8 or float in [0, 1]
+            seed: Optional seed for this batch; if None the augmentor's own
+                  generator is used
+
+        Returns:
+            Augmented batch of shape (N, target_h, target_w[, C]) with the input dtype
+        """
+        rng = self.rng if seed is None else np.random.default_rng(seed)
+
+        images = np.asarray(images)
+        squeeze = images.ndim == 3
+        if squeeze:
+            images = images[..., np.newaxis]
+
+        n, h, w, c = images.shape
+        out_h, out_w = self.target_size
+        max_value = 255.0 if images.dtype == np.uint8 else 1.0
+
+        # Sample the same policy as train_transform, one draw per image
+        rotate = rng.random(n) < 0.5
+        angle1 = np.where(rotate, rng.uniform(-20, 20, n), 0.0)
+        flip = rng.random(n) < 0.5
+        ssr = rng.random(n) < 0.5
+        angle2 = np.where(ssr, rng.uniform(-15, 15, n), 0.0)
+        scale = np.where(ssr, 1.0 + rng.uniform(-0.1, 0.1, n), 1.0)
+        dx = np.where(ssr, rng.uniform(-0.1, 0.1, n), 0.0) * w
+        dy = np.where(ssr, rng.uniform(-0.1, 0.1, n), 0.0) * h
+        brightness_contrast = rng.random(n) < 0.3
+        alpha = np.where(brightness_contrast, 1.0 + rng.uniform(-0.2, 0.2, n), 1.0)
+        beta = np.where(brightness_contrast, rng.uniform(-0.2, 0.2, n), 0.0) * max_value
+        noise = rng.random(n) < 0.2
+        sigma = np.sqrt(rng.uniform(10.0, 50.0, n)) * (max_value / 255.0)
+
+        # Forward affine: resize @ shift @ shift-scale-rotate @ flip @ rotate
+        cx, cy = (w - 1) / 2.0, (h - 1) / 2.0
+        flip_m = np.tile(np.eye(3), (n, 1, 1))
+        flip_m[flip, 0, 0] = -1.0
+        flip_m[flip, 0, 2] = w - 1
+        shift_m = np.tile(np.eye(3), (n, 1, 1))
+        shift_m[:, 0, 2] = dx
+        shift_m[:, 1, 2] = dy
+        sx, sy = out_w / w, out_h / h
+        resize_m = np.array([[sx, 0.0, 0.5 * sx - 0.5],
+                             [0.0, sy, 0.5 * sy - 0.5],
+                             [0.0, 0.0, 1.0]])
+
+        forward = (resize_m @ shift_m @ _rotation_matrices(angle2, scale, cx, cy)
+                   @ flip_m @ _rotation_matrices(angle1, np.ones(n), cx, cy))
+
+        # One warp per image replaces the three warps + resize of the
+        # per-image pipeline (cv2 releases the GIL, so tf.data can run
+        # several batches concurrently)
+        identity = np.all(np.isclose(forward, np.eye(3)), axis=(1, 2))
+        src = images if images.dtype in (np.uint8, np.float32) else images.astype(np.float32)
+        out = np.empty((n, out_h, out_w, c), dtype=np.float32)
+        for i in range(n):
+            if identity[i]:
+                out[i] = src[i]
+                continue
+            warped = cv2.warpAffine(
+                src[i],
+                forward[i, :2],
+                (out_w, out_h),
+                flags=cv2.INTER_LINEAR,
+                borderMode=cv2.BORDER_REFLECT_101
+            )
+            out[i] = warped.reshape(out_h, out_w, c)
+
+        # RandomBrightnessContrast
+        adjusted = np.flatnonzero(brightness_contrast)
+        if len(adjusted):
+            out[adjusted] = (out[adjusted] * alpha[adjusted, None, None, None].astype(np.float32)
+                             + beta[adjusted, None, None, None].astype(np.float32))
+
+        # GaussNoise (variance is defined on the 0-255 scale)
+        noisy = np.flatnonzero(noise)
+        if len(noisy):
+            out[noisy] += (rng.standard_normal((len(noisy), out_h, out_w, c), dtype=np.float32)
+                           * sigma[noisy, None, None, None].astype(np.float32))
+
+        np.clip(out, 0.0, max_value, out=out)
+        if images.dtype == np.uint8:
+            out = np.rint(out).astype(np.uint8)
+        else:
+            out = out.astype(images.dtype)
+
+        return out[..., 0] if squeeze else out
+
+    def make_train_dataset(self, X, y, batch_size=32, shuffle=True):
+        """
+        Build a tf.data pipeline that augments whole batches in parallel.
+
+        Each batch is paired with a seed drawn from a seeded random stream,
+        so runs are reproducible when the augmentor has a seed, while every
+        epoch still sees different augmentations.
+
+        Args:
+            X: Training images (N, H, W[, C])
+            y: Training labels
+            batch_size: Batch size
+            shuffle: Whether to shuffle samples every epoch
+
+        Returns:
+            tf.data.Dataset yielding (augmented_images, labels) batches
+        """
+        import tensorflow as tf
+
+        dataset = tf.data.Dataset.from_tensor_slices((X, y))
+        if shuffle:
+            dataset = dataset.shuffle(len(X), seed=self.seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+
+        seeds = tf.data.Dataset.random(seed=self.seed, rerandomize_each_iteration=True)
+        dataset = tf.data.Dataset.zip((seeds, dataset))
+
+        output_shape = [None, *self.target_size, *X.shape[3:]]
+
+        def _augment(batch_seed, batch):
+            images, labels = batch
+            augmented = tf.numpy_function(
+                lambda s, imgs: self.augment_train_batch(imgs, seed=int(s) % (2 ** 63)),
+                [batch_seed, images],
+                images.dtype
+            )
+            augmented.set_shape(output_shape)
+            return augmented, labels
+
+        return dataset.map(_augment, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def gray_to_rgb(images):
+    """
+    Replicate preprocessed grayscale images to 3 channels.
+
+    Produces the same values as UltrasoundPreprocessor.preprocess_for_vgg,
+    without re-reading and re-preprocessing the images.
+
+    Args:
+        images: Grayscale images (N, H, W) or (N, H, W, 1)
+
+    Returns:
+        3-channel images (N, H, W, 3)
+    """
+    if images.ndim == 3:
+        images = images[..., np.newaxis]
+    return np.repeat(images, 3, axis=-1)
+
+
+def list_dataset_files(data_dir, verbose=False):
+    """
+    List the readable images of a dataset directory, stone first.
+
+    Files OpenCV cannot decode are dropped here rather than by each loader,
+    so train.load_dataset and export.RepresentativeDataset see the same
+    file list and index-based train/test splits line up between them.
+
+    Args:
+        data_dir: Dataset directory with stone/ and normal/ subdirs
+        verbose: Print per-class counts and skipped files
+
+    Returns:
+        files: Readable image paths
+        labels: Labels (1=stone, 0=normal)
+    """
+    data_path = Path(data_dir)
+    files, labels = [], []
+
+    for label, class_name in ((1, 'stone'), (0, 'normal')):
+        class_dir = data_path / class_name
+        if not class_dir.exists():
+            continue
+        class_files = list(class_dir.glob('*.[jp][pn][g]')) + list(class_dir.glob('*.jpeg'))
+        if verbose:
+            print(f"Found {len(class_files)} {class_name} images")
+
+        for img_path in class_files:
+            if cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE) is None:
+                if verbose:
+                    print(f"Error loading {img_path}: unreadable image, skipped")
+                continue
+            files.append(img_path)
+            labels.append(label)
+
+    return files, labels
+
+
+def _rotation_matrices(angles, scales, cx, cy):
+    """Batched 3x3 equivalents of cv2.getRotationMatrix2D."""
+    radians = np.deg2rad(angles)
+    a = scales * np.cos(radians)
+    b = scales * np.sin(radians)
+
+    matrices = np.zeros((len(angles), 3, 3))
+    matrices[:, 0, 0] = a
+    matrices[:, 0, 1] = b
+    matrices[:, 0, 2] = (1 - a) * cx - b * cy
+    matrices[:, 1, 0] = -b
+    matrices[:, 1, 1] = a
+    matrices[:, 1, 2] = b * cx + (1 - a) * cy
+    matrices[:, 2, 2] = 1.0
+    return matrices
+
+
+def benchmark_augmentation(images, batch_size=32, seed=42):
+    """
+    Compare throughput of per-image (albumentations) and batched augmentation.
+
+    Args:
+        images: Sample images (N, H, W[, C])
+        batch_size: Batch size for the batched path
+        seed: Seed for the batched path
+
+    Returns:
+        Dictionary with images/sec for both paths and the speedup
+    """
+    augmentor = DataAugmentor(target_size=tuple(images.shape[1:3]), seed=seed)
+
+    start = time.perf_counter()
+    for img in images:
+        augmentor.augment_train(img)
+    per_image_ips = len(images) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        augmentor.augment_train_batch(images[i:i + batch_size])
+    batched_ips = len(images) / (time.perf_counter() - start)
+
+    results = {
+        'per_image_ips': per_image_ips,
+        'batched_ips': batched_ips,
+        'speedup': batched_ips / per_image_ips
+    }
+
+    print("\nAugmentation throughput:")
+    print(f"  Per-image (albumentations): {per_image_ips:.1f} images/sec")
+    print(f"  Batched (NumPy, bs={batch_size}): {batched_ips:.1f} images/sec")
+    print(f"  Speedup: {results['speedup']:.2f}x")
+
+    return results
+
 
 def visualize_preprocessing(image_path, output_path=None):
     """
@@ -0,0 +1,330 @@
+"""
+RayScan ML Model - Structured Pruning
+L1-norm filter/neuron pruning of the Sequential CNNs with fine-tuning,
+TFLite export and a size/latency/accuracy report per sparsity level
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+from pathlib import Path
+from tensorflow import keras
+from tensorflow.keras import layers
+from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, recall_score
+
+from preprocessing import UltrasoundPreprocessor
+from export import TFLiteExporter, run_tflite_inference, tflite_latency
+
+
+def layer_widths(model):
+    """Number of filters/units of every Conv2D and Dense layer, in order."""
+    return [
+        layer.filters if isinstance(layer, layers.Conv2D) else layer.units
+        for layer in model.layers
+        if isinstance(layer, (layers.Conv2D, layers.Dense))
+    ]
+
+
+def _keep_top_l1(kernel, keep):
+    """Indices of the `keep` output channels with the largest L1 norm."""
+    norms = np.abs(kernel).reshape(-1, kernel.shape[-1]).sum(axis=0)
+    return np.sort(np.argsort(norms)[::-1][:keep])
+
+
+def prune_sequential(model, sparsity, reference_widths=None, min_width=4):
+    """
+    Remove the lowest-L1 conv filters and dense neurons of a Sequential model.
+
+    The pruned model is rebuilt with narrower layers, so parameters, FLOPs
+    and the exported file all shrink (unlike masking weights to zero).
+    Downstream BatchNormalization parameters, the next layer's input
+    channels and the Flatten -> Dense rows are sliced to match. The last
+    Dense layer keeps all its outputs (classifier or feature size).
+
+    Args:
+        model: Sequential model of Conv2D/Dense/BatchNormalization/pooling/
+               Dropout/Flatten/GlobalAveragePooling2D layers
+        sparsity: Fraction of filters/units to remove from each layer
+        reference_widths: Widths the sparsity is relative to (the
+                          unpruned model), for pruning an already pruned model
+        min_width: Minimum filters/units kept per layer
+
+    Returns:
+        Pruned (uncompiled) Sequential model
+    """
+    weighted = [l for l in model.layers if isinstance(l, (layers.Conv2D, layers.Dense))]
+    reference_widths = reference_widths or layer_widths(model)
+    last_dense = [l for l in weighted if isinstance(l, layers.Dense)][-1]
+
+    keep = np.arange(model.input_shape[-1])
+    new_layers, new_weights = [], []
+    w_idx = 0
+
+    for layer in model.layers:
+        config = layer.get_config()
+        config.pop('batch_input_shape', None)
+        weights = layer.get_weights()
+
+        if isinstance(layer, layers.Conv2D):
+            kernel = weights[0][:, :, keep, :]
+            target = max(min_width, int(round(reference_widths[w_idx] * (1 - sparsity))))
+            out_keep = _keep_top_l1(kernel, min(target, kernel.shape[-1]))
+            config['filters'] = len(out_keep)
+            weights = [kernel[..., out_keep]] + [b[out_keep] for b in weights[1:]]
+            keep = out_keep
+            w_idx += 1
+
+        elif isinstance(layer, layers.Dense):
+            kernel = weights[0][keep, :]
+            if layer is last_dense:
+                out_keep = np.arange(kernel.shape[-1])
+            else:
+                target = max(min_width, int(round(reference_widths[w_idx] * (1 - sparsity))))
+                out_keep = _keep_top_l1(kernel, min(target, kernel.shape[-1]))
+            config['units'] = len(out_keep)
+            weights = [kernel[:, out_keep]] + [b[out_keep] for b in weights[1:]]
+            keep = out_keep
+            w_idx += 1
+
+        elif isinstance(layer, layers.BatchNormalization):
+            weights = [w[keep] for w in weights]
+
+        elif isinstance(layer, layers.Flatten):
+            # Flatten orders features as (h, w, c): keep the kept channels
+            # at every spatial position
+            h, w, c = layer.input_shape[1:]
+            keep = (np.arange(h * w)[:, None] * c + keep[None, :]).ravel()
+
+        elif not isinstance(layer, (layers.MaxPooling2D, layers.AveragePooling2D,
+                                    layers.Dropout, layers.GlobalAveragePooling2D)):
+            raise ValueError(f"Unsupported layer for structured pruning: {layer.__class__.__name__}")
+
+        new_layers.append(layer.__class__.from_config(config))
+        new_weights.append(weights)
+
+    pruned = keras.Sequential(
+        [keras.Input(shape=model.input_shape[1:])] + new_layers,
+        name=model.name if model.name.endswith('_pruned') else f'{model.name}_pruned'
+    )
+    for layer, weights in zip(pruned.layers, new_weights):
+        if weights:
+            layer.set_weights(weights)
+
+    return pruned
+
+
+def fine_tune(model, X_train, y_train, X_val, y_val, epochs=10, batch_size=32, learning_rate=1e-4):
+    """
+    Recompile and fine-tune a pruned end-to-end classifier.
+
+    Args:
+        model: Pruned Keras classifier
+        X_train, y_train: Training data
+        X_val, y_val: Validation data
+        epochs: Fine-tuning epochs
+        batch_size: Batch size
+        learning_rate: Fine-tuning learning rate (lower than initial training)
+
+    Returns:
+        Training history
+    """
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='binary_crossentropy',
+        metrics=['accuracy', keras.metrics.Precision(), keras.metrics.Recall()]
+    )
+
+    callbacks = [
+        EarlyStopping(
+            monitor='val_loss',
+            patience=4,
+            restore_best_weights=True
+        ),
+        ReduceLROnPlateau(
+            monitor='val_loss',
+            factor=0.5,
+            patience=2,
+            min_lr=1e-7
+        )
+    ]
+
+    return model.fit(
+        X_train, y_train,
+        validation_data=(X_val, y_val),
+        epochs=epochs,
+        batch_size=batch_size,
+        callbacks=callbacks
+    )
+
+
+def export_and_measure(model, X_test, y_test, tflite_path, quantization='dynamic'):
+    """
+    Export a classifier with TFLiteExporter and measure it on the test set.
+
+    Args:
+        model: Keras classifier with a sigmoid output
+        X_test, y_test: Test data
+        tflite_path: Where to write the .tflite file
+        quantization: 'none' or a TFLiteExporter.export_quantized mode
+
+    Returns:
+        Dictionary with params, sizes, latency and accuracy
+    """
+    exporter = TFLiteExporter(model, input_shape=model.input_shape[1:])
+    if quantization == 'none':
+        exporter.export_basic(tflite_path)
+    else:
+        exporter.export_quantized(tflite_path, quantization)
+
+    proba = run_tflite_inference(tflite_path, X_test).ravel()
+    y_pred = (proba > 0.5).astype(int)
+
+    return {
+        'params': int(model.count_params()),
+        'tflite_size_mb': os.path.getsize(tflite_path) / (1024 * 1024),
+        'latency_ms': tflite_latency(tflite_path, X_test[0]),
+        'accuracy': float(accuracy_score(y_test, y_pred)),
+        'recall': float(recall_score(y_test, y_pred)),
+    }
+
+
+def sparsity_sweep(model, X_train, y_train, X_val, y_val, X_test, y_test,
+                   levels=(0.25, 0.5, 0.75), epochs=10, batch_size=32,
+                   output_dir='../models/pruned', quantization='dynamic'):
+    """
+    Prune an end-to-end classifier to increasing sparsity levels.
+
+    Levels are applied gradually: each level is pruned from the previous
+    fine-tuned model (sparsity is relative to the original widths), which
+    loses less accuracy than pruning straight to the target.
+
+    Args:
+        model: Trained Keras classifier (e.g. EndToEndCNN.model)
+        X_train, y_train: Fine-tuning data
+        X_val, y_val: Validation data
+        X_test, y_test: Test data for the report
+        levels: Sparsity levels
+        epochs: Fine-tuning epochs per level
+        batch_size: Batch size
+        output_dir: Directory for pruned .keras and .tflite files
+        quantization: TFLite export mode
+
+    Returns:
+        List of report rows (level 0 is the unpruned model)
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    reference_widths = layer_widths(model)
+
+    print("\n📏 Baseline (unpruned)")
+    rows = [{'sparsity': 0.0, **export_and_measure(
+        model, X_test, y_test, output_path / 'pruned_0.tflite', quantization
+    )}]
+
+    current = model
+    for level in sorted(levels):
+        print(f"\n{'='*60}")
+        print(f"✂️  Pruning to sparsity {level:.0%}")
+        print(f"{'='*60}")
+
+        current = prune_sequential(current, level, reference_widths)
+        fine_tune(current, X_train, y_train, X_val, y_val, epochs, batch_size)
+
+        name = f'pruned_{int(round(level * 100))}'
+        current.save(str(output_path / f'{name}.keras'))
+        rows.append({'sparsity': level, **export_and_measure(
+            current, X_test, y_test, output_path / f'{name}.tflite', quantization
+        )})
+
+    print_sparsity_report(rows)
+
+    return rows
+
+
+def prune_hybrid(hybrid, sparsity, X_train, y_train):
+    """
+    Prune a HybridClassifier's CustomCNN extractor and refit its classifier.
+
+    The extractor has no classification head to fine-tune, so the
+    classifier is retrained on the pruned extractor's features instead.
+
+    Args:
+        hybrid: Trained HybridClassifier with a 'cnn' extractor
+        sparsity: Fraction of filters/units to remove
+        X_train, y_train: Training data for the classifier
+
+    Returns:
+        The same HybridClassifier with a pruned extractor
+    """
+    hybrid.feature_extractor.model = prune_sequential(hybrid.feature_extractor.model, sparsity)
+    hybrid.invalidate_features()
+    hybrid.train(X_train, y_train)
+    return hybrid
+
+
+def print_sparsity_report(rows):
+    """Print params, TFLite size, latency and accuracy per sparsity level."""
+    print("\n📊 Pruning Report:")
+    print(f"   {'Sparsity':>9}{'Params':>12}{'TFLite (MB)':>13}{'Latency (ms)':>14}{'Accuracy':>10}{'Recall':>9}")
+    for r in rows:
+        print(f"   {r['sparsity']:>9.0%}{r['params']:>12,}{r['tflite_size_mb']:>13.2f}"
+              f"{r['latency_ms']:>14.2f}{r['accuracy']:>10.4f}{r['recall']:>9.4f}")
+
+
+def main(args):
+    """Prune a trained end-to-end CNN on the processed dataset."""
+    from train import load_dataset
+
+    preprocessor = UltrasoundPreprocessor(target_size=(224, 224))
+    X, y = load_dataset(args.data_dir, preprocessor)
+
+    # Same split as train.py
+    X_train, X_temp, y_train, y_temp = train_test_split(
+        X, y, test_size=0.3, stratify=y, random_state=42
+    )
+    X_val, X_test, y_val, y_test = train_test_split(
+        X_temp, y_temp, test_size=0.5, stratify=y_temp, random_state=42
+    )
+
+    model = keras.models.load_model(args.model_path)
+
+    rows = sparsity_sweep(
+        model, X_train, y_train, X_val, y_val, X_test, y_test,
+        levels=args.levels,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        output_dir=args.output_dir,
+        quantization=args.quantization
+    )
+
+    report_path = Path(args.output_dir) / 'pruning_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(rows, f, indent=2)
+
+    print(f"\nReport saved to: {report_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Structured pruning of the end-to-end CNN')
+    parser.add_argument('--data_dir', type=str, default='../data/processed',
+                       help='Path to processed dataset')
+    parser.add_argument('--model_path', type=str, default='../models/end_to_end_cnn.keras',
+                       help='Trained end-to-end CNN')
+    parser.add_argument('--levels', type=float, nargs='+', default=[0.25, 0.5, 0.75],
+                       help='Sparsity levels (fraction of filters/units removed)')
+    parser.add_argument('--epochs', type=int, default=10,
+                       help='Fine-tuning epochs per level')
+    parser.add_argument('--batch_size', type=int, default=32,
+                       help='Batch size')
+    parser.add_argument('--quantization', type=str, default='dynamic',
+                       choices=['none', 'dynamic', 'float16'],
+                       help='TFLite export mode')
+    parser.add_argument('--output_dir', type=str, default='../models/pruned',
+                       help='Directory for pruned models and report')
+
+    args = parser.parse_args()
+    main(args)
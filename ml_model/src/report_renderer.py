@@ -0,0 +1,252 @@
+"""
+RayScan ML Model - Report Renderer
+Off-screen (Agg) matplotlib figures for Grad-CAM and evaluation reports,
+rendered to PNG in a process pool once the numeric work is done
+"""
+
+import os
+import sys
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+
+# pyplot is imported only for interactive figures, so services rendering
+# reports off-screen never load it
+
+
+def new_figure(figsize, interactive=False):
+    """
+    Create a figure.
+
+    Non-interactive figures are plain Figure objects: they render with
+    Agg regardless of the pyplot backend, are never registered with
+    pyplot (so they cannot leak) and never open a window.
+
+    Args:
+        figsize: Figure size
+        interactive: Create a pyplot figure that plt.show() can display
+    """
+    if interactive:
+        import matplotlib.pyplot as plt
+        return plt.figure(figsize=figsize)
+    return Figure(figsize=figsize)
+
+
+def _close(fig):
+    """Close a pyplot-managed figure (plain Figures are never registered)."""
+    plt = sys.modules.get('matplotlib.pyplot')
+    if plt is not None:
+        plt.close(fig)
+
+
+def gradcam_figure(original_image, heatmap, superimposed, pred_class, confidence,
+                   heatmap_title='Grad-CAM Heatmap', figsize=(15, 5), interactive=False):
+    """
+    Build the 3-panel Grad-CAM figure.
+
+    Args:
+        original_image: Original image (grayscale or RGB)
+        heatmap: Heatmap in [0, 1]
+        superimposed: Heatmap overlay (BGR, as returned by overlay_heatmap)
+        pred_class: Predicted class name
+        confidence: Prediction confidence in [0, 1]
+        heatmap_title: Title of the heatmap panel
+        figsize: Figure size
+        interactive: Create a pyplot figure (for plt.show())
+
+    Returns:
+        Matplotlib figure
+    """
+    fig = new_figure(figsize, interactive)
+    axes = fig.subplots(1, 3)
+
+    # Original image
+    if len(original_image.shape) == 2:
+        axes[0].imshow(original_image, cmap='gray')
+    else:
+        axes[0].imshow(original_image)
+    axes[0].set_title('Original Image', fontsize=12)
+    axes[0].axis('off')
+
+    # Heatmap
+    axes[1].imshow(heatmap, cmap='jet')
+    axes[1].set_title(heatmap_title, fontsize=12)
+    axes[1].axis('off')
+
+    # Superimposed (BGR -> RGB)
+    axes[2].imshow(superimposed[..., ::-1])
+    axes[2].set_title(f'Prediction: {pred_class} ({confidence:.1%})', fontsize=12)
+    axes[2].axis('off')
+
+    fig.suptitle('Grad-CAM Visualization for Kidney Stone Detection', fontsize=14, y=1.02)
+    fig.tight_layout()
+
+    return fig
+
+
+def confusion_matrix_figure(cm, class_names, figsize=(8, 6), interactive=False):
+    """Confusion matrix with counts and row percentages."""
+    import seaborn as sns
+
+    cm = np.asarray(cm)
+    cm_normalized = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
+
+    fig = new_figure(figsize, interactive)
+    ax = fig.subplots()
+
+    # Create annotations with counts and percentages
+    annotations = np.array([[f'{count}\n({pct:.1%})'
+                            for count, pct in zip(row_count, row_pct)]
+                           for row_count, row_pct in zip(cm, cm_normalized)])
+
+    sns.heatmap(cm, annot=annotations, fmt='', cmap='Blues', ax=ax,
+               xticklabels=class_names, yticklabels=class_names)
+
+    ax.set_xlabel('Predicted Label', fontsize=12)
+    ax.set_ylabel('True Label', fontsize=12)
+    ax.set_title('Confusion Matrix', fontsize=14)
+
+    fig.tight_layout()
+
+    return fig
+
+
+def roc_figure(fpr, tpr, auc, optimal_idx, optimal_threshold, figsize=(8, 6), interactive=False):
+    """ROC curve with the Youden-optimal operating point."""
+    fig = new_figure(figsize, interactive)
+    ax = fig.subplots()
+
+    ax.plot(fpr, tpr, 'b-', linewidth=2, label=f'ROC Curve (AUC = {auc:.4f})')
+    ax.plot([0, 1], [0, 1], 'r--', linewidth=1, label='Random Classifier')
+
+    # Highlight operating point
+    ax.scatter(fpr[optimal_idx], tpr[optimal_idx], c='green', s=100,
+              label=f'Optimal Threshold ({optimal_threshold:.3f})', zorder=5)
+
+    ax.set_xlabel('False Positive Rate (1 - Specificity)', fontsize=12)
+    ax.set_ylabel('True Positive Rate (Sensitivity)', fontsize=12)
+    ax.set_title('Receiver Operating Characteristic (ROC) Curve', fontsize=14)
+    ax.legend(loc='lower right')
+    ax.grid(True, alpha=0.3)
+
+    fig.tight_layout()
+
+    return fig
+
+
+def pr_figure(precision, recall, average_precision, figsize=(8, 6), interactive=False):
+    """Precision-Recall curve."""
+    fig = new_figure(figsize, interactive)
+    ax = fig.subplots()
+
+    ax.plot(recall, precision, 'b-', linewidth=2,
+           label=f'PR Curve (AP = {average_precision:.4f})')
+
+    ax.set_xlabel('Recall (Sensitivity)', fontsize=12)
+    ax.set_ylabel('Precision', fontsize=12)
+    ax.set_title('Precision-Recall Curve', fontsize=14)
+    ax.legend(loc='lower left')
+    ax.grid(True, alpha=0.3)
+
+    fig.tight_layout()
+
+    return fig
+
+
+def threshold_figure(thresholds, precisions, recalls, specificities, f1s, figsize=(10, 6),
+                     interactive=False):
+    """Precision, recall, specificity and F1 against the classification threshold."""
+    fig = new_figure(figsize, interactive)
+    ax = fig.subplots()
+
+    ax.plot(thresholds, precisions, 'b-', label='Precision', linewidth=2)
+    ax.plot(thresholds, recalls, 'g-', label='Recall (Sensitivity)', linewidth=2)
+    ax.plot(thresholds, specificities, 'r-', label='Specificity', linewidth=2)
+    ax.plot(thresholds, f1s, 'purple', label='F1-Score', linewidth=2, linestyle='--')
+
+    # Mark current threshold (0.5)
+    ax.axvline(x=0.5, color='gray', linestyle='--', alpha=0.5, label='Default (0.5)')
+
+    ax.set_xlabel('Classification Threshold', fontsize=12)
+    ax.set_ylabel('Score', fontsize=12)
+    ax.set_title('Metrics vs Classification Threshold', fontsize=14)
+    ax.legend(loc='center right')
+    ax.grid(True, alpha=0.3)
+
+    fig.tight_layout()
+
+    return fig
+
+
+def save_figure(fig, save_path, dpi=150):
+    """Save a figure to PNG and close it (figures are never left open)."""
+    try:
+        fig.savefig(save_path, dpi=dpi, bbox_inches='tight')
+    finally:
+        _close(fig)
+    return str(save_path)
+
+
+def finish_figure(fig, save_path=None, show=False, label='Figure'):
+    """
+    Save, optionally display, and close a figure.
+
+    Args:
+        fig: Figure from one of the builders
+        save_path: PNG path (None to skip saving)
+        show: Display with plt.show() (needs an interactive figure)
+        label: Name used in the saved message
+    """
+    if save_path:
+        fig.savefig(save_path, dpi=150, bbox_inches='tight')
+        print(f"{label} saved to: {save_path}")
+
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+    _close(fig)
+
+
+def _init_worker():
+    """Force the Agg backend in render workers."""
+    matplotlib.use('Agg')
+
+
+def _render_task(task):
+    """Build, save and close one figure (runs in a worker process)."""
+    figure_fn, kwargs, save_path = task
+    return save_figure(figure_fn(**kwargs), save_path)
+
+
+def render_figures(tasks, max_workers=None, parallel=True):
+    """
+    Render figures to PNG files.
+
+    Each task is (figure_fn, kwargs, save_path) where figure_fn is one of
+    the module-level figure builders and kwargs hold plain arrays/values,
+    so the numeric work (heatmaps, curves) stays in the caller and only
+    matplotlib runs in the pool. Workers are spawned (not forked) so they
+    never inherit TensorFlow state from the parent.
+
+    Args:
+        tasks: List of (figure_fn, kwargs, save_path)
+        max_workers: Worker processes (default: CPU count)
+        parallel: Use a process pool (False renders in this process)
+
+    Returns:
+        List of saved paths, in task order
+    """
+    tasks = list(tasks)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+
+    if not parallel or max_workers <= 1:
+        return [_render_task(task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context('spawn'),
+                             initializer=_init_worker) as executor:
+        # Chunks amortize the pickling/IPC cost of small figures
+        chunksize = max(1, len(tasks) // (max_workers * 4))
+        return list(executor.map(_render_task, tasks, chunksize=chunksize))
@@ -4,6 +4,9 @@ Complete training pipeline for kidney stone detection
 """
 
 import os
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
@@ -16,8 +19,14 @@ from tqdm import tqdm
 import json
 import argparse
 
-from preprocessing import UltrasoundPreprocessor, DataAugmentor
+from preprocessing import UltrasoundPreprocessor, DataAugmentor, gray_to_rgb, list_dataset_files
 from models import CustomCNN, VGG16FeatureExtractor, EndToEndCNN, HybridClassifier
+from feature_store import FeatureStore
+from export import compare_int8_variants, RepresentativeDataset
+from parallel_utils import SharedArray, attach_shared
+from checkpointing import TrainingStateCheckpoint, cached_dataset
+from autotune import autotune_once, apply_config
+from hyperparam_search import load_classifier_params
 
 
 def load_dataset(data_dir, preprocessor, for_vgg=False):
@@ -33,44 +42,15 @@ def load_dataset(data_dir, preprocessor, for_vgg=False):
         X: Preprocessed images
         y: Labels (1=stone, 0=normal)
     """
-    data_path = Path(data_dir)
+    # Readable files only, in the order RepresentativeDataset splits them
+    files, labels = list_dataset_files(data_dir, verbose=True)
 
     images = []
-    labels = []
-
-    # Load stone images
-    stone_dir = data_path / 'stone'
-    if stone_dir.exists():
-        stone_files = list(stone_dir.glob('*.[jp][pn][g]')) + list(stone_dir.glob('*.jpeg'))
-        print(f"Found {len(stone_files)} stone images")
-
-        for img_path in tqdm(stone_files, desc="Loading stone images"):
-            try:
-                if for_vgg:
-                    img = preprocessor.preprocess_for_vgg(img_path)
-                else:
-                    img = preprocessor.preprocess_single(img_path)
-                images.append(img)
-                labels.append(1)  # Stone = 1
-            except Exception as e:
-                print(f"Error loading {img_path}: {e}")
-
-    # Load normal images
-    normal_dir = data_path / 'normal'
-    if normal_dir.exists():
-        normal_files = list(normal_dir.glob('*.[jp][pn][g]')) + list(normal_dir.glob('*.jpeg'))
-        print(f"Found {len(normal_files)} normal images")
-
-        for img_path in tqdm(normal_files, desc="Loading normal images"):
-            try:
-                if for_vgg:
-                    img = preprocessor.preprocess_for_vgg(img_path)
-                else:
-                    img = preprocessor.preprocess_single(img_path)
-                images.append(img)
-                labels.append(0)  # Normal = 0
-            except Exception as e:
-                print(f"Error loading {img_path}: {e}")
+    for img_path in tqdm(files, desc="Loading images"):
+        if for_vgg:
+            images.append(preprocessor.preprocess_for_vgg(img_path))
+        else:
+            images.append(preprocessor.preprocess_single(img_path))
 
     X = np.array(images)
     y = np.array(labels)
@@ -87,7 +67,9 @@ def load_dataset(data_dir, preprocessor, for_vgg=False):
     return X, y
 
 
-def train_hybrid_model(X_train, y_train, X_val, y_val, feature_extractor='cnn', classifier='xgboost'):
+def train_hybrid_model(X_train, y_train, X_val, y_val, feature_extractor='cnn', classifier='xgboost',
+                       feature_store=None, preprocessing_fingerprint='', n_jobs=None,
+                       classifier_params=None):
     """
     Train hybrid CNN + XGBoost/RF model.
 
@@ -96,6 +78,10 @@ def train_hybrid_model(X_train, y_train, X_val, y_val, feature_extractor='cnn',
         X_val, y_val: Validation data
         feature_extractor: 'cnn' or 'vgg16'
         classifier: 'xgboost' or 'random_forest'
+        feature_store: Optional FeatureStore for cached features
+        preprocessing_fingerprint: Preprocessing identifier for the feature store
+        n_jobs: Threads for the classifier (None keeps its setting)
+        classifier_params: Classifier hyperparameter overrides (None keeps the defaults)
 
     Returns:
         Trained HybridClassifier
@@ -106,15 +92,20 @@ def train_hybrid_model(X_train, y_train, X_val, y_val, feature_extractor='cnn',
 
     model = HybridClassifier(
         feature_extractor=feature_extractor,
-        classifier=classifier
+        classifier=classifier,
+        feature_store=feature_store,
+        preprocessing_fingerprint=preprocessing_fingerprint,
+        classifier_params=classifier_params
     )
+    if n_jobs is not None and 'n_jobs' in model.classifier.get_params():
+        model.classifier.set_params(n_jobs=n_jobs)
 
     metrics = model.train(X_train, y_train, X_val, y_val)
     print(f"Training accuracy: {metrics['train_accuracy']:.4f}")
 
     # Validation metrics
-    val_pred = model.predict(X_val)
-    val_proba = model.predict_proba(X_val)[:, 1]
+    val_pred, val_proba = model.predict_with_proba(X_val)
+    val_proba = val_proba[:, 1]
 
     val_acc = np.mean(val_pred == y_val)
     val_auc = roc_auc_score(y_val, val_proba)
@@ -128,7 +119,8 @@ def train_hybrid_model(X_train, y_train, X_val, y_val, feature_extractor='cnn',
     return model, {'val_accuracy': val_acc, 'val_auc': val_auc}
 
 
-def train_end_to_end_model(X_train, y_train, X_val, y_val, epochs=50, batch_size=32):
+def train_end_to_end_model(X_train, y_train, X_val, y_val, epochs=50, batch_size=32, augment=False,
+                           qat=False, qat_epochs=5, checkpoint=None):
     """
     Train end-to-end CNN model.
 
@@ -137,6 +129,10 @@ def train_end_to_end_model(X_train, y_train, X_val, y_val, epochs=50, batch_size
         X_val, y_val: Validation data
         epochs: Number of epochs
         batch_size: Batch size
+        augment: Whether to apply batched on-the-fly augmentation
+        qat: Whether to add quantization-aware fine-tuning for int8 export
+        qat_epochs: Quantization-aware fine-tuning epochs
+        checkpoint: Optional TrainingStateCheckpoint (periodic state, resume)
 
     Returns:
         Trained EndToEndCNN
@@ -147,11 +143,14 @@ def train_end_to_end_model(X_train, y_train, X_val, y_val, epochs=50, batch_size
 
     model = EndToEndCNN(input_shape=X_train.shape[1:])
 
-    history = model.train(X_train, y_train, X_val, y_val, epochs=epochs, batch_size=batch_size)
+    augmentor = DataAugmentor(target_size=X_train.shape[1:3], seed=42) if augment else None
+
+    history = model.train(X_train, y_train, X_val, y_val, epochs=epochs, batch_size=batch_size,
+                          augmentor=augmentor, qat=qat, qat_epochs=qat_epochs, checkpoint=checkpoint)
 
     # Validation metrics
-    val_pred = (model.predict(X_val) > 0.5).astype(int).flatten()
     val_proba = model.predict(X_val).flatten()
+    val_pred = (val_proba > 0.5).astype(int)
 
     val_acc = np.mean(val_pred == y_val)
     val_auc = roc_auc_score(y_val, val_proba)
@@ -165,62 +164,364 @@ def train_end_to_end_model(X_train, y_train, X_val, y_val, epochs=50, batch_size
     return model, history, {'val_accuracy': val_acc, 'val_auc': val_auc}
 
 
-def cross_validate(X, y, n_folds=5, model_type='hybrid_cnn_xgboost'):
+def _calibration_data(data_dir, input_shape, num_samples=100):
+    """
+    Post-training INT8 calibration images streamed from the training split on disk.
+
+    Replaces handing the in-memory X_train to the converter, so calibration
+    does not need the training array (or a copy of it in the export process).
+    """
+    # input_shape is (H, W, C); the preprocessor takes (width, height)
+    return RepresentativeDataset(data_dir, num_samples=num_samples,
+                                 target_size=tuple(input_shape[1::-1]))
+
+
+def _make_checkpoint(checkpoint_dir, interval_minutes=10, resume=False):
+    """End-to-end training state checkpoint in checkpoint_dir (None if disabled)."""
+    if not checkpoint_dir:
+        return None
+    return TrainingStateCheckpoint(Path(checkpoint_dir) / 'end_to_end_state.pkl',
+                                   interval_minutes=interval_minutes, resume=resume)
+
+
+# `--model all` comparison models -> saved artifact under the models directory
+COMPARISON_MODELS = {
+    'cnn_xgboost': 'cnn_xgboost',
+    'vgg16_xgboost': 'vgg16_xgboost',
+    'end_to_end': 'end_to_end_cnn.keras',
+}
+
+
+def _run_training_job(name, data, settings, n_jobs=None):
+    """
+    Train and save one model of the `--model all` comparison.
+
+    Args:
+        name: 'cnn_xgboost', 'vgg16_xgboost' or 'end_to_end'
+        data: Dictionary with grayscale X_train/X_val/X_test and y_train/y_val/y_test
+        settings: Training settings (see train_all_models)
+        n_jobs: Classifier threads (None keeps the default)
+
+    Returns:
+        Dictionary with validation metrics, resource usage and, for
+        end_to_end with QAT, the int8 comparison
+    """
+    from benchmark import _peak_rss_mb
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    models_dir = Path(settings['models_dir'])
+    feature_store = FeatureStore(settings['feature_cache'], dtype=settings['feature_dtype']) \
+        if settings['feature_cache'] else None
+    X_train, X_val = data['X_train'], data['X_val']
+    y_train, y_val = data['y_train'], data['y_val']
+    output = {}
+
+    if name == 'end_to_end':
+        model, history, metrics = train_end_to_end_model(
+            X_train, y_train, X_val, y_val,
+            epochs=settings['epochs'],
+            batch_size=settings['batch_size'],
+            augment=settings['augment'],
+            qat=settings['qat'],
+            qat_epochs=settings['qat_epochs'],
+            checkpoint=_make_checkpoint(settings['checkpoint_dir'], settings['checkpoint_minutes'],
+                                        settings['resume'])
+        )
+        model.model.save(str(models_dir / COMPARISON_MODELS[name]))
+
+        if settings['qat']:
+            output['int8_comparison'] = compare_int8_variants(
+                model.model, model.qat_model, data['X_test'], data['y_test'],
+                _calibration_data(settings['data_dir'], X_train.shape[1:]), models_dir / 'tflite'
+            )
+    else:
+        for_vgg = name == 'vgg16_xgboost'
+        if for_vgg:
+            # VGG16 needs 3 channels: replicate the loaded grayscale images
+            X_train, X_val = gray_to_rgb(X_train), gray_to_rgb(X_val)
+
+        model, metrics = train_hybrid_model(
+            X_train, y_train, X_val, y_val,
+            feature_extractor='vgg16' if for_vgg else 'cnn',
+            classifier='xgboost',
+            feature_store=feature_store,
+            preprocessing_fingerprint=settings['fingerprints'][name],
+            n_jobs=n_jobs,
+            classifier_params=settings['classifier_params'].get(name)
+        )
+        model.save(str(models_dir / COMPARISON_MODELS[name]))
+
+    output['metrics'] = metrics
+    output['resources'] = {
+        'wall_seconds': time.perf_counter() - wall_start,
+        'cpu_seconds': time.process_time() - cpu_start,
+        # Peak of this job's own process (each model runs in a fresh worker)
+        'peak_rss_mb': _peak_rss_mb(),
+        'threads': n_jobs,
+    }
+    return output
+
+
+def _init_training_worker(threads):
+    """Limit TensorFlow in a training worker to its share of the cores."""
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(2, threads))
+
+
+def _training_worker(name, specs, labels, settings, threads):
+    """Attach the shared images and run one training job (worker process)."""
+    data = {key: attach_shared(spec) for key, spec in specs.items()}
+    data.update(labels)
+    return _run_training_job(name, data, settings, n_jobs=threads)
+
+
+def _train_in_fresh_process(name, specs, labels, settings, threads):
+    """
+    Run one training job in a new spawned process that exits when it is done.
+
+    A single-worker pool per job (rather than max_tasks_per_child, which
+    needs Python 3.11) keeps each model's peak RSS its own on every
+    supported Python. Spawned, not forked: the parent has already
+    imported TensorFlow.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn'),
+                             initializer=_init_training_worker, initargs=(threads,)) as executor:
+        return executor.submit(_training_worker, name, specs, labels, settings, threads).result()
+
+
+def train_all_models(data, settings, max_parallel=None):
+    """
+    Train the `--model all` comparison models concurrently.
+
+    The models are independent, so each trains in its own fresh spawned
+    process with an equal share of the cores (TensorFlow intra-op threads and
+    XGBoost n_jobs). The grayscale splits are copied into shared memory
+    once; the VGG16 job derives its 3-channel input from them instead of
+    reloading the dataset from disk.
+
+    Args:
+        data: Dictionary with grayscale X_train/X_val/X_test and y_train/y_val/y_test
+        settings: Training settings (models_dir, data_dir, epochs, batch_size,
+                  augment, qat, qat_epochs, feature_cache, feature_dtype,
+                  fingerprints and classifier_params per hybrid model, checkpoint_dir,
+                  checkpoint_minutes, resume)
+        max_parallel: Concurrent training processes (default: one per model,
+                      up to the CPU count; 1 trains one model at a time)
+
+    Returns:
+        Dictionary with per-model outputs (metrics, resources) and the
+        total wall-clock time
+    """
+    cpus = os.cpu_count() or 1
+    max_parallel = min(max_parallel or cpus, len(COMPARISON_MODELS))
+    threads = max(1, cpus // max_parallel)
+
+    start = time.perf_counter()
+
+    if max_parallel <= 1:
+        print(f"Training {len(COMPARISON_MODELS)} models one at a time...")
+    else:
+        print(f"Training {len(COMPARISON_MODELS)} models in {max_parallel} processes "
+              f"({threads} threads each)...")
+    labels = {key: value for key, value in data.items() if not key.startswith('X_')}
+    shared = {key: SharedArray(value) for key, value in data.items() if key.startswith('X_')}
+    try:
+        specs = {key: array.spec for key, array in shared.items()}
+        # One fresh process per model (also when sequential), at most
+        # max_parallel at a time, so each model's peak RSS is its own
+        # rather than a cumulative process peak
+        with ThreadPoolExecutor(max_workers=max_parallel) as launcher:
+            # Longest job first, in case there are fewer processes than models
+            futures = {
+                name: launcher.submit(_train_in_fresh_process, name, specs, labels, settings, threads)
+                for name in reversed(COMPARISON_MODELS)
+            }
+            outputs = {name: futures[name].result() for name in COMPARISON_MODELS}
+    finally:
+        for array in shared.values():
+            array.close()
+
+    wall_clock = time.perf_counter() - start
+
+    print(f"\n{'='*60}")
+    print(f"Trained {len(outputs)} models in {wall_clock:.1f}s")
+    for name, output in outputs.items():
+        r = output['resources']
+        peak = f"{r['peak_rss_mb']:.0f} MB" if r['peak_rss_mb'] is not None else 'n/a'
+        print(f"  {name}: {r['wall_seconds']:.1f}s wall, {r['cpu_seconds']:.1f}s CPU, peak RSS {peak}")
+    print(f"{'='*60}")
+
+    return {'models': outputs, 'wall_clock_seconds': wall_clock}
+
+
+def _load_comparison_model(name, models_dir, input_shape):
+    """
+    Load a model saved by train_all_models.
+
+    Args:
+        name: Comparison model name
+        models_dir: Models directory
+        input_shape: Grayscale input shape (for end_to_end)
+
+    Returns:
+        HybridClassifier or EndToEndCNN
+    """
+    path = str(Path(models_dir) / COMPARISON_MODELS[name])
+
+    if name == 'end_to_end':
+        model = EndToEndCNN(input_shape=input_shape)
+        model.model = keras.models.load_model(path)
+    else:
+        model = HybridClassifier(feature_extractor=name.split('_')[0], classifier='xgboost')
+        model.load(path)
+
+    return model
+
+
+def _fit_fold(classifier, train_features, y_train, val_features, y_val, n_jobs=None):
+    """
+    Fit an unfitted copy of a classifier on one fold's features and score it.
+
+    Args:
+        classifier: Classifier template (cloned, never fitted itself)
+        train_features, y_train: Fold training features
+        val_features, y_val: Fold validation features
+        n_jobs: Threads for the classifier (None keeps its setting)
+
+    Returns:
+        Dictionary with accuracy, AUC and fit time
+    """
+    from sklearn.base import clone
+
+    clf = clone(classifier)
+    if n_jobs is not None and 'n_jobs' in clf.get_params():
+        clf.set_params(n_jobs=n_jobs)
+
+    start = time.perf_counter()
+    clf.fit(train_features, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    val_proba = clf.predict_proba(val_features)
+    val_pred = clf.classes_[np.argmax(val_proba, axis=1)]
+
+    return {
+        'accuracy': float(np.mean(val_pred == y_val)),
+        'auc': float(roc_auc_score(y_val, val_proba[:, 1])),
+        'fit_seconds': fit_seconds,
+    }
+
+
+def cross_validate(X, y, n_folds=5, model_type='hybrid_cnn_xgboost', feature_store=None,
+                   preprocessing_fingerprint='', n_jobs=-1):
     """
     Perform k-fold cross-validation.
 
+    Hybrid models have a frozen, seeded feature extractor, so features
+    are extracted once for the whole dataset and sliced per fold; only
+    the classifier is refit, with folds in parallel (joblib threads). End-to-end
+    CNNs are trained per fold.
+
     Args:
         X, y: Dataset
         n_folds: Number of folds
-        model_type: Model to evaluate
+        model_type: Model to evaluate ('hybrid_<cnn|vgg16>_<xgboost|rf>'
+                    or 'end_to_end')
+        feature_store: Optional FeatureStore; repeated runs reuse the
+                       cached features
+        preprocessing_fingerprint: Preprocessing identifier for the feature store
+        n_jobs: Parallel fold fits for hybrid models (-1 = all cores)
 
     Returns:
-        Cross-validation results
+        Cross-validation results (including per-fold timings)
     """
+    from joblib import Parallel, delayed, cpu_count
+
     print(f"\n{'='*60}")
     print(f"{n_folds}-Fold Cross-Validation: {model_type}")
     print(f"{'='*60}")
 
     skf = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42)
+    folds = list(skf.split(X, y))
 
-    accuracies = []
-    aucs = []
-
-    for fold, (train_idx, val_idx) in enumerate(skf.split(X, y), 1):
-        print(f"\nFold {fold}/{n_folds}")
+    total_start = time.perf_counter()
+    extraction_seconds = None
 
-        X_train, X_val = X[train_idx], X[val_idx]
-        y_train, y_val = y[train_idx], y[val_idx]
+    if model_type.startswith('hybrid'):
+        parts = model_type.split('_')
+        fe = parts[1]  # cnn or vgg16
+        clf = parts[2]  # xgboost or rf
 
-        if model_type.startswith('hybrid'):
-            parts = model_type.split('_')
-            fe = parts[1]  # cnn or vgg16
-            clf = parts[2]  # xgboost or rf
+        model = HybridClassifier(
+            feature_extractor=fe,
+            classifier=clf,
+            feature_store=feature_store,
+            preprocessing_fingerprint=preprocessing_fingerprint
+        )
 
-            model = HybridClassifier(feature_extractor=fe, classifier=clf)
-            model.train(X_train, y_train)
+        # One extraction pass for all folds
+        print(f"Extracting features once using {fe.upper()}...")
+        start = time.perf_counter()
+        features = model.extract_features(X)
+        extraction_seconds = time.perf_counter() - start
+        print(f"  Extracted {features.shape} in {extraction_seconds:.1f}s")
+
+        # Split the cores between concurrent folds and classifier threads
+        n_parallel = min(n_folds, cpu_count() if n_jobs in (None, -1) else n_jobs)
+        threads_per_fit = max(1, cpu_count() // n_parallel)
+
+        print(f"Fitting {clf.upper()} on {n_folds} folds ({n_parallel} in parallel)...")
+        # Threads: XGBoost/RandomForest release the GIL while fitting, and
+        # worker processes would each have to import TensorFlow via this module
+        fold_results = Parallel(n_jobs=n_parallel, prefer='threads')(
+            delayed(_fit_fold)(
+                model.classifier,
+                features[train_idx], y[train_idx],
+                features[val_idx], y[val_idx],
+                threads_per_fit
+            )
+            for train_idx, val_idx in folds
+        )
+    else:
+        fold_results = []
+        for train_idx, val_idx in folds:
+            X_train, X_val = X[train_idx], X[val_idx]
+            y_train, y_val = y[train_idx], y[val_idx]
 
-            val_pred = model.predict(X_val)
-            val_proba = model.predict_proba(X_val)[:, 1]
-        else:
             model = EndToEndCNN(input_shape=X.shape[1:])
+            start = time.perf_counter()
             model.train(X_train, y_train, X_val, y_val, epochs=30, batch_size=32)
+            fit_seconds = time.perf_counter() - start
 
-            val_pred = (model.predict(X_val) > 0.5).astype(int).flatten()
             val_proba = model.predict(X_val).flatten()
+            val_pred = (val_proba > 0.5).astype(int)
 
-        acc = np.mean(val_pred == y_val)
-        auc = roc_auc_score(y_val, val_proba)
+            fold_results.append({
+                'accuracy': float(np.mean(val_pred == y_val)),
+                'auc': float(roc_auc_score(y_val, val_proba)),
+                'fit_seconds': fit_seconds,
+            })
 
-        accuracies.append(acc)
-        aucs.append(auc)
+    total_seconds = time.perf_counter() - total_start
 
-        print(f"  Accuracy: {acc:.4f}, AUC: {auc:.4f}")
+    for fold, r in enumerate(fold_results, 1):
+        print(f"\nFold {fold}/{n_folds}")
+        print(f"  Accuracy: {r['accuracy']:.4f}, AUC: {r['auc']:.4f} (fit {r['fit_seconds']:.1f}s)")
+
+    accuracies = [r['accuracy'] for r in fold_results]
+    aucs = [r['auc'] for r in fold_results]
+    fit_seconds = [r['fit_seconds'] for r in fold_results]
 
     print(f"\n{'='*40}")
     print(f"Cross-Validation Results:")
     print(f"  Accuracy: {np.mean(accuracies):.4f} (+/- {np.std(accuracies):.4f})")
     print(f"  AUC: {np.mean(aucs):.4f} (+/- {np.std(aucs):.4f})")
+    if extraction_seconds is not None:
+        print(f"  Time: {total_seconds:.1f}s (extraction {extraction_seconds:.1f}s, "
+              f"fits {sum(fit_seconds):.1f}s total)")
+    else:
+        print(f"  Time: {total_seconds:.1f}s")
 
     return {
         'accuracies': accuracies,
@@ -228,7 +529,10 @@ def cross_validate(X, y, n_folds=5, model_type='hybrid_cnn_xgboost'):
         'mean_accuracy': np.mean(accuracies),
         'std_accuracy': np.std(accuracies),
         'mean_auc': np.mean(aucs),
-        'std_auc': np.std(aucs)
+        'std_auc': np.std(aucs),
+        'fold_fit_seconds': fit_seconds,
+        'extraction_seconds': extraction_seconds,
+        'total_seconds': total_seconds
     }
 
 
@@ -296,13 +600,33 @@ def main(args):
     # Initialize preprocessor
     preprocessor = UltrasoundPreprocessor(target_size=(224, 224))
 
+    # Optional on-disk cache of extracted features
+    feature_store = FeatureStore(args.feature_cache, dtype=args.feature_dtype) if args.feature_cache else None
+
+    # Tuned classifier hyperparameters (hyperparam_search.py) per hybrid model
+    classifier_params = {}
+    if args.classifier_params:
+        for name in ('cnn_xgboost', 'vgg16_xgboost'):
+            if args.model in (name, 'all'):
+                params = load_classifier_params(args.classifier_params, model=name)
+                if params is not None:
+                    classifier_params[name] = params
+
+    # Training state checkpoints and the preprocessed dataset cache
+    checkpoint_dir = args.checkpoint_dir or ('../models/checkpoints' if args.resume else None)
+
     # Load dataset
     print("\n[1/5] Loading Dataset...")
-    X, y = load_dataset(
-        args.data_dir,
-        preprocessor,
-        for_vgg=(args.model == 'vgg16_xgboost')
-    )
+    for_vgg = args.model == 'vgg16_xgboost'
+    if checkpoint_dir:
+        X, y = cached_dataset(
+            Path(checkpoint_dir) / 'dataset',
+            args.data_dir,
+            lambda: load_dataset(args.data_dir, preprocessor, for_vgg=for_vgg),
+            fingerprint=preprocessor.fingerprint(for_vgg=for_vgg)
+        )
+    else:
+        X, y = load_dataset(args.data_dir, preprocessor, for_vgg=for_vgg)
 
     # Split dataset
     print("\n[2/5] Splitting Dataset...")
@@ -317,16 +641,65 @@ def main(args):
     print(f"  Validation: {len(X_val)} images")
     print(f"  Test: {len(X_test)} images")
 
+    results = {}
+
+    # Autotune threads / batch size / precision before TensorFlow starts
+    batch_size = args.batch_size
+    if args.autotune:
+        if args.model == 'end_to_end':
+            # Saved with the training state, so --resume keeps the tuned config
+            results['autotune'] = autotune_once(
+                {'model': 'end_to_end', 'input_shape': list(X_train.shape[1:])},
+                state_path=Path(checkpoint_dir) / 'end_to_end_autotune.json' if checkpoint_dir else None,
+                resume=args.resume,
+                batch_size=args.batch_size,
+                batch_sizes=args.autotune_batch_sizes
+            )
+            batch_size = apply_config(results['autotune']['config'])
+        else:
+            print("\n--autotune applies to --model end_to_end (hybrid models train XGBoost; "
+                  "--model all budgets threads per process)")
+
+    # Cross-validation on train + validation (the test set stays held out)
+    if args.cross_validate:
+        X_dev = np.concatenate([X_train, X_val])
+        y_dev = np.concatenate([y_train, y_val])
+
+        cv_types = {
+            'cnn_xgboost': ['hybrid_cnn_xgboost'],
+            'vgg16_xgboost': ['hybrid_vgg16_xgboost'],
+            'end_to_end': ['end_to_end'],
+            'all': ['hybrid_cnn_xgboost', 'hybrid_vgg16_xgboost', 'end_to_end'],
+        }[args.model]
+
+        results['cross_validation'] = {}
+        for cv_type in cv_types:
+            # The VGG extractor needs 3 channels: replicate instead of reloading
+            for_vgg = 'vgg16' in cv_type
+            X_cv = gray_to_rgb(X_dev) if for_vgg and args.model == 'all' else X_dev
+
+            cv = cross_validate(
+                X_cv, y_dev,
+                n_folds=args.cv_folds,
+                model_type=cv_type,
+                feature_store=feature_store,
+                preprocessing_fingerprint=preprocessor.fingerprint(for_vgg=for_vgg)
+            )
+            results['cross_validation'][cv_type] = {
+                k: (float(v) if isinstance(v, np.floating) else v) for k, v in cv.items()
+            }
+
     # Train model
     print("\n[3/5] Training Model...")
 
-    results = {}
-
     if args.model == 'cnn_xgboost':
         model, metrics = train_hybrid_model(
             X_train, y_train, X_val, y_val,
             feature_extractor='cnn',
-            classifier='xgboost'
+            classifier='xgboost',
+            feature_store=feature_store,
+            preprocessing_fingerprint=preprocessor.fingerprint(),
+            classifier_params=classifier_params.get('cnn_xgboost')
         )
         results['cnn_xgboost'] = metrics
 
@@ -334,7 +707,10 @@ def main(args):
         model, metrics = train_hybrid_model(
             X_train, y_train, X_val, y_val,
             feature_extractor='vgg16',
-            classifier='xgboost'
+            classifier='xgboost',
+            feature_store=feature_store,
+            preprocessing_fingerprint=preprocessor.fingerprint(for_vgg=True),
+            classifier_params=classifier_params.get('vgg16_xgboost')
         )
         results['vgg16_xgboost'] = metrics
 
@@ -342,71 +718,84 @@ def main(args):
         model, history, metrics = train_end_to_end_model(
             X_train, y_train, X_val, y_val,
             epochs=args.epochs,
-            batch_size=args.batch_size
+            batch_size=batch_size,
+            augment=args.augment,
+            qat=args.qat,
+            qat_epochs=args.qat_epochs,
+            checkpoint=_make_checkpoint(checkpoint_dir, args.checkpoint_minutes, args.resume)
         )
         results['end_to_end'] = metrics
 
         # Plot training history
         plot_training_history(history, models_dir / 'training_history.png')
 
+        if args.qat:
+            results['int8_comparison'] = compare_int8_variants(
+                model.model, model.qat_model, X_test, y_test,
+                _calibration_data(args.data_dir, X_train.shape[1:]), models_dir / 'tflite'
+            )
+
     elif args.model == 'all':
         # Train all models for comparison
         print("\nTraining all models for comparison...")
 
-        # CNN + XGBoost
-        model_cnn, metrics_cnn = train_hybrid_model(
-            X_train, y_train, X_val, y_val,
-            feature_extractor='cnn',
-            classifier='xgboost'
-        )
-        results['cnn_xgboost'] = metrics_cnn
-        model_cnn.save(str(models_dir / 'cnn_xgboost'))
-
-        # VGG16 + XGBoost (need to reload for 3 channels)
-        X_vgg, y_vgg = load_dataset(args.data_dir, preprocessor, for_vgg=True)
-        X_train_vgg, X_temp_vgg, y_train_vgg, y_temp_vgg = train_test_split(
-            X_vgg, y_vgg, test_size=0.3, stratify=y_vgg, random_state=42
-        )
-        X_val_vgg, X_test_vgg, y_val_vgg, y_test_vgg = train_test_split(
-            X_temp_vgg, y_temp_vgg, test_size=0.5, stratify=y_temp_vgg, random_state=42
+        trained = train_all_models(
+            {
+                'X_train': X_train, 'y_train': y_train,
+                'X_val': X_val, 'y_val': y_val,
+                'X_test': X_test, 'y_test': y_test,
+            },
+            {
+                'models_dir': str(models_dir),
+                'data_dir': args.data_dir,
+                'epochs': args.epochs,
+                'batch_size': args.batch_size,
+                'augment': args.augment,
+                'qat': args.qat,
+                'qat_epochs': args.qat_epochs,
+                'feature_cache': args.feature_cache,
+                'feature_dtype': args.feature_dtype,
+                'fingerprints': {
+                    'cnn_xgboost': preprocessor.fingerprint(),
+                    'vgg16_xgboost': preprocessor.fingerprint(for_vgg=True),
+                },
+                'classifier_params': classifier_params,
+                'checkpoint_dir': checkpoint_dir,
+                'checkpoint_minutes': args.checkpoint_minutes,
+                'resume': args.resume,
+            },
+            max_parallel=args.max_parallel
         )
 
-        model_vgg, metrics_vgg = train_hybrid_model(
-            X_train_vgg, y_train_vgg, X_val_vgg, y_val_vgg,
-            feature_extractor='vgg16',
-            classifier='xgboost'
-        )
-        results['vgg16_xgboost'] = metrics_vgg
-        model_vgg.save(str(models_dir / 'vgg16_xgboost'))
-
-        # End-to-End CNN
-        model_e2e, history_e2e, metrics_e2e = train_end_to_end_model(
-            X_train, y_train, X_val, y_val,
-            epochs=args.epochs,
-            batch_size=args.batch_size
-        )
-        results['end_to_end'] = metrics_e2e
-        model_e2e.model.save(str(models_dir / 'end_to_end_cnn.keras'))
-
-        # Find best model
-        best_model = max(results.items(), key=lambda x: x[1]['val_accuracy'])
+        # Find best model among the comparison models only (results also
+        # holds cross-validation, int8 comparison and resource entries)
+        model_metrics = {name: trained['models'][name]['metrics']
+                         for name in COMPARISON_MODELS if name in trained['models']}
+        best_name = max(model_metrics, key=lambda name: model_metrics[name]['val_accuracy'])
         print(f"\n{'='*60}")
-        print(f"Best Model: {best_model[0]} (Accuracy: {best_model[1]['val_accuracy']:.4f})")
+        print(f"Best Model: {best_name} (Accuracy: {model_metrics[best_name]['val_accuracy']:.4f})")
         print(f"{'='*60}")
 
-        model = model_cnn if best_model[0] == 'cnn_xgboost' else (
-            model_vgg if best_model[0] == 'vgg16_xgboost' else model_e2e
-        )
+        results.update(model_metrics)
+        for output in trained['models'].values():
+            if 'int8_comparison' in output:
+                results['int8_comparison'] = output['int8_comparison']
+        results['resources'] = {name: output['resources'] for name, output in trained['models'].items()}
+        results['wall_clock_seconds'] = trained['wall_clock_seconds']
+
+        model = _load_comparison_model(best_name, models_dir, X_test.shape[1:])
+        if best_name == 'vgg16_xgboost':
+            X_test = gray_to_rgb(X_test)
 
     # Test evaluation
     print("\n[4/5] Evaluating on Test Set...")
 
-    if hasattr(model, 'predict_proba'):
-        test_pred = model.predict(X_test)
-        test_proba = model.predict_proba(X_test)[:, 1]
+    if hasattr(model, 'predict_with_proba'):
+        test_pred, test_proba = model.predict_with_proba(X_test)
+        test_proba = test_proba[:, 1]
     else:
-        test_pred = (model.predict(X_test) > 0.5).astype(int).flatten()
         test_proba = model.predict(X_test).flatten()
+        test_pred = (test_proba > 0.5).astype(int)
 
     test_acc = np.mean(test_pred == y_test)
     test_auc = roc_auc_score(y_test, test_proba)
@@ -452,7 +841,40 @@ if __name__ == "__main__":
     parser.add_argument('--batch_size', type=int, default=32,
                        help='Batch size')
     parser.add_argument('--cross_validate', action='store_true',
-                       help='Perform cross-validation')
+                       help='Perform cross-validation on train + validation before training')
+    parser.add_argument('--cv_folds', type=int, default=5,
+                       help='Number of cross-validation folds')
+    parser.add_argument('--augment', action='store_true',
+                       help='Augment training batches on the fly (for end_to_end)')
+    parser.add_argument('--qat', action='store_true',
+                       help='Quantization-aware fine-tuning and int8 comparison (for end_to_end)')
+    parser.add_argument('--qat_epochs', type=int, default=5,
+                       help='Quantization-aware fine-tuning epochs')
+    parser.add_argument('--feature_cache', type=str, default=None,
+                       help='Directory for cached extracted features (hybrid models)')
+    parser.add_argument('--feature_dtype', type=str, default='float32',
+                       choices=['float32', 'float16'],
+                       help='Storage dtype of cached features')
+    parser.add_argument('--max_parallel', type=int, default=None,
+                       help='Concurrent training processes for --model all (default: one per model, '
+                            'up to the CPU count; 1 = sequential)')
+    parser.add_argument('--checkpoint_dir', type=str, default=None,
+                       help='Directory for periodic training state checkpoints (end_to_end) '
+                            'and the preprocessed dataset cache')
+    parser.add_argument('--checkpoint_minutes', type=float, default=10,
+                       help='Minutes between training state checkpoints')
+    parser.add_argument('--autotune', action='store_true',
+                       help='Measure training throughput across thread pools, batch sizes and '
+                            'bfloat16 first and train with the fastest (for end_to_end)')
+    parser.add_argument('--autotune_batch_sizes', type=int, nargs='+', default=None,
+                       help='Other batch sizes the autotuner may switch to (default: keep '
+                            '--batch_size)')
+    parser.add_argument('--classifier_params', type=str, default=None,
+                       help='JSON file with XGBoost hyperparameters (a hyperparam_search.py '
+                            'result or a plain dict)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Resume from the training state in --checkpoint_dir '
+                            '(default ../models/checkpoints)')
 
     args = parser.parse_args()
     main(args)
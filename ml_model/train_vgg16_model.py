@@ -10,6 +10,7 @@ This script implements:
 
 Usage:
     python train_vgg16_model.py
+    python train_vgg16_model.py --resume   # continue an interrupted run
 
 Output:
     - VGG16-based TFLite model for Flutter app
@@ -27,6 +28,7 @@ import matplotlib.pyplot as plt
 from tqdm import tqdm
 import warnings
 import json
+import argparse
 from datetime import datetime
 warnings.filterwarnings('ignore')
 
@@ -39,6 +41,10 @@ from tensorflow.keras.applications import VGG16
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau, TensorBoard
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'src'))
+from checkpointing import TrainingStateCheckpoint, EpochOrderSequence, cached_dataset, keras_augmentation
+from autotune import autotune_once, apply_config
+
 print("="*70)
 print("RayScan VGG16 Kidney Stone Detection - Advanced Model Training")
 print("Target: 99%+ Accuracy (Based on Research Paper)")
@@ -52,6 +58,7 @@ print("="*70)
 DATASET_PATH = Path(__file__).parent.parent / "Kidney" / "Kidney" / "Dataset"
 OUTPUT_PATH = Path(__file__).parent / "models"
 OUTPUT_PATH.mkdir(exist_ok=True)
+CHECKPOINT_PATH = OUTPUT_PATH / "checkpoints"
 
 # Model parameters - VGG16 requires 224x224 RGB input
 INPUT_SIZE = 224
@@ -212,7 +219,7 @@ def build_vgg16_model():
     x = layers.Dropout(0.4)(x)
     x = layers.Dense(128, activation='relu')(x)
     x = layers.Dropout(0.3)(x)
-    output = layers.Dense(1, activation='sigmoid')(x)
+    output = layers.Dense(1, activation='sigmoid', dtype='float32')(x)
 
     model = Model(inputs=base_model.input, outputs=output)
 
@@ -263,7 +270,7 @@ def create_data_generators():
 # TRAIN MODEL
 # =============================================================================
 
-def train_model(model, X_train, y_train, X_val, y_val):
+def train_model(model, X_train, y_train, X_val, y_val, checkpoint, batch_size=BATCH_SIZE):
     """Train the VGG16 model with advanced techniques"""
     print("\n" + "="*70)
     print("[4/6] TRAINING MODEL")
@@ -306,14 +313,18 @@ def train_model(model, X_train, y_train, X_val, y_val):
     print(f"\n Training Configuration:")
     print(f"  Training samples: {len(X_train)}")
     print(f"  Validation samples: {len(X_val)}")
+    print(f"  Batch size: {batch_size}")
     print(f"  Class weights: Normal={weight_for_0:.2f}, Stone={weight_for_1:.2f}")
 
-    # Train
-    history = model.fit(
-        train_datagen.flow(X_train, y_train, batch_size=BATCH_SIZE),
-        validation_data=(X_val, y_val),
+    # Train (seeded batch order and augmentation, resumable mid-epoch)
+    history = checkpoint.fit(
+        model,
+        EpochOrderSequence(X_train, y_train, batch_size=batch_size, seed=42,
+                           transform=keras_augmentation(train_datagen)),
         epochs=EPOCHS,
+        phase='vgg16',
         callbacks=callbacks,
+        validation_data=(X_val, y_val),
         class_weight=class_weight,
         verbose=1
     )
@@ -324,7 +335,7 @@ def train_model(model, X_train, y_train, X_val, y_val):
 # EVALUATE MODEL
 # =============================================================================
 
-def evaluate_model(model, X_test, y_test):
+def evaluate_model(model, X_test, y_test, autotune_result=None):
     """Comprehensive model evaluation"""
     print("\n" + "="*70)
     print("[5/6] EVALUATING MODEL")
@@ -379,6 +390,8 @@ def evaluate_model(model, X_test, y_test):
         'confusion_matrix': cm.tolist(),
         'test_samples': int(len(y_test))
     }
+    if autotune_result is not None:
+        metrics['autotune'] = autotune_result
 
     # Save metrics to JSON
     metrics_file = OUTPUT_PATH / 'vgg16_metrics.json'
@@ -469,7 +482,7 @@ def plot_training_history(history):
 # MAIN
 # =============================================================================
 
-def main():
+def main(args):
     print(f"\n Starting at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
     # Check dataset
@@ -478,8 +491,9 @@ def main():
         print("Please ensure the Kidney/Kidney/Dataset folder exists")
         sys.exit(1)
 
-    # Load data
-    X, y = load_dataset()
+    # Load data (cached after the first run, so a resumed run skips preprocessing)
+    X, y = cached_dataset(CHECKPOINT_PATH / 'dataset', DATASET_PATH, load_dataset,
+                          fingerprint=f'vgg16-bilateral-clahe3.0-{INPUT_SIZE}')
 
     if len(X) < 100:
         print(f"\n ERROR: Not enough images ({len(X)}). Need at least 100.")
@@ -502,17 +516,29 @@ def main():
     print(f"  Validation: {len(X_val)} images ({len(X_val)/len(X)*100:.1f}%)")
     print(f"  Test:       {len(X_test)} images ({len(X_test)/len(X)*100:.1f}%)")
 
+    # Autotune CPU training throughput (before TensorFlow starts)
+    batch_size, tuning = BATCH_SIZE, None
+    if args.autotune:
+        # Saved with the training state, so --resume keeps the tuned config
+        tuning = autotune_once({'model': 'VGG16', 'input_shape': [INPUT_SIZE, INPUT_SIZE, 3], 'trainable_layers': 4},
+                               state_path=CHECKPOINT_PATH / 'vgg16_autotune.json',
+                               resume=args.resume, batch_size=BATCH_SIZE)
+        batch_size = apply_config(tuning['config'])
+
     # Build model
     model = build_vgg16_model()
 
-    # Train
-    model, history = train_model(model, X_train, y_train, X_val, y_val)
+    # Train (training state saved periodically and on SIGTERM)
+    checkpoint = TrainingStateCheckpoint(CHECKPOINT_PATH / 'vgg16_state.pkl',
+                                         interval_minutes=args.checkpoint_minutes,
+                                         resume=args.resume)
+    model, history = train_model(model, X_train, y_train, X_val, y_val, checkpoint, batch_size)
 
     # Plot training history
     plot_training_history(history)
 
     # Evaluate
-    metrics = evaluate_model(model, X_test, y_test)
+    metrics = evaluate_model(model, X_test, y_test, tuning)
 
     # Export to TFLite
     export_to_tflite(model, metrics)
@@ -541,4 +567,11 @@ def main():
     print("="*70)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Train the VGG16 kidney stone model')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume from the last training state checkpoint')
+    parser.add_argument('--checkpoint_minutes', type=float, default=10,
+                        help='Minutes between training state checkpoints')
+    parser.add_argument('--autotune', action='store_true',
+                        help='Pick the fastest CPU threads / batch size / bfloat16 setting first')
+    main(parser.parse_args())
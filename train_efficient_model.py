@@ -4,6 +4,9 @@ Uses ImageDataGenerator to avoid loading all images into memory
 """
 
 import os
+import sys
+import argparse
+from pathlib import Path
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.applications import EfficientNetB0
@@ -14,12 +17,35 @@ from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLRO
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 import cv2
 
+# Resumable training state from ml_model/src
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'ml_model' / 'src'))
+from checkpointing import TrainingStateCheckpoint, EpochOrderSequence, keras_augmentation
+from autotune import autotune_once, apply_config
+
+parser = argparse.ArgumentParser(description='Memory-efficient hybrid model training')
+parser.add_argument('--resume', action='store_true',
+                    help='Resume from the last training state checkpoint')
+parser.add_argument('--checkpoint_minutes', type=float, default=10,
+                    help='Minutes between training state checkpoints')
+parser.add_argument('--autotune', action='store_true',
+                    help='Pick the fastest CPU threads / batch size / bfloat16 setting first')
+args = parser.parse_args()
+
 # Configuration
 IMG_SIZE = 224
 BATCH_SIZE = 16  # Smaller batch size for memory efficiency
 EPOCHS_PHASE1 = 50
 EPOCHS_PHASE2 = 20
 DATASET_DIR = r'c:\Users\Admin\Downloads\flutter_application_1\ds'
+CHECKPOINT_DIR = 'checkpoints'
+
+# Autotune CPU training throughput before any TensorFlow op runs. The
+# result is kept with the training state, so --resume reuses it
+if args.autotune:
+    tuning = autotune_once({'model': 'EfficientNetB0', 'input_shape': [IMG_SIZE, IMG_SIZE, 3], 'trainable_layers': 0},
+                           state_path=os.path.join(CHECKPOINT_DIR, 'efficient_autotune.json'),
+                           resume=args.resume, batch_size=BATCH_SIZE)
+    BATCH_SIZE = apply_config(tuning['config'])
 
 print("=" * 60)
 print("MEMORY-EFFICIENT HYBRID MODEL TRAINING")
@@ -111,6 +137,34 @@ print(f"  Validation samples: {val_generator.samples}")
 print(f"  Classes: {train_generator.class_indices}")
 
 
+def load_images(paths):
+    """Load a batch of image files as flow_from_directory does (RGB, nearest resize)."""
+    return np.stack([
+        tf.keras.utils.img_to_array(tf.keras.utils.load_img(path, target_size=(IMG_SIZE, IMG_SIZE)))
+        for path in paths
+    ])
+
+
+# Training batches in a seeded, resumable order (same files and augmentation
+# as train_generator, still loaded from disk batch by batch)
+train_sequence = EpochOrderSequence(
+    np.array(train_generator.filepaths),
+    train_generator.classes.astype('float32'),
+    batch_size=BATCH_SIZE,
+    seed=42,
+    load=load_images,
+    transform=keras_augmentation(train_datagen)
+)
+
+# Training state is saved periodically and on SIGTERM; --resume skips
+# completed phases and continues the interrupted one
+training_state = TrainingStateCheckpoint(
+    os.path.join(CHECKPOINT_DIR, 'efficient_state.pkl'),
+    interval_minutes=args.checkpoint_minutes,
+    resume=args.resume
+)
+
+
 def build_hybrid_model():
     """Build EfficientNet-B0 based model"""
     print("\n" + "=" * 60)
@@ -133,7 +187,7 @@ def build_hybrid_model():
     x = Dropout(0.3)(x)
     x = Dense(256, activation='relu', name='fc1')(x)
     x = Dropout(0.3)(x)
-    predictions = Dense(1, activation='sigmoid', name='output')(x)
+    predictions = Dense(1, activation='sigmoid', name='output', dtype='float32')(x)
 
     model = Model(inputs=base_model.input, outputs=predictions)
 
@@ -187,11 +241,13 @@ print("Base model: FROZEN")
 print("=" * 60)
 
 # Phase 1: Train with frozen base
-history1 = model.fit(
-    train_generator,
-    validation_data=val_generator,
+history1 = training_state.fit(
+    model,
+    train_sequence,
     epochs=EPOCHS_PHASE1,
+    phase='frozen',
     callbacks=[checkpoint, early_stop, reduce_lr],
+    validation_data=val_generator,
     verbose=1
 )
 
@@ -215,11 +271,13 @@ print("Base model: UNFROZEN")
 print("=" * 60)
 
 # Phase 2: Fine-tune
-history2 = model.fit(
-    train_generator,
-    validation_data=val_generator,
+history2 = training_state.fit(
+    model,
+    train_sequence,
     epochs=EPOCHS_PHASE2,
+    phase='fine_tune',
     callbacks=[checkpoint, reduce_lr],
+    validation_data=val_generator,
     verbose=1
 )
 
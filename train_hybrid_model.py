@@ -13,6 +13,9 @@ Target Accuracy: 99%+
 """
 
 import os
+import sys
+import argparse
+from pathlib import Path
 import cv2
 import numpy as np
 import tensorflow as tf
@@ -27,6 +30,11 @@ import matplotlib.pyplot as plt
 from tqdm import tqdm
 import pickle
 
+# Resumable training state from ml_model/src
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'ml_model' / 'src'))
+from checkpointing import TrainingStateCheckpoint, EpochOrderSequence, cached_dataset
+from autotune import autotune_once, apply_config
+
 # Configuration
 IMG_SIZE = 224
 BATCH_SIZE = 32
@@ -39,6 +47,7 @@ STONE_DIR = os.path.join(DATA_DIR, "stone")
 
 OUTPUT_DIR = r"c:\Users\Admin\Downloads\flutter_application_1\ml_model\outputs"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+CHECKPOINT_DIR = os.path.join(OUTPUT_DIR, "checkpoints")
 
 
 def preprocess_image_research_paper(image_path):
@@ -150,7 +159,7 @@ def build_hybrid_model():
     x = Dropout(0.3, name='dropout_1')(x)
     x = Dense(256, activation='relu', name='dense_1')(x)
     x = Dropout(0.3, name='dropout_2')(x)
-    predictions = Dense(1, activation='sigmoid', name='output')(x)
+    predictions = Dense(1, activation='sigmoid', name='output', dtype='float32')(x)
 
     # Create final model
     model = Model(inputs=base_model.input, outputs=predictions)
@@ -172,14 +181,14 @@ def build_hybrid_model():
     return model
 
 
-def train_model(model, X_train, y_train, X_val, y_val):
+def train_model(model, X_train, y_train, X_val, y_val, checkpoint, batch_size=BATCH_SIZE):
     """Train the model"""
     print("\n" + "=" * 60)
     print("TRAINING MODEL")
     print("=" * 60)
 
     # Callbacks
-    checkpoint = ModelCheckpoint(
+    best_checkpoint = ModelCheckpoint(
         os.path.join(OUTPUT_DIR, 'best_model.h5'),
         monitor='val_accuracy',
         save_best_only=True,
@@ -203,19 +212,20 @@ def train_model(model, X_train, y_train, X_val, y_val):
     )
 
     # Train
-    history = model.fit(
-        X_train, y_train,
-        batch_size=BATCH_SIZE,
+    history = checkpoint.fit(
+        model,
+        EpochOrderSequence(X_train, y_train, batch_size=batch_size, seed=42),
         epochs=EPOCHS,
+        phase='frozen',
+        callbacks=[best_checkpoint, early_stop, reduce_lr],
         validation_data=(X_val, y_val),
-        callbacks=[checkpoint, early_stop, reduce_lr],
         verbose=1
     )
 
     return history
 
 
-def fine_tune_model(model, X_train, y_train, X_val, y_val):
+def fine_tune_model(model, X_train, y_train, X_val, y_val, checkpoint, batch_size=BATCH_SIZE):
     """Fine-tune the model by unfreezing base layers"""
     print("\n" + "=" * 60)
     print("FINE-TUNING MODEL")
@@ -238,7 +248,7 @@ def fine_tune_model(model, X_train, y_train, X_val, y_val):
     print(f"Trainable parameters: {sum([np.prod(v.shape) for v in model.trainable_weights]):,}")
 
     # Train with fine-tuning
-    checkpoint = ModelCheckpoint(
+    best_checkpoint = ModelCheckpoint(
         os.path.join(OUTPUT_DIR, 'best_model_finetuned.h5'),
         monitor='val_accuracy',
         save_best_only=True,
@@ -253,12 +263,13 @@ def fine_tune_model(model, X_train, y_train, X_val, y_val):
         verbose=1
     )
 
-    history = model.fit(
-        X_train, y_train,
-        batch_size=BATCH_SIZE,
+    history = checkpoint.fit(
+        model,
+        EpochOrderSequence(X_train, y_train, batch_size=batch_size, seed=43),
         epochs=20,  # Fewer epochs for fine-tuning
+        phase='fine_tune',
+        callbacks=[best_checkpoint, early_stop],
         validation_data=(X_val, y_val),
-        callbacks=[checkpoint, early_stop],
         verbose=1
     )
 
@@ -334,7 +345,7 @@ def convert_to_tflite(model):
     return tflite_path
 
 
-def main():
+def main(args):
     print("\n" + "=" * 60)
     print("HYBRID KIDNEY STONE DETECTION MODEL TRAINING")
     print("=" * 60)
@@ -344,8 +355,9 @@ def main():
     print("  3. Ensemble: Inspired by Paper 1")
     print("  4. Deployment: TFLite for mobile")
 
-    # Load dataset
-    X, y = load_dataset()
+    # Load dataset (cached, so a resumed run skips preprocessing)
+    X, y = cached_dataset(os.path.join(CHECKPOINT_DIR, 'dataset'), DATA_DIR, load_dataset,
+                          fingerprint=f'efficientnet-bilateral-clahe2.0-{IMG_SIZE}')
 
     # Split dataset
     print("\n" + "=" * 60)
@@ -362,16 +374,31 @@ def main():
     print(f"Validation set: {len(X_val)} images")
     print(f"Test set:       {len(X_test)} images")
 
+    # Autotune CPU training throughput (before TensorFlow starts)
+    batch_size, tuning = BATCH_SIZE, None
+    if args.autotune:
+        # Saved with the training state, so --resume keeps the tuned config
+        tuning = autotune_once({'model': 'EfficientNetB0', 'input_shape': [IMG_SIZE, IMG_SIZE, 3], 'trainable_layers': 0},
+                               state_path=os.path.join(CHECKPOINT_DIR, 'hybrid_autotune.json'),
+                               resume=args.resume, batch_size=BATCH_SIZE)
+        batch_size = apply_config(tuning['config'])
+
     # Build model
     model = build_hybrid_model()
 
+    # Training state is saved periodically and on SIGTERM; --resume
+    # skips completed phases and continues the interrupted one
+    checkpoint = TrainingStateCheckpoint(os.path.join(CHECKPOINT_DIR, 'hybrid_state.pkl'),
+                                         interval_minutes=args.checkpoint_minutes,
+                                         resume=args.resume)
+
     # Train initial model (frozen base)
     print("\n🔥 PHASE 1: Initial Training (Base Frozen)")
-    history1 = train_model(model, X_train, y_train, X_val, y_val)
+    history1 = train_model(model, X_train, y_train, X_val, y_val, checkpoint, batch_size)
 
     # Fine-tune model (unfrozen base)
     print("\n🔥 PHASE 2: Fine-Tuning (Base Unfrozen)")
-    history2 = fine_tune_model(model, X_train, y_train, X_val, y_val)
+    history2 = fine_tune_model(model, X_train, y_train, X_val, y_val, checkpoint, batch_size)
 
     # Evaluate
     accuracy, precision, recall, f1, auc = evaluate_model(model, X_test, y_test)
@@ -387,6 +414,8 @@ def main():
         'f1_score': f1,
         'auc_roc': auc
     }
+    if tuning is not None:
+        results['autotune'] = tuning
 
     with open(os.path.join(OUTPUT_DIR, 'results.pkl'), 'wb') as f:
         pickle.dump(results, f)
@@ -404,4 +433,11 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Train the hybrid EfficientNet-B0 kidney stone model')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume from the last training state checkpoint')
+    parser.add_argument('--checkpoint_minutes', type=float, default=10,
+                        help='Minutes between training state checkpoints')
+    parser.add_argument('--autotune', action='store_true',
+                        help='Pick the fastest CPU threads / batch size / bfloat16 setting first')
+    main(parser.parse_args())